@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Measure the startup cost of the stash client: the time to import the library modules, and to run a
+CLI command that sends no requests, each in a fresh interpreter, compared with a bare interpreter.
+
+Fails (exit status 1) if any of the heavyweight modules that should only load on demand were imported,
+or if a median time over the bare interpreter exceeds --max-ms.
+
+    python benchmarks/import_time.py [--runs 20] [--max-ms 150]
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that no request-free code path should load
+LAZY_MODULES = ("requests", "multiprocessing", "BaseHTTPServer", "urllib2", "stashifier.models")
+
+_REPORT_MODULES = "sys.stderr.write(repr(sorted(sys.modules)))"
+
+CASES = [
+    ("bare interpreter", "import sys; " + _REPORT_MODULES, []),
+    ("import library",
+     "import sys, stashifier.rest, stashifier.local_git; " + _REPORT_MODULES, []),
+    # a dry run with no operation exits without sending any requests
+    ("cli no-op dry run",
+     "import sys, atexit; atexit.register(lambda: %s); import stashifier.cli; stashifier.cli.main()"
+     % _REPORT_MODULES,
+     ["-n", "-H", "stash.invalid"]),
+]
+
+
+def _run(code, argv, env):
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-c", code] + argv, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, env=env, cwd=PACKAGE_ROOT)
+    _, err = proc.communicate()
+    return time.time() - start, err
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if any case costs more than this many milliseconds over a bare "
+                        "interpreter")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, PYTHONPATH=PACKAGE_ROOT)
+    env.setdefault("USER", "benchmark")
+    failed = False
+    try:
+        baseline = None
+        for name, code, argv in CASES:
+            timings = []
+            loaded = []
+            for _ in range(args.runs):
+                elapsed, err = _run(code, argv, env)
+                timings.append(elapsed)
+            report = err.strip().splitlines()[-1] if err.strip() else ""
+            if not report.startswith("["):
+                print "%s failed: %s" % (name, err.strip())
+                failed = True
+                continue
+            modules = eval(report)  # pylint: disable=W0123
+            loaded = [lazy for lazy in LAZY_MODULES
+                      if any(mod == lazy or mod.startswith(lazy + ".") for mod in modules)]
+            median_ms = sorted(timings)[len(timings) // 2] * 1000
+            if baseline is None:
+                baseline = median_ms
+            overhead = median_ms - baseline
+            print "%-20s median %7.1f ms  (+%6.1f ms)" % (name, median_ms, overhead)
+            if loaded:
+                print "    unexpectedly imported: %s" % ", ".join(loaded)
+                failed = True
+            if args.max_ms is not None and overhead > args.max_ms:
+                print "    over the %.1f ms budget" % args.max_ms
+                failed = True
+    finally:
+        shutil.rmtree(home)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Measure the memory a full pull request listing costs: list --pull-requests synthetic pull requests (see
+synthetic.py) through the client and an in-memory transport, and report the bytes retained per pull
+request, broken down by entity type (with the raw JSON the entities keep counted separately), and the
+peak memory used while listing.
+
+Sizes come from walking the listing's object graph with sys.getsizeof, counting each object once, for the
+first entity that reaches it.  The peak comes from tracemalloc where it is available (python 3, or
+pytracemalloc), and otherwise from the growth of the process's maximum resident set size, which is
+coarser.
+
+Fails (exit status 1) if the bytes retained per pull request exceed --max-bytes-per-pr, or the peak
+exceeds --max-peak-mb.
+
+    python benchmarks/memory_entities.py [--pull-requests 10000] [--fields id,title]
+                                         [--max-bytes-per-pr 48000] [--max-peak-mb N]
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import gc
+import os
+import sys
+import types
+from argparse import ArgumentParser
+from collections import Counter
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_ROOT)
+
+# pylint: disable=C0413
+import synthetic
+from stashifier.models import StashEntity
+from stashifier.output import parse_fields
+from stashifier.rest import StashRestClient
+from stashifier.transport import MemoryTransport
+
+_PROJECT = "BENCH"
+_RAW = "(raw JSON)"
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def sizes_by_type(root):
+    """
+    Total the sizes of everything reachable from root, by the class of the entity that owns it: each
+    entity's own instance and attributes count for its class, and whatever is reached through its raw
+    response data counts as raw JSON.  Projected records count as such.  Objects reached before any entity
+    count under their own type.
+    """
+    totals = Counter()
+    seen = set()
+    pending = [(root, None)]
+    while pending:
+        obj, owner = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, StashEntity):
+            owner = type(obj).__name__
+            totals[owner] += sys.getsizeof(obj) + sys.getsizeof(vars(obj))
+            seen.add(id(vars(obj)))
+            pending.extend((value, owner) for name, value in vars(obj).items() if name != '_response_data')
+            # pushed last, so that the raw data is walked first, and attributes that merely share its values
+            # (e.g. a page's values, or a title string) are not charged for them
+            if '_response_data' in vars(obj):
+                pending.append((obj._response_data, _RAW))  # pylint: disable=W0212
+            continue
+        if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+            # a projected record (see models.Projection)
+            owner = type(obj).__name__
+        totals[owner or type(obj).__name__] += sys.getsizeof(obj)
+        pending.extend((referent, owner) for referent in gc.get_referents(obj))
+    return totals
+
+
+class PeakMemory(object):
+    "The peak memory allocated between start and stop, from tracemalloc if possible."
+    def __init__(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+        self._tracemalloc = tracemalloc
+        self.method = "tracemalloc" if tracemalloc else "max RSS growth"
+        self._started_rss = None
+
+    @staticmethod
+    def _max_rss():
+        import resource
+        # kilobytes on Linux, bytes on OS X
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def start(self):
+        if self._tracemalloc:
+            self._tracemalloc.start()
+        else:
+            self._started_rss = self._max_rss()
+
+    def stop(self):
+        "Stop measuring, and return the peak in bytes."
+        if self._tracemalloc:
+            peak = self._tracemalloc.get_traced_memory()[1]
+            self._tracemalloc.stop()
+            return peak
+        return self._max_rss() - self._started_rss
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pull-requests", type=int, default=10000)
+    parser.add_argument("--reviewers", type=int, default=2, help="Reviewers per pull request (default 2)")
+    parser.add_argument("--fields", help="List records of just these comma-separated (dotted) fields")
+    # about a fifth over what a listing of synthetic pull requests retains on 64-bit python 2.7
+    parser.add_argument("--max-bytes-per-pr", type=float, default=48000,
+                        help="Fail if the listing retains more than this many bytes per pull request "
+                        "(default 48000)")
+    parser.add_argument("--max-peak-mb", type=float, default=None,
+                        help="Fail if the peak memory while listing exceeds this many megabytes")
+    args = parser.parse_args()
+
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/%s/repos/repo-0/pull-requests" % _PROJECT,
+                            [synthetic.pull_request_data(_PROJECT, 0, index, args.reviewers)
+                             for index in range(args.pull_requests)])
+    client = StashRestClient(synthetic.HOST, "bench", "bench", transport=transport)
+    gc.collect()
+    peak = PeakMemory()
+    peak.start()
+    listing = client.list_pull_requests(project=_PROJECT, repository="repo-0",
+                                        fields=parse_fields(args.fields))
+    peak_bytes = peak.stop()
+
+    count = max(len(listing.entities), 1)
+    totals = sizes_by_type(listing)
+    retained = sum(totals.values())
+    print "%d pull requests in %d pages: %.0f bytes retained per pull request, %.1f MB in all" % (
+        len(listing.entities), listing.page_count, float(retained) / count, retained / 1048576.0)
+    for name, size in totals.most_common():
+        if size < count:
+            break
+        print "    %-20s %9.0f bytes per pull request (%4.1f%%)" % (name, float(size) / count,
+                                                                    100.0 * size / retained)
+    print "peak while listing: %.1f MB (%s)" % (peak_bytes / 1048576.0, peak.method)
+
+    failed = False
+    if args.max_bytes_per_pr is not None and float(retained) / count > args.max_bytes_per_pr:
+        print "    over the budget of %.0f bytes per pull request" % args.max_bytes_per_pr
+        failed = True
+    if args.max_peak_mb is not None and peak_bytes / 1048576.0 > args.max_peak_mb:
+        print "    over the peak budget of %.1f MB" % args.max_peak_mb
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
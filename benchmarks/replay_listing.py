@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Measure the client's cost of paging through listings, from fetching each page to building its entities,
+by replaying a cassette (see stashifier/cassette.py) instead of talking to a server.
+
+Every listing in the cassette (every GET of a first page) is fetched in full with get_paged, building
+repositories or pull requests for listings of those (or with --fields, just records of those fields).
+Without --cassette, a synthetic cassette is recorded first: a project with --repos repositories, and
+--pull-requests open pull requests in one of them.  To benchmark real traffic, record a command with
+stash_client --record FILE and pass the FILE here.
+
+Fails (exit status 1) if the median run takes longer than --max-ms.
+
+    python benchmarks/replay_listing.py [--cassette FILE] [--runs 5] [--latency 0] [--fields name]
+                                        [--max-ms 2000]
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_ROOT)
+
+# pylint: disable=C0413
+import synthetic
+from stashifier.cassette import RecordingTransport, ReplayTransport
+from stashifier.models import StashRepo, StashPullRequest
+from stashifier.output import parse_fields
+from stashifier.rest import StashRestClient
+from stashifier.transport import MemoryTransport
+
+_PROJECT = "BENCH"
+
+
+def record_synthetic(path, repos, pull_requests):
+    "Record a cassette of a repository listing and a pull request listing, from synthetic data."
+    memory = MemoryTransport()
+    memory.route_listing(r"projects/%s/repos" % _PROJECT,
+                         [synthetic.repository_data(_PROJECT, index) for index in range(repos)])
+    memory.route_listing(r"projects/%s/repos/repo-0/pull-requests" % _PROJECT,
+                         [synthetic.pull_request_data(_PROJECT, 0, index) for index in range(pull_requests)])
+    recorder = RecordingTransport(memory, path)
+    client = StashRestClient(synthetic.HOST, "bench", "bench", transport=recorder)
+    client.list_repositories(project=_PROJECT)
+    client.list_pull_requests(project=_PROJECT, repository="repo-0")
+    recorder.close()
+
+
+def listings(path):
+    "The (api_path, query parameters, entity class) of every listing in a cassette."
+    found = []
+    with open(path) as cassette:
+        for line in cassette:
+            exchange = json.loads(line)
+            if (exchange['method'] != 'get' or 'start' in exchange['params'] or
+                    '"isLastPage"' not in exchange['text']):
+                continue
+            api_path = exchange['path'].split('/rest/api/', 1)[-1].split('/')[1:]
+            entity_class = None
+            if api_path[-1] == 'repos':
+                entity_class = StashRepo
+            elif api_path[-1] == 'pull-requests':
+                entity_class = StashPullRequest
+            found.append((api_path, exchange['params'], entity_class))
+    return found
+
+
+def run_listings(client, to_fetch, fields=None):
+    "Fetch every listing (as records of just the given fields, if any), and return the number of values."
+    count = 0
+    for api_path, params, entity_class in to_fetch:
+        params = dict(params)
+        limit = int(params.pop('limit', 0))
+        response = client.get_paged(api_path=api_path, query_params=params or None, entity_class=entity_class,
+                                    limit=limit, fields=fields)
+        count += len(response.values)
+    return count
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cassette", help="Replay this cassette, instead of a synthetic one")
+    parser.add_argument("--repos", type=int, default=500)
+    parser.add_argument("--pull-requests", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Scale the recorded response times by this (default 0: no waiting)")
+    parser.add_argument("--fields", help="Comma-separated (dotted) fields to project the listings to")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if the median run takes longer than this many milliseconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = args.cassette
+        if path is None:
+            path = os.path.join(workdir, "synthetic.cassette")
+            record_synthetic(path, args.repos, args.pull_requests)
+        to_fetch = listings(path)
+        if not to_fetch:
+            print "No listings in %s" % path
+            return 1
+        timings = []
+        for _ in range(args.runs):
+            client = StashRestClient(synthetic.HOST, "bench", "bench",
+                                     transport=ReplayTransport(path, args.latency))
+            started = time.time()
+            count = run_listings(client, to_fetch, parse_fields(args.fields))
+            timings.append(time.time() - started)
+    finally:
+        shutil.rmtree(workdir)
+    median_ms = sorted(timings)[len(timings) // 2] * 1000
+    print "%d listings, %d values: median %.1f ms (%.1f us per value)" % (
+        len(to_fetch), count, median_ms, median_ms * 1000 / max(count, 1))
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print "    over the %.1f ms budget" % args.max_ms
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Synthetic Stash data for the benchmarks: repositories and pull requests shaped like the JSON that Stash
+returns for them (as far as the client reads it, and then some), and Stash-style pages of them.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+HOST = "stash.example.com"
+_EPOCH_MS = 1420070400000
+
+
+def user_data(index):
+    name = "user%d" % index
+    return {'name': name, 'emailAddress': "%s@example.com" % name, 'id': index,
+            'displayName': "User Number %d" % index, 'active': True, 'slug': name, 'type': "NORMAL",
+            'links': {'self': [{'href': "https://%s/users/%s" % (HOST, name)}]}}
+
+
+def project_data(key):
+    return {'key': key, 'id': abs(hash(key)) % 10000, 'name': "Project %s" % key,
+            'description': "The %s project" % key, 'public': False, 'type': "NORMAL",
+            'links': {'self': [{'href': "https://%s/projects/%s" % (HOST, key)}]}}
+
+
+def repository_data(project, index):
+    slug = "repo-%d" % index
+    return {'slug': slug, 'id': index, 'name': slug, 'scmId': "git", 'state': "AVAILABLE",
+            'statusMessage': "Available", 'forkable': True, 'public': False, 'project': project_data(project),
+            'links': {'clone': [{'href': "ssh://git@%s:7999/%s/%s.git" % (HOST, project.lower(), slug),
+                                 'name': "ssh"},
+                                {'href': "https://%s/scm/%s/%s.git" % (HOST, project.lower(), slug),
+                                 'name': "http"}],
+                      'self': [{'href': "https://%s/projects/%s/repos/%s/browse" % (HOST, project, slug)}]}}
+
+
+def _ref_data(branch, repository, index):
+    return {'id': "refs/heads/%s" % branch, 'displayId': branch,
+            'latestChangeSet': "%040x" % (index * 7919), 'repository': repository}
+
+
+def pull_request_data(project, repository_index, index, reviewers=2):
+    "A pull request in a repository, from a branch of its own, with some reviewers (one approving)."
+    repository = repository_data(project, repository_index)
+    return {'id': index, 'version': 3, 'title': "Change number %d" % index,
+            'description': "A description of change %d, running to a line or two of text." % index,
+            'state': "OPEN", 'open': True, 'closed': False,
+            'createdDate': _EPOCH_MS + index * 60000, 'updatedDate': _EPOCH_MS + index * 90000,
+            'fromRef': _ref_data("feature-%d" % index, repository, index),
+            'toRef': _ref_data("master", repository, 0),
+            'locked': False, 'author': {'user': user_data(index % 50), 'role': "AUTHOR", 'approved': False},
+            'reviewers': [{'user': user_data((index + offset) % 50), 'role': "REVIEWER",
+                           'approved': offset == 1} for offset in range(1, reviewers + 1)],
+            'participants': [],
+            'links': {'self': [{'href': "https://%s/projects/%s/repos/%s/pull-requests/%d" % (
+                HOST, project, repository['slug'], index)}]}}
+
+
+def pages(values, page_size=25):
+    "Page a list of values as Stash would, one dict per page."
+    result = []
+    for start in range(0, max(len(values), 1), page_size):
+        page = {'values': values[start:start + page_size], 'start': start, 'limit': page_size,
+                'isLastPage': start + page_size >= len(values)}
+        page['size'] = len(page['values'])
+        if not page['isLastPage']:
+            page['nextPageStart'] = start + page_size
+        result.append(page)
+    return result
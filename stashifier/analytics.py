@@ -0,0 +1,169 @@
+"""
+Review-load and pull request latency statistics, computed over (potentially very large) lists of
+StashPullRequest objects.
+
+The pull requests are flattened once into parallel columns (plain lists and typed arrays), and every
+statistic is then computed from those columns; the columns and the derived statistics are cached on the
+PullRequestAnalytics object, so producing several reports from the same data in one process costs a single
+pass.  Nothing is kept between processes: each --report run lists the pull requests afresh, and
+flattening them is a small part of the cost of that listing.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import time
+from array import array
+from collections import Counter
+
+DEFAULT_PERCENTILES = (50, 75, 90, 99)
+
+
+def percentiles(sorted_values, wanted=DEFAULT_PERCENTILES):
+    """
+    Nearest-rank percentiles of an already-sorted sequence, as a {percentile: value} dictionary
+    (empty if there are no values).
+    """
+    count = len(sorted_values)
+    if not count:
+        return {}
+    result = {}
+    for pct in wanted:
+        rank = max(1, int(-(-pct * count // 100)))  # ceiling division, without floats
+        result[pct] = sorted_values[min(rank, count) - 1]
+    return result
+
+
+class PullRequestColumns(object):
+    """
+    Column-oriented view of a list of pull requests: one entry per pull request in each column.
+    Dates are stored as seconds since the epoch.
+    """
+    def __init__(self, pull_requests):
+        self.states = []
+        self.authors = []
+        self.reviewers = []
+        self.approvers = []
+        self.created = array('d')
+        self.updated = array('d')
+        for pull_req in pull_requests:
+            self.states.append(pull_req.state)
+            self.authors.append(pull_req.author.name)
+            self.reviewers.append(tuple(who.name for who in pull_req.reviewers))
+            self.approvers.append(tuple(who.name for who in pull_req.approved_by))
+            # the raw values are milliseconds since the epoch; skip the round trip through datetime
+            self.created.append(pull_req._get("createdDate") / 1000.0)
+            self.updated.append(pull_req._get("updatedDate") / 1000.0)
+        self.count = len(self.states)
+
+
+class PullRequestAnalytics(object):
+    """
+    Statistics over a set of pull requests.  Each statistic is computed on first use and cached, as are the
+    underlying columns, so it is cheap to ask for the same (or another) statistic again.
+    """
+    def __init__(self, pull_requests, now=None):
+        self._pull_requests = pull_requests
+        self._now = now if now is not None else time.time()
+        self._columns = None
+        self._cache = {}
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = PullRequestColumns(self._pull_requests)
+            # the entity objects are no longer needed once they have been flattened
+            self._pull_requests = None
+        return self._columns
+
+    def _cached(self, name, compute):
+        if name not in self._cache:
+            self._cache[name] = compute()
+        return self._cache[name]
+
+    def _open_indexes(self):
+        return self._cached('open_indexes', lambda: [
+            idx for idx, state in enumerate(self.columns.states) if state == "OPEN"])
+
+    def reviewer_queue_depth(self):
+        """
+        For each reviewer, the number of open pull requests on which they are a reviewer but have not
+        (yet) approved.
+        """
+        def compute():
+            cols = self.columns
+            depth = Counter()
+            for idx in self._open_indexes():
+                approvers = cols.approvers[idx]
+                depth.update(name for name in cols.reviewers[idx] if name not in approvers)
+            return depth
+        return self._cached('reviewer_queue_depth', compute)
+
+    def approvals_per_author(self):
+        "For each pull request author, the total number of approvals their pull requests have received."
+        def compute():
+            approvals = Counter()
+            for author, approvers in zip(self.columns.authors, self.columns.approvers):
+                approvals[author] += len(approvers)
+            return approvals
+        return self._cached('approvals_per_author', compute)
+
+    def open_ages(self):
+        "Sorted ages, in seconds, of the open pull requests."
+        return self._cached('open_ages', lambda: sorted(
+            self._now - self.columns.created[idx] for idx in self._open_indexes()))
+
+    def approval_latencies(self):
+        """
+        Sorted time, in seconds, from creation to last update of every approved pull request.
+
+        Stash does not report when an approval was given, so this is an upper bound on the time to
+        first approval: it is exact only when the approval was the last change to the pull request.
+        """
+        def compute():
+            cols = self.columns
+            return sorted(cols.updated[idx] - cols.created[idx]
+                          for idx in xrange(cols.count) if cols.approvers[idx])
+        return self._cached('approval_latencies', compute)
+
+    def open_age_percentiles(self, wanted=DEFAULT_PERCENTILES):
+        return percentiles(self.open_ages(), wanted)
+
+    def approval_latency_percentiles(self, wanted=DEFAULT_PERCENTILES):
+        return percentiles(self.approval_latencies(), wanted)
+
+
+def _format_duration(seconds):
+    hours = seconds / 3600.0
+    if hours < 48:
+        return "%.1fh" % hours
+    return "%.1fd" % (hours / 24)
+
+
+def format_report(analytics, top=10):
+    """
+    Render the standard review-load report as a list of lines.
+    """
+    lines = ["Pull requests: %d total, %d open" % (analytics.columns.count, len(analytics.open_ages()))]
+    for title, pcts in [("Open pull request age", analytics.open_age_percentiles()),
+                        ("Creation to last update (approved)", analytics.approval_latency_percentiles())]:
+        if pcts:
+            lines.append("%s: %s" % (title, ", ".join(
+                "p%d %s" % (pct, _format_duration(pcts[pct])) for pct in sorted(pcts))))
+    lines.append("Review queue depth (open, unapproved):")
+    for name, depth in analytics.reviewer_queue_depth().most_common(top):
+        lines.append("    %s: %d" % (name, depth))
+    lines.append("Approvals received per author:")
+    for name, approvals in analytics.approvals_per_author().most_common(top):
+        lines.append("    %s: %d" % (name, approvals))
+    return lines
@@ -0,0 +1,221 @@
+"""
+Batch mode: execute a stream of operations, one JSON object per line, on a single client (and so with
+one set of credentials and a shared connection pool), writing one JSON result per line.
+
+An operation names the client method to call and its arguments, e.g.
+
+    {"op": "list_repositories", "project": "PRJ"}
+    {"op": "create_pull_request", "project": "PRJ", "repository": "thing", "source_branch": "feature/x",
+     "reviewers": ["someone"], "id": "pr-1"}
+
+and produces a result such as
+
+    {"id": "pr-1", "op": "create_pull_request", "ok": true, "result": {...}}
+    {"id": "pr-2", "op": "create_pull_request", "ok": false, "error": "...", "status": 409, "messages": [...]}
+
+The optional "id" is echoed back, so that callers can match results to operations.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import logging
+
+from .breaker import CircuitOpenError
+from .models import StashPullRequest
+from .rest import UserError, ResponseError, DeadlineExceeded, _USER_NAMESPACE, _GROUP_NAMESPACE
+
+_POSTABLE_PR_ARGS = ("source_branch", "destination_branch", "title", "reviewers", "description", "fork_owner")
+_STRING_ARGS = ("user", "project", "repository", "state", "since", "until", "path", "commit", "filter",
+                "name", "permission", "source_branch", "destination_branch", "title", "description",
+                "fork_owner")
+_INTEGER_ARGS = ("limit", "max_count", "pull_request")
+
+
+def _check_arguments(operation):
+    """
+    Raise UserError if any of the operation's arguments has the wrong JSON type, before it can reach the
+    client (where, say, a string max_count would compare as greater than any number, and cap nothing).
+    """
+    def wrong(key, expected):
+        raise UserError("'%s' must be %s, not %s" % (key, expected, json.dumps(operation[key])))
+    for key in _STRING_ARGS:
+        if operation.get(key) is not None and not isinstance(operation[key], basestring):
+            wrong(key, "a string")
+    for key in _INTEGER_ARGS:
+        value = operation.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, long))):
+            wrong(key, "an integer")
+    reviewers = operation.get("reviewers")
+    if reviewers is not None and not (isinstance(reviewers, list) and
+                                      all(isinstance(name, basestring) for name in reviewers)):
+        wrong("reviewers", "a list of strings")
+    if operation.get("pr_data") is not None and not isinstance(operation["pr_data"], dict):
+        wrong("pr_data", "an object")
+
+
+def _namespace(operation):
+    return dict(user=operation.get("user"), project=operation.get("project"))
+
+
+def _list_repositories(client, operation):
+    return client.list_repositories(limit=operation.get("limit"), **_namespace(operation)).values
+
+
+def _list_pull_requests(client, operation):
+    return client.list_pull_requests(repository=operation.get("repository"), state=operation.get("state"),
+                                     **_namespace(operation)).values
+
+
+def _list_commits(client, operation):
+    return [commit._response_data for commit in client.iter_commits(
+        repository=operation.get("repository"), pull_request=operation.get("pull_request"),
+        since=operation.get("since"), until=operation.get("until"), path=operation.get("path"),
+        max_count=operation.get("max_count"), **_namespace(operation))]
+
+
+def _list_changes(client, operation):
+    return client.list_changes(repository=operation.get("repository"), commit=operation.get("commit"),
+                               pull_request=operation.get("pull_request"), since=operation.get("since"),
+                               **_namespace(operation)).values
+
+
+def _create_repository(client, operation):
+    return client.create_repository(operation.get("repository"), **_namespace(operation)).json()
+
+
+def _fork_repository(client, operation):
+    return client.fork_repository(operation.get("repository"), **_namespace(operation)).json()
+
+
+def _delete_repository(client, operation):
+    resp = client.delete_repository(operation.get("repository"), **_namespace(operation))
+    return resp.json() if resp.text else {"status": resp.status_code}
+
+
+def _create_pull_request(client, operation):
+    pr_data = operation.get("pr_data")
+    if pr_data is None:
+        if not operation.get("source_branch"):
+            raise UserError("create_pull_request needs pr_data or a source_branch")
+        pr_data = StashPullRequest.postable_pull_request(
+            repository=operation.get("repository"),
+            **dict((key, operation[key]) for key in _POSTABLE_PR_ARGS if key in operation))
+    return client.create_pull_request(pr_data, repository=operation.get("repository"),
+                                      **_namespace(operation)).json()
+
+
+def _list_permissions(grantee_type):
+    def list_permissions(client, operation):
+        return client.list_permissions(grantee_type, repository=operation.get("repository"),
+                                       filter_on=operation.get("filter"), **_namespace(operation)).values
+    return list_permissions
+
+
+def _grant_permission(grantee_type):
+    def grant_permission(client, operation):
+        resp = client.grant_permission(grantee_type, operation.get("name"), operation.get("permission"),
+                                       repository=operation.get("repository"), **_namespace(operation))
+        return {"status": resp.status_code}
+    return grant_permission
+
+
+def _revoke_permission(grantee_type):
+    def revoke_permission(client, operation):
+        resp = client.revoke_permission(grantee_type, operation.get("name"),
+                                        repository=operation.get("repository"), **_namespace(operation))
+        return {"status": resp.status_code}
+    return revoke_permission
+
+
+OPERATIONS = {
+    "list_repositories": _list_repositories,
+    "list_pull_requests": _list_pull_requests,
+    "list_commits": _list_commits,
+    "list_changes": _list_changes,
+    "create_repository": _create_repository,
+    "fork_repository": _fork_repository,
+    "delete_repository": _delete_repository,
+    "create_pull_request": _create_pull_request,
+    "list_user_permissions": _list_permissions(_USER_NAMESPACE),
+    "list_group_permissions": _list_permissions(_GROUP_NAMESPACE),
+    "grant_user_permission": _grant_permission(_USER_NAMESPACE),
+    "grant_group_permission": _grant_permission(_GROUP_NAMESPACE),
+    "revoke_user_permission": _revoke_permission(_USER_NAMESPACE),
+    "revoke_group_permission": _revoke_permission(_GROUP_NAMESPACE),
+}
+
+
+def execute_operation(client, operation):
+    """
+    Execute one operation (a dictionary, as described above) and return its result dictionary.  Errors,
+    including failures to get any response from the server, are reported in the result rather than raised.
+    """
+    result = {"op": operation.get("op") if isinstance(operation, dict) else None}
+    try:
+        if not isinstance(operation, dict):
+            raise UserError("An operation must be a JSON object")
+        if "id" in operation:
+            result["id"] = operation["id"]
+        handler = OPERATIONS.get(operation.get("op"))
+        if handler is None:
+            raise UserError("Unknown operation '%s'; expected one of %s" % (
+                operation.get("op"), ", ".join(sorted(OPERATIONS))))
+        _check_arguments(operation)
+        result["result"] = handler(client, operation)
+        result["ok"] = True
+    except UserError as oops:
+        result.update(ok=False, error=str(oops))
+    except ResponseError as fail:
+        result.update(ok=False, error=str(fail), status=fail.response.status_code,
+                      messages=[error.message for error in fail.get_response_errors() or []])
+    except DeadlineExceeded as exc:
+        result.update(ok=False, error="Timed out: %s" % str(exc))
+    except CircuitOpenError as exc:
+        result.update(ok=False, error="Server unavailable: %s" % str(exc))
+    except IOError as exc:
+        # no response at all (a refused connection, a timeout, a daemon that went away...)
+        result.update(ok=False, error="No response: %s" % str(exc))
+    return result
+
+
+def parse_operations(lines):
+    """
+    Generate operations from lines of JSON, skipping blank lines and "#" comments.  A line that is not
+    valid JSON generates a string, which execute_operation will report as an error.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            logging.debug("Unparseable batch line %r: %s", line, str(exc))
+            yield line
+
+
+def run_batch(client, lines, out):
+    """
+    Execute every operation read from lines, writing each result to out as a compact JSON line as soon as
+    it is available.  Returns the number of failed operations.
+    """
+    failures = 0
+    for operation in parse_operations(lines):
+        result = execute_operation(client, operation)
+        if not result["ok"]:
+            failures += 1
+        out.write(json.dumps(result, separators=(',', ':')) + "\n")
+        out.flush()
+    return failures
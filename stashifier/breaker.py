@@ -0,0 +1,135 @@
+"""
+Circuit breaking for unhealthy Stash servers.  After failure_threshold failures (no response at all, or a
+5xx response) within failure_window seconds, a server's circuit opens, and requests to it fail
+immediately with CircuitOpenError instead of tying up a worker for another timeout.  Once reset_timeout
+seconds have passed, a single probe request is let through: if it succeeds the circuit closes again, and
+if it fails the circuit stays open for another reset_timeout.
+
+Breakers are shared by every client of the same host in a process (see breaker_for).
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_FAILURE_WINDOW = 30.0
+DEFAULT_RESET_TIMEOUT = 30.0
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(IOError):
+    """
+    A request was not sent, because its server has been failing.  retry_after is the number of seconds
+    until a probe request will be let through.
+    """
+    def __init__(self, host, retry_after):
+        super(CircuitOpenError, self).__init__(
+            "Stash server %s is failing; not sending requests to it for %.0f more seconds" % (host,
+                                                                                              retry_after))
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    The failure record and circuit state of one server.  Call before_request before sending each
+    request (it raises CircuitOpenError if the request should not be sent, and otherwise returns whether the
+    request is the probe), and then exactly one of record_success, record_failure or (if the request ended
+    some other way) cancel.
+    """
+    def __init__(self, host, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 failure_window=DEFAULT_FAILURE_WINDOW, reset_timeout=DEFAULT_RESET_TIMEOUT, clock=time.time):
+        self.host = host
+        self._failure_threshold = failure_threshold
+        self._failure_window = failure_window
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = deque()
+        self._opened_at = None
+        self._probing = False
+        self.state = CLOSED
+
+    def _open(self, now):
+        if self.state != OPEN:
+            logging.warning("Stash server %s is failing; failing requests fast for %.0f seconds", self.host,
+                            self._reset_timeout)
+        self.state = OPEN
+        self._opened_at = now
+        self._probing = False
+        self._failures.clear()
+
+    def before_request(self):
+        "Check that a request may be sent, and return True if it is the probe of a half-open circuit."
+        with self._lock:
+            if self.state == OPEN:
+                waited = self._clock() - self._opened_at
+                if waited < self._reset_timeout:
+                    raise CircuitOpenError(self.host, self._reset_timeout - waited)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.host, 0)
+                logging.info("Probing whether Stash server %s has recovered", self.host)
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.warning("Stash server %s has recovered", self.host)
+                self.state = CLOSED
+                self._probing = False
+                self._failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = self._clock()
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and self._failures[0] <= now - self._failure_window:
+                self._failures.popleft()
+            if len(self._failures) >= self._failure_threshold:
+                self._open(now)
+
+    def cancel(self, probe):
+        """
+        Forget a request that neither succeeded nor failed (e.g. was interrupted).  probe is what
+        before_request returned for it: if it was the probe, another request may probe in its place.
+        """
+        if not probe:
+            return
+        with self._lock:
+            self._probing = False
+
+
+def breaker_for(host):
+    "The process-wide CircuitBreaker for a host, created with the default settings if need be."
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
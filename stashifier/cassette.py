@@ -0,0 +1,124 @@
+"""
+Cassettes: Stash traffic recorded to a file, and replayed from it, so that the client (paging, models,
+output) can be run and benchmarked against real-shaped responses without a server or a network.
+
+A RecordingTransport wraps the transport that actually sends requests, and appends each exchange to the
+cassette as it completes, one compact JSON object per line:
+
+    {"method": "get", "path": "/rest/api/1.0/projects/PRJ/repos", "params": {"start": "25"},
+     "body": null, "status": 200, "reason": "OK", "text": "...", "elapsed": 0.084}
+
+Credentials are never written: the auth is left out, and so is the hostname of each request, so a
+cassette recorded against one server replays against any.  The response text is kept exactly as the
+server sent it, links back to the server (e.g. clone URLs) included.
+
+A ReplayTransport answers each request with the recorded response to the same method, path, query
+parameters and body.  Requests made more than once are answered in the order they were recorded (the
+last answer repeating, once they run out), and requests that were never recorded get a 404.  Responses
+come back immediately, or after their recorded time scaled by latency (1 for the recorded time).
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import threading
+import time
+from collections import deque
+
+from .transport import Transport, MemoryResponse
+
+
+def _url_path(url):
+    "The part of a URL after the host, e.g. /rest/api/1.0/projects."
+    if "://" in url:
+        url = url.split("://", 1)[1]
+    return "/" + url.split("/", 1)[1] if "/" in url else "/"
+
+
+def _params(query_params):
+    "Query parameters as they go over the wire, i.e. as strings, leaving out those that are not sent."
+    return dict((name, unicode(value)) for name, value in (query_params or {}).items() if value is not None)
+
+
+def _key(method, path, params, body):
+    return (method.lower(), path, tuple(sorted(params.items())), body)
+
+
+class RecordingTransport(Transport):
+    """
+    Send requests through another transport, and append every response received to the cassette at path
+    (replacing whatever it held before).
+    """
+    def __init__(self, transport, path):
+        self._transport = transport
+        self._path = path
+        self._lock = threading.Lock()
+        self._out = None
+
+    def send(self, method, url, auth=None, data=None, params=None, timeout=None):
+        started = time.time()
+        resp = self._transport.send(method, url, auth=auth, data=data, params=params, timeout=timeout)
+        exchange = {'method': method.lower(), 'path': _url_path(url), 'params': _params(params),
+                    'body': data, 'status': resp.status_code, 'reason': resp.reason, 'text': resp.text,
+                    'elapsed': round(time.time() - started, 4)}
+        line = json.dumps(exchange, separators=(',', ':'))
+        with self._lock:
+            if self._out is None:
+                self._out = open(self._path, 'w')
+            self._out.write(line + "\n")
+            # flushed as we go, so that an interrupted run leaves a usable cassette
+            self._out.flush()
+        return resp
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+        self._transport.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Answer requests from the cassette at path.  latency is None (or 0) to answer immediately, or the
+    factor to scale the recorded response times by.
+    """
+    def __init__(self, path, latency=None):
+        self._latency = latency
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        with open(path) as cassette:
+            for line in cassette:
+                if not line.strip():
+                    continue
+                exchange = json.loads(line)
+                key = _key(exchange['method'], exchange['path'], exchange['params'], exchange['body'])
+                self._exchanges.setdefault(key, deque()).append(exchange)
+
+    def _next_exchange(self, key):
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                return None
+            return exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+    def send(self, method, url, auth=None, data=None, params=None, timeout=None):
+        path = _url_path(url)
+        exchange = self._next_exchange(_key(method, path, _params(params), data))
+        if exchange is None:
+            message = "Not in cassette: %s %s" % (method.upper(), path)
+            return MemoryResponse(404, {'errors': [{'message': message}]}, reason="Not Found")
+        if self._latency:
+            time.sleep(exchange['elapsed'] * self._latency)
+        return MemoryResponse(exchange['status'], reason=exchange['reason'], text=exchange['text'])
@@ -15,15 +15,22 @@ Command-line interface to the stash client functions.
 ## See the License for the specific language governing permissions and
 ## limitations under the License.
 
+import errno
 import logging
 import os
-from ConfigParser import SafeConfigParser
+import sys
+import time
+from datetime import datetime
+from functools import wraps
 
-from .rest import UserError, ResponseError, StashRestClient
-from .models import StashPullRequest
+from .breaker import CircuitOpenError
+from .rest import UserError, ResponseError, DeadlineExceeded, StashRestClient, _USER_NAMESPACE
+from .concurrency import DEFAULT_WORKERS
 
 
 def get_cmd_arguments():
+    # one statement per option: there will be too many, guaranteed
+    # pylint: disable=R0915
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument("-o", "--organization", "-p", "--project", action="store", dest="org",
@@ -37,6 +44,30 @@ def get_cmd_arguments():
     parser.add_argument("-H", "--host", action="store", dest="host_override",
                         help=("Set the Stash hostname.  If not specified here, the value "
                               "must be set in .stashclientcfg."))
+    parser.add_argument("--server", action="store", dest="server_name",
+                        help="Use the server configured in the [server:SERVER] section of .stashclientcfg")
+    parser.add_argument("--all-servers", action="store_true", dest="all_servers",
+                        help=("List repositories (-l) or pull requests (-prs) on every configured server at "
+                              "once, tagged by server"))
+    parser.add_argument("--priority", action="store", dest="priority",
+                        choices=["interactive", "normal", "background"],
+                        help=("Scheduling priority of this command's requests, when they share a client "
+                              "(e.g. through --daemon) that limits concurrent requests"))
+    parser.add_argument("--timeout", action="store", dest="timeout", type=float,
+                        help=("Give up on the operation after this many seconds, reporting whatever results "
+                              "were fetched by then"))
+    parser.add_argument("--transport", action="store", dest="transport",
+                        choices=["requests", "session", "http2"],
+                        help=("How to send requests: a new connection each (requests), over pooled "
+                              "connections (session, the default), or multiplexed over HTTP/2 (http2, "
+                              "which needs the hyper package)"))
+    parser.add_argument("--record", action="store", dest="record_cassette", metavar="CASSETTE",
+                        help="Record every request and response (without credentials) to this file")
+    parser.add_argument("--replay", action="store", dest="replay_cassette", metavar="CASSETTE",
+                        help="Answer requests from a file made with --record, instead of a server")
+    parser.add_argument("--replay-latency", action="store", dest="replay_latency", type=float, default=0,
+                        help=("With --replay, answer after the recorded response time multiplied by this "
+                              "(default 0: at once)"))
     parser.add_argument("--page-size", action="store", dest="page_size", type=int,
                         help="Page size for paged responses")
     parser.add_argument("-C", "--create", action="store_true", dest="create",
@@ -47,8 +78,75 @@ def get_cmd_arguments():
                         help="List repositories available.")
     parser.add_argument("-perm", "--list-user-permissions", action="store_true", dest="list_user_permissions",
                         help="List the permissions for the users of this project")
+    parser.add_argument("--audit-permissions", action="store_true", dest="audit_permissions",
+                        help=("List user and group permissions for every project (or PROJECT/repo) given "
+                              "as an argument; with --all-repos, also for all of their repositories"))
+    parser.add_argument("--apply-permissions", action="store", dest="permission_policy",
+                        help=("Grant (and with --prune, revoke) permissions to match this JSON policy file; "
+                              "see stashifier/permissions.py for the format"))
+    parser.add_argument("--prune", action="store_true", dest="prune",
+                        help="With --apply-permissions, revoke permissions of grantees not in the policy")
+    parser.add_argument("--plan-only", action="store_true", dest="plan_only",
+                        help="With --apply-permissions, print the changes without making them")
+    parser.add_argument("--max-rate", action="store", dest="max_rate", type=float, default=None,
+                        help="Most write requests per second for bulk changes (default 10; 0 for no limit)")
     parser.add_argument("-prs", "--list-pull-requests", action="store_true", dest="list_pull_requests",
                         help="List open pull requests for this project")
+    parser.add_argument("--list-commits", action="store_true", dest="list_commits",
+                        help="List the commits of a repository (-r), newest first, or of a pull request")
+    parser.add_argument("--list-changes", action="store", dest="changes_commit", nargs="?", const="",
+                        metavar="COMMIT",
+                        help="List the files changed by a commit of a repository (-r), or by a pull request")
+    parser.add_argument("--pull-request-id", action="store", dest="pull_request_id", type=int,
+                        help="With --list-commits or --list-changes, the pull request to list for")
+    parser.add_argument("--since", action="store", dest="since",
+                        help=("With --list-commits, leave out commits reachable from this commit or ref; "
+                              "with --list-changes, compare with it instead of the commit's parent"))
+    parser.add_argument("--until", action="store", dest="until",
+                        help="With --list-commits, list commits reachable from this commit or ref")
+    parser.add_argument("--path", action="store", dest="path",
+                        help="With --list-commits, only list commits that touched this file or directory")
+    parser.add_argument("--max-commits", action="store", dest="max_commits", type=int,
+                        help="With --list-commits, stop after this many commits")
+    parser.add_argument("--all-repos", action="store_true", dest="all_repos",
+                        help="List pull requests for every repository in the project or user namespace")
+    parser.add_argument("--workers", action="store", dest="workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of concurrent requests for multi-repository operations (default %d)"
+                        % DEFAULT_WORKERS)
+    parser.add_argument("--report", action="store_true", dest="report",
+                        help="With -prs, print review-load and age statistics instead of a listing")
+    parser.add_argument("--watch", action="store_true", dest="watch",
+                        help="With -prs, keep polling and print only new, updated and closed pull requests")
+    parser.add_argument("--watch-interval", action="store", dest="watch_interval", type=float, default=15.0,
+                        help="Shortest delay in seconds between polls in watch mode (default 15)")
+    parser.add_argument("--watch-max-interval", action="store", dest="watch_max_interval", type=float,
+                        default=300.0,
+                        help="Longest delay in seconds between quiet polls in watch mode (default 300)")
+    parser.add_argument("--serve-webhooks", action="store", dest="webhook_port", type=int,
+                        help="Receive Stash webhook events on this port, keeping --webhook-store current")
+    parser.add_argument("--webhook-store", action="store", dest="webhook_store",
+                        help=("JSON file of pull requests maintained by --serve-webhooks; with -prs, "
+                              "list from this file instead of querying Stash"))
+    parser.add_argument("--scan-workspace", action="store", dest="workspace_root",
+                        help="List the Stash project/user and repository of every clone under this directory")
+    parser.add_argument("--mirror", action="store", dest="mirror_root",
+                        help="Clone or update bare mirrors of every repository in the project or user here")
+    parser.add_argument("--clone-protocol", action="store", dest="clone_protocol", default="ssh",
+                        choices=["ssh", "http"], help="Clone URL protocol for --mirror (default ssh)")
+    parser.add_argument("--always-fetch", action="store_true", dest="always_fetch",
+                        help="With --mirror, fetch existing mirrors even if their refs look unchanged")
+    parser.add_argument("--batch", action="store", dest="batch_file",
+                        help="Execute operations read as JSON lines from this file ('-' for stdin)")
+    parser.add_argument("--daemon", action="store_true", dest="run_daemon",
+                        help="Run in the foreground as a daemon keeping a warm client for other invocations")
+    parser.add_argument("--no-daemon", action="store_true", dest="no_daemon",
+                        help="Send requests directly, even if a daemon is running")
+    parser.add_argument("--format", action="store", dest="output_format", default="text",
+                        choices=["text", "jsonl"],
+                        help="Output human-readable text (default), or one compact JSON object per line")
+    parser.add_argument("--fields", action="store", dest="fields",
+                        help=("With --format jsonl, comma-separated (dotted) fields to output, "
+                              "e.g. id,author.user.name"))
     parser.add_argument("--pr-state", action="store", dest="pull_request_state",
                         choices=["OPEN", "DECLINED", "MERGED"],
                         help="List pull requests with this state (default OPEN)")
@@ -57,7 +155,13 @@ def get_cmd_arguments():
     parser.add_argument("--pr-here", action="store_true", dest="pr_guess_parameters",
                         help="Use the current project and branch for the pull request")
     parser.add_argument("--pr-reviewers", action="store", dest="pr_reviewer_names",
-                        help="Comma-separated list of reviewer usernames")
+                        help=("Comma-separated list of reviewers: user names, email addresses or "
+                              "display names, checked against (and completed from) the user directory"))
+    parser.add_argument("--no-reviewer-check", action="store_true", dest="no_reviewer_check",
+                        help="Send --pr-reviewers names as given, without checking the user directory")
+    parser.add_argument("--complete-reviewers", action="store", dest="complete_reviewers",
+                        help=("Print the user names that complete the last name in this comma-separated "
+                              "list, one per line (for shell completion)"))
     parser.add_argument("--pr-title", action="store", dest="pr_title",
                         help="Pull request title")
     parser.add_argument("--pr-description", action="store", dest="pr_description",
@@ -90,110 +194,514 @@ def get_repo_name(args):
         return args.positional_args[0]
 
 
+def connect_daemon(args, server, username):
+    "A connection to the running daemon, if there is one and the command can use it, or None."
+    # a watcher polls more often than the daemon's cached listings expire, so must ask the server itself
+    if any((args.run_daemon, args.no_daemon, args.dry_run, args.record_cassette, args.replay_cassette,
+            args.watch)):
+        return None
+    from .daemon import DaemonConnection, default_socket_path
+    if not os.path.exists(default_socket_path()):
+        return None
+    return DaemonConnection(default_socket_path(), server, username)
+
+
 def get_client(args, config):
-    server = args.host_override
-    # All this elaborate if-else is because config.get() doesn't take a "default" argument
-    if server is None:
-        if config.has_option('server', 'hostname'):
-            server = config.get('server', 'hostname')
-        else:
-            raise UserError("Server must be set, either via configuration file or command-line option.")
-    username = args.user_override
-    if username is None:
-        if config.has_option('server', 'user'):
-            username = config.get('server', 'user')
-        else:
-            username = os.environ["USER"]
+    from .servers import server_settings
+    server, username, limits = server_settings(config, args.server_name, args.host_override,
+                                               args.user_override)
     logging.debug("User %s will connect to host %s", username, server)
-    return StashRestClient(server, username, dry_run=args.dry_run)
+    daemon = connect_daemon(args, server, username)
+    from .planner import RequestStats
+    stats = RequestStats(os.path.join(os.environ["HOME"], ".stashclient_stats.json"), server)
+    password = None
+    if args.transport:
+        limits['transport'] = args.transport
+    if args.replay_cassette:
+        from .cassette import ReplayTransport
+        limits['transport'] = ReplayTransport(args.replay_cassette, args.replay_latency)
+        # a replay needs no password, and its timings say nothing about the server's
+        password = "(replay)"
+        stats = None
+    elif args.record_cassette:
+        from .cassette import RecordingTransport
+        from .transport import create_transport, DEFAULT_TRANSPORT
+        limits['transport'] = RecordingTransport(create_transport(limits.get('transport', DEFAULT_TRANSPORT),
+                                                                  limits.get('max_connections')),
+                                                 args.record_cassette)
+    return StashRestClient(server, username, password, dry_run=args.dry_run, daemon=daemon, stats=stats,
+                           **limits)
 
 
-def cli_wrap(func):
+def format_commit(commit):
+    """
+    Describe a commit in one line, from a record (see models.Projection) of its displayId,
+    authorTimestamp, author.name and message.
+    """
+    authored = datetime.fromtimestamp(commit.authorTimestamp / 1000.00)
+    return "%s %s %s: %s" % (commit.displayId, authored.strftime("%Y-%m-%d %H:%M"), commit.author_name,
+                             (commit.message or "").split("\n", 1)[0])
+
+
+def format_pull_request(pull_req, verbose=False, repo_name=None):
+    """
+    Describe a pull request in human-readable lines, optionally prefixed with its repository name.
+    """
+    author = pull_req.author
+    prefix = "[%s] " % repo_name if repo_name else ""
+    lines = ["%s'%s' (%d) created at %s by %s (%s)" % (prefix, pull_req.title, pull_req.id, pull_req.created,
+                                                       author.display_name, author.email)]
+    if pull_req.is_local():
+        lines.append("    local merge from source branch %s into %s" % (
+            pull_req.source.display_id, pull_req.destination.display_id))
+    else:
+        lines.append("    merge from remote fork %s, branch %s into local branch %s" % (
+            pull_req.source.repository.project.name, pull_req.source.display_id,
+            pull_req.destination.display_id))
+    if pull_req.reviewers:
+        lines.append("    Reviewers: %s" % ", ".join([who.display_name for who in pull_req.reviewers]))
+    if pull_req.approved_by:
+        lines.append("    Approved by: %s" % ", ".join([who.display_name for who in pull_req.approved_by]))
+    if verbose:
+        lines.append(pull_req._dump())
+    return lines
+
+
+def has_terminal():
+    "Whether this process has a controlling terminal, on which getpass can prompt."
     try:
-        retval = func()
-        if retval is None:
-            retval = 0
-        exit(retval)
-    except KeyboardInterrupt:
-        exit(127)
-    except UserError as oops:
-        print "Input error: %s" % str(oops)
-    except ResponseError as fail:
-        print "Response unhappy: %s" % str(fail)
-        error_messages = fail.get_response_errors()
-        if error_messages:
-            print "Specific error messages from the server:"
-            for error in error_messages:
-                print "    " + error.message
-    exit(1)
+        os.close(os.open("/dev/tty", os.O_RDWR | os.O_NOCTTY))
+    except OSError:
+        return False
+    return True
+
+
+def write_lines(lines):
+    """
+    Write lines to STDOUT in a single buffered write, and flush them, so that listings appear a page
+    (rather than a line, or the whole listing) at a time.
+    """
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+def check_complete(clients, retval):
+    """
+    The exit status of a command that returned retval: if any of the clients cut a listing short at the
+    --timeout deadline (returning the pages fetched by then), say that the results are incomplete, and fail.
+    """
+    if any(client.partial_listings for client in clients):
+        # not on STDOUT, where it would be taken for one more result (e.g. a line of --format jsonl)
+        sys.stderr.write("Timed out: results are incomplete\n")
+        return retval or 1
+    return retval
+
+
+def list_all_servers(args, config, writer):
+    """
+    Run a repository or pull request listing against every configured server in parallel, printing each
+    server's results (tagged with its name) as soon as it is done.  Returns 1 if any server failed.
+    """
+    from .servers import ClientPool
+    pool = ClientPool.from_config(config, username=args.user_override, dry_run=args.dry_run)
+    if args.list_repos:
+        results = pool.fan_out('list_repositories', project=args.org, user=args.user)
+    elif args.list_pull_requests and args.all_repos:
+        results = pool.fan_out('list_all_pull_requests', project=args.org, user=args.user,
+                               state=args.pull_request_state, workers=args.workers)
+    elif args.list_pull_requests:
+        results = pool.fan_out('list_pull_requests', project=args.org, user=args.user,
+                               repository=args.repo_name, state=args.pull_request_state)
+    else:
+        raise UserError("--all-servers can only list repositories (-l) or pull requests (-prs)")
+    failed = 0
+    for host, items, error in results:
+        if error is not None:
+            failed += 1
+            if not writer:
+                write_lines(["[%s] failed: %s" % (host, str(error))])
+            continue
+        if args.list_pull_requests and args.all_repos:
+            items = [pull_req for _, pull_req in items]
+        if writer:
+            writer.write(dict(item._response_data, server=host) for item in items)
+        elif args.list_repos:
+            write_lines(["[%s] %s" % (host, repo.name) for repo in items])
+        else:
+            write_lines([line for pull_req in items for line in format_pull_request(
+                pull_req, verbose=args.verbose,
+                repo_name="%s %s" % (host, pull_req.destination.repository.slug))])
+    return check_complete([pool.client(name) for name in pool.names], 1 if failed else 0)
+
+
+def cli_wrap(func):
+    """
+    Wrap a command-line entry point so that it exits with its return value (0 if None), and reports
+    user input and server response errors briefly, rather than with a traceback.
+
+    The wrapped function only runs when called (e.g. by the console script), not when this module is
+    imported: running it during the import would hold the interpreter's import lock, and deadlock any
+    worker thread that imports a module (as the REST client does, lazily).
+    """
+    @wraps(func)
+    def wrapper():
+        try:
+            retval = func()
+            if retval is None:
+                retval = 0
+            exit(retval)
+        except KeyboardInterrupt:
+            exit(127)
+        except DeadlineExceeded as exc:
+            print "Timed out: %s" % str(exc)
+        except CircuitOpenError as exc:
+            print "Server unavailable: %s" % str(exc)
+        except IOError as exc:
+            if exc.errno is None:
+                # e.g. a request that timed out (transport.TransportTimeout), or that couldn't connect
+                print "Request failed: %s" % str(exc)
+                exit(1)
+            if exc.errno != errno.EPIPE:
+                # e.g. a file that can't be read, or a request the daemon got no response to
+                print "I/O error: %s" % (exc.strerror if exc.filename is None else
+                                         "%s: %s" % (exc.strerror, exc.filename))
+                exit(1)
+            # the reader went away (e.g. "stash_client -l | head"): stop quietly, and keep the interpreter
+            # from complaining as it fails to flush whatever is left in the STDOUT buffer on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            exit(0)
+        except UserError as oops:
+            print "Input error: %s" % str(oops)
+        except ResponseError as fail:
+            print "Response unhappy: %s" % str(fail)
+            error_messages = fail.get_response_errors()
+            if error_messages:
+                print "Specific error messages from the server:"
+                for error in error_messages:
+                    print "    " + error.message
+        exit(1)
+    return wrapper
 
 
 @cli_wrap
 def main():
     # This is the giant omnibus dispatcher: it will have too many branches, guaranteed
     # pylint: disable=R0912,R0914,R0915
-    from .models import StashRepo
+    from ConfigParser import SafeConfigParser
     logging.basicConfig()
     args = get_cmd_arguments()
 
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
+    if args.priority:
+        from .scheduler import set_request_context, PRIORITIES
+        set_request_context(PRIORITIES[args.priority])
+    if args.timeout:
+        from .scheduler import set_request_context
+        set_request_context(deadline=time.time() + args.timeout)
+    writer = None
+    if args.output_format == "jsonl":
+        from .output import JsonLinesWriter, parse_fields
+        writer = JsonLinesWriter(sys.stdout, parse_fields(args.fields))
     # silly approach that avoids hard-coding the stash repo
     config = SafeConfigParser()
     config.read(os.path.join(os.environ["HOME"], ".stashclientcfg"))
+
+    if args.workspace_root:
+        from .workspace import WorkspaceScanner, repositories_by_clone
+        scanner = WorkspaceScanner(os.path.join(os.environ["HOME"], ".stashclient_workspace.json"),
+                                   workers=args.workers)
+        for clone_path, remote_name, owner, repo in repositories_by_clone(scanner.scan(args.workspace_root)):
+            if writer:
+                writer.write_one({"path": clone_path, "remote": remote_name, "owner": owner,
+                                  "repository": repo})
+            else:
+                print "%s %s %s/%s" % (clone_path, remote_name, owner, repo)
+        return 0
+    elif args.webhook_port is not None:
+        from .webhook import PullRequestStore, WebhookReceiver
+        secret = config.get('webhooks', 'secret') if config.has_option('webhooks', 'secret') else None
+        receiver = WebhookReceiver(PullRequestStore(args.webhook_store), port=args.webhook_port,
+                                   secret=secret)
+        print "Receiving webhook events at %s" % receiver.url
+        receiver.serve_forever()
+        return 0
+    elif args.list_pull_requests and args.webhook_store:
+        from .webhook import PullRequestStore
+        for pull_req in PullRequestStore(args.webhook_store).pull_requests(
+                project=args.org or (args.user and "~" + args.user.upper()), repository=args.repo_name,
+                state=args.pull_request_state or "OPEN"):
+            if writer:
+                writer.write_one(pull_req._response_data)
+            else:
+                write_lines(format_pull_request(pull_req, verbose=args.verbose,
+                                                repo_name=pull_req.destination.repository.slug))
+        return 0
+    elif args.all_servers:
+        return list_all_servers(args, config, writer)
     client = get_client(args, config)
+    try:
+        retval = run_command(args, client, writer)
+    finally:
+        if client.plan is not None:
+            # on STDERR, so that the plan can't be mistaken for output (e.g. a line of --format jsonl)
+            plan = client.plan.report(concurrency=args.workers)
+            if plan:
+                sys.stderr.write("\n".join(plan) + "\n")
+        elif client.stats is not None:
+            client.stats.save()
+    return check_complete([client], retval)
 
-    if args.delete:
+
+def run_command(args, client, writer):
+    """
+    Carry out the operation the command-line arguments ask for with a client: everything but the
+    operations that need no client (or more than one).
+    """
+    # one branch, and often a return, per operation: it will have too many of both, guaranteed
+    # pylint: disable=R0911,R0912,R0914,R0915
+    user_directory_path = os.path.join(os.environ["HOME"], ".stashclient_users.json")
+
+    if args.complete_reviewers is not None:
+        from .directory import UserDirectory
+        done, _, prefix = args.complete_reviewers.rpartition(",")
+        lead = done + "," if done else ""
+        write_lines([lead + name for name in UserDirectory(client, user_directory_path).complete(prefix)])
+    elif args.run_daemon:
+        from .daemon import StashDaemon, default_socket_path
+        client._set_creds()
+        print "Serving %s@%s on %s" % (client._username, client._host, default_socket_path())
+        sys.stdout.flush()
+        StashDaemon(client, default_socket_path()).serve_forever()
+    elif args.batch_file:
+        from .batch import run_batch
+        # operations forwarded to a daemon need no password here (the daemon has its own), nor do planned ones
+        needs_password = client._daemon is None and not args.dry_run
+        if args.batch_file == "-":
+            if needs_password and not client._password and not has_terminal():
+                # getpass would fall back on reading the password from standard input, eating an operation
+                raise UserError("--batch - needs a terminal to ask for the password on")
+            if needs_password:
+                # ask for the password now, rather than in the middle of the first operation
+                client._set_creds()
+            # readline rather than file iteration, which reads ahead and would delay results from a pipe
+            return 1 if run_batch(client, iter(sys.stdin.readline, ''), sys.stdout) else 0
+        with open(args.batch_file) as lines:
+            if needs_password:
+                client._set_creds()
+            return 1 if run_batch(client, lines, sys.stdout) else 0
+    elif args.delete:
         repo_name = get_repo_name(args)
         resp = client.delete_repository(repo_name, user=args.user, project=args.org)
-        if resp.text:
+        if args.dry_run:
+            return 0
+        if writer:
+            writer.write_one(resp.json() if resp.text else
+                             {"status": resp.status_code, "reason": resp.reason})
+        elif resp.text:
             print "Deletion OK: %s" % resp.json().get('message')
         else:
             print "Deletion attempt succeeded with status %d: %s" % (resp.status_code, resp.reason)
     elif args.create:
+        from .models import StashRepo
         create_repo_name = get_repo_name(args)
         resp = client.create_repository(create_repo_name, user=args.user, project=args.org)
+        if args.dry_run:
+            return 0
         repo = StashRepo(resp.json())
+        if writer:
+            writer.write_one(repo._response_data)
+            return 0
         print "Successfully created repo %s with clone URL %s" % (repo.name, repo.get_clone_url('ssh'))
     elif args.fork:
+        from .models import StashRepo
         create_repo_name = get_repo_name(args)
         resp = client.fork_repository(create_repo_name, user=args.user, project=args.org)
+        if args.dry_run:
+            return 0
         repo = StashRepo(resp.json())
+        if writer:
+            writer.write_one(repo._response_data)
+            return 0
         print "Successfully forked repo %s with clone URL %s" % (repo.name, repo.get_clone_url('ssh'))
     elif args.list_user_permissions:
         filter_on = None
         if args.positional_args:
             filter_on = args.positional_args[0]
-        client.list_user_permissions(project=args.org, filter_on=filter_on)
+        for page in client.iter_permission_pages(_USER_NAMESPACE, project=args.org, user=args.user,
+                                                 repository=args.repo_name, filter_on=filter_on,
+                                                 limit=args.page_size, fields=writer and writer.fields):
+            if writer:
+                writer.write(page.values)
+            else:
+                write_lines(["%s : %s" % (grant.display_name, grant.permission) for grant in page.entities])
+    elif args.audit_permissions:
+        targets = [tuple(target.split("/", 1)) if "/" in target else (target, None)
+                   for target in args.positional_args or ([args.org] if args.org else [])]
+        if not targets:
+            raise UserError("Permission audit needs at least one project (or PROJECT/repo) argument")
+        for project, repository, grant in client.audit_permissions(
+                targets, include_repositories=args.all_repos, workers=args.workers):
+            if writer:
+                writer.write_one({"project": project, "repository": repository,
+                                  "grantee_type": grant.grantee_type, "grantee": grant.name,
+                                  "permission": grant.permission})
+            else:
+                write_lines(["%s %s %s %s" % ("/".join(part for part in (project, repository) if part),
+                                              grant.grantee_type, grant.name, grant.permission)])
+    elif args.permission_policy:
+        from .permissions import load_policy, plan_changes, apply_changes, DEFAULT_RATE
+        with open(args.permission_policy) as policy_file:
+            policy = load_policy(policy_file)
+        changes = plan_changes(client, policy, prune=args.prune, workers=args.workers)
+        if args.plan_only:
+            results = ((change, None) for change in changes)
+        else:
+            results = apply_changes(client, changes, workers=args.workers,
+                                    rate=DEFAULT_RATE if args.max_rate is None else args.max_rate)
+        failures = 0
+        for change, error in results:
+            failures += 1 if error else 0
+            if writer:
+                record = change._asdict()
+                record["target"] = change.target
+                if not args.plan_only:
+                    record.update(ok=error is None, error=error)
+                writer.write_one(record)
+                continue
+            print "%s %s %s %s %s%s" % (change.action, change.target, change.grantee_type[:-1], change.name,
+                                        change.permission or change.current,
+                                        ": FAILED (%s)" % error if error else "")
+            sys.stdout.flush()
+        if not writer:
+            print "%d changes%s" % (len(changes), ", %d failed" % failures if failures else "")
+        return 1 if failures else 0
     elif args.list_repos:
-        repo_list = client.list_repositories(project=args.org, user=args.user, limit=args.page_size)
-        print "Retrieved %d repos in %d pages" % (repo_list.entity_count, repo_list.page_count)
-        for repo in repo_list.entities:
-            print repo.name
+        repo_count = page_count = 0
+        # plain output needs nothing but the names; --fields output, nothing but its fields
+        for page in client.iter_repository_pages(project=args.org, user=args.user, limit=args.page_size,
+                                                 fields=writer.fields if writer else ["name"]):
+            page_count += 1
+            repo_count += len(page.entities)
+            if writer:
+                writer.write(page.values)
+            else:
+                write_lines([repo.name for repo in page.entities])
+        if not writer:
+            print "Retrieved %d repos in %d pages" % (repo_count, page_count)
+    elif args.list_commits:
+        # plain output needs just these fields of each commit
+        fields = writer.fields if writer else ["displayId", "authorTimestamp", "author.name", "message"]
+        for commit in client.iter_commits(project=args.org, user=args.user, repository=args.repo_name,
+                                          pull_request=args.pull_request_id, since=args.since,
+                                          until=args.until, path=args.path, max_count=args.max_commits,
+                                          fields=fields):
+            if writer:
+                writer.write_one(commit if fields else commit._response_data)
+            else:
+                write_lines([format_commit(commit)])
+    elif args.changes_commit is not None:
+        for page in client.iter_change_pages(project=args.org, user=args.user, repository=args.repo_name,
+                                             commit=args.changes_commit or None,
+                                             pull_request=args.pull_request_id, since=args.since,
+                                             limit=args.page_size, fields=writer and writer.fields):
+            if writer:
+                writer.write(page.values)
+            else:
+                write_lines(["%s %s%s" % (change.change_type,
+                                          "%s -> " % change.src_path if change.src_path else "", change.path)
+                             for change in page.entities])
+    elif args.mirror_root:
+        if args.dry_run:
+            # the git side of mirroring has no dry run
+            raise UserError("--mirror cannot be combined with --dry-run")
+        from collections import Counter
+        from .mirror import mirror_project, FAILED
+        statuses = Counter()
+        for repo, status, error in mirror_project(client, args.mirror_root, user=args.user, project=args.org,
+                                                  protocol=args.clone_protocol, workers=args.workers,
+                                                  skip_unchanged=not args.always_fetch):
+            statuses[status] += 1
+            if writer:
+                writer.write_one({"repository": repo.slug, "status": status, "error": error})
+                continue
+            print "%s: %s%s" % (repo.slug, status, " (%s)" % error.strip() if error else "")
+            sys.stdout.flush()
+        if not writer:
+            print ", ".join("%d %s" % (count, status) for status, count in sorted(statuses.items()))
+        return 1 if statuses[FAILED] else 0
+    elif args.list_pull_requests and args.watch:
+        from .watch import PullRequestWatcher, AdaptiveInterval
+        if not args.all_repos and not args.repo_name:
+            raise UserError("Watch mode needs a repository name (-r) or --all-repos")
+        watcher = PullRequestWatcher(client, project=args.org, user=args.user,
+                                     repository=None if args.all_repos else args.repo_name,
+                                     state=args.pull_request_state, workers=args.workers)
+        try:
+            interval = AdaptiveInterval(args.watch_interval,
+                                        max(args.watch_interval, args.watch_max_interval))
+        except ValueError as oops:
+            raise UserError(str(oops))
+
+        def report(changes):
+            if writer:
+                writer.write({"change": change, "repository": repo_slug,
+                              "pull_request": pull_req._response_data}
+                             for change, repo_slug, pull_req in changes)
+                return
+            for change, repo_slug, pull_req in changes:
+                print "%s [%s] '%s' (%d) by %s, updated %s" % (change, repo_slug, pull_req.title, pull_req.id,
+                                                               pull_req.author.display_name, pull_req.updated)
+            sys.stdout.flush()
+        watcher.poll()
+        logging.info("Watching %d pull requests", watcher.known_count)
+        if not writer:
+            print "Watching %d pull requests" % watcher.known_count
+            sys.stdout.flush()
+        watcher.watch(interval, report)
+    elif args.list_pull_requests and args.report:
+        from .analytics import PullRequestAnalytics, format_report
+        if args.all_repos:
+            pull_requests = [pull_req for _, pull_req in client.list_all_pull_requests(
+                project=args.org, user=args.user, state=args.pull_request_state, workers=args.workers)]
+        else:
+            pull_requests = client.list_pull_requests(project=args.org, user=args.user,
+                                                      repository=args.repo_name,
+                                                      state=args.pull_request_state).entities
+        for line in format_report(PullRequestAnalytics(pull_requests)):
+            print line
+    elif args.list_pull_requests and args.all_repos:
+        for repo, pull_req in client.list_all_pull_requests(project=args.org, user=args.user,
+                                                            state=args.pull_request_state,
+                                                            workers=args.workers):
+            if writer:
+                writer.write_one(pull_req._response_data)
+            else:
+                write_lines(format_pull_request(pull_req, verbose=args.verbose, repo_name=repo.slug))
     elif args.list_pull_requests:
-        pr_list = client.list_pull_requests(project=args.org, user=args.user, repository=args.repo_name,
-                                            state=args.pull_request_state)
-        for pull_req in pr_list.entities:
-            author = pull_req.author
-            print "'%s' (%d) created at %s by %s (%s)" % (pull_req.title, pull_req.id, pull_req.created,
-                                                          author.display_name, author.email)
-            if pull_req.is_local():
-                print "    local merge from source branch %s into %s" % (
-                    pull_req.source.display_id, pull_req.destination.display_id)
+        for page in client.iter_pull_request_pages(project=args.org, user=args.user,
+                                                   repository=args.repo_name, state=args.pull_request_state,
+                                                   limit=args.page_size, fields=writer and writer.fields):
+            if writer:
+                writer.write(page.values)
             else:
-                print "    merge from remote fork %s, branch %s into local branch %s" % (
-                    pull_req.source.repository.project.name, pull_req.source.display_id,
-                    pull_req.destination.display_id)
-            if pull_req.reviewers:
-                print "    Reviewers: %s" % ", ".join([who.display_name for who in pull_req.reviewers])
-            if pull_req.approved_by:
-                print "    Approved by: %s" % ", ".join([who.display_name for who in pull_req.approved_by])
-            if args.verbose:
-                print pull_req._dump()
+                write_lines([line for pull_req in page.entities
+                             for line in format_pull_request(pull_req, verbose=args.verbose)])
     elif args.create_pr:
+        from .models import StashPullRequest
         reviewer_names = []
         if args.pr_reviewer_names:
-            reviewer_names = [name.strip() for name in args.pr_reviewer_names.split(",")]
+            reviewer_names = [name.strip() for name in args.pr_reviewer_names.split(",") if name.strip()]
+        if reviewer_names and not (args.no_reviewer_check or args.dry_run):
+            from .directory import UserDirectory
+            directory = UserDirectory(client, user_directory_path)
+            resolved = [directory.resolve(name) for name in reviewer_names]
+            for given, name in zip(reviewer_names, resolved):
+                if given != name:
+                    logging.warning("Reviewer '%s' taken to be %s (%s)", given, name,
+                                    directory.describe(name))
+            reviewer_names = resolved
         if args.pr_guess_parameters:
             # guess based on local git repository information
             from .local_git import get_project_repo, get_current_branch
@@ -216,14 +724,17 @@ def main():
             title=args.pr_title,
             reviewers=reviewer_names
         )
-        if args.dry_run:
-            print pr_data, user, project, repo
-            return
         pr_resp = client.create_pull_request(user=user, project=project, repository=repo, pr_data=pr_data)
+        if args.dry_run:
+            return 0
         created_pr = StashPullRequest(pr_resp.json())
+        if writer:
+            writer.write_one(created_pr._response_data)
+            return 0
         print "Created pull request '%s' (#%d) at %s" % (created_pr.title, created_pr.id, created_pr.created)
     else:
         print "No operation specified."
+    return 0
 
 
 if '__main__' == __name__:
@@ -0,0 +1,78 @@
+"""
+Helpers for running blocking Stash calls concurrently on a bounded pool of worker threads.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import threading
+import time
+
+from .scheduler import current_context, current_deadline, explicit_priority, request_context
+
+DEFAULT_WORKERS = 8
+
+
+def bounded_imap(func, items, workers=DEFAULT_WORKERS, priority=None):
+    """
+    Apply func to every item using at most `workers` threads, yielding results in the order they
+    complete (not the order of the input), so that callers can stream them as they arrive.
+
+    The worker threads send requests as the same caller (see scheduler) as the calling thread, with the
+    same deadline, and at its priority if it has set one, or else at the priority given.
+
+    An exception raised by func is re-raised here, and the remaining work is abandoned.
+    """
+    # imported here because multiprocessing is slow to load, and most commands never need a pool
+    from multiprocessing.pool import ThreadPool
+    items = list(items)
+    if not items:
+        return
+    if explicit_priority() is not None:
+        priority = explicit_priority()
+    caller = current_context()[1]
+    deadline = current_deadline()
+
+    def run(item):
+        with request_context(priority, caller, deadline):
+            return func(item)
+
+    pool = ThreadPool(max(1, min(workers, len(items))))
+    try:
+        for result in pool.imap_unordered(run, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class RateLimiter(object):
+    """
+    Space calls out to at most `rate` per second, across every thread that shares the limiter.  A rate
+    of None (or 0) means no limit.
+    """
+    def __init__(self, rate=None):
+        self._interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        "Block until the caller may make its next call."
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
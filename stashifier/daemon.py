@@ -0,0 +1,245 @@
+"""
+An optional background daemon that keeps a warm StashRestClient (credentials already entered, pooled
+connections, recently fetched GET responses) and serves requests for it over a Unix socket, so that
+short-lived stash_client invocations can skip the password prompt, the TLS handshakes and repeated
+listings.
+
+The protocol is one JSON object per line in each direction.  A request carries the same arguments as
+StashRestClient._request, plus the host and username the caller expects to be talking to; the reply
+carries the status code, reason and body of the Stash response, or an "error" message if no response
+was received at all.  Any non-GET request empties the response cache.  A request may also carry the
+scheduling priority (see stashifier.scheduler) it should be sent at.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+DEFAULT_SOCKET_NAME = ".stashclient.sock"
+DEFAULT_CACHE_TTL = 60.0
+_REQUEST_FIELDS = ("method", "user", "project", "repository", "api_path", "request_body", "query_params")
+
+
+def default_socket_path():
+    return os.path.join(os.environ["HOME"], DEFAULT_SOCKET_NAME)
+
+
+class ForwardedResponse(object):
+    """
+    Just enough of a requests.Response for the client and ResponseError: a response relayed by the daemon.
+    """
+    def __init__(self, reply):
+        self.status_code = reply["status_code"]
+        self.reason = reply["reason"]
+        self.text = reply["text"]
+        self.ok = self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class DaemonUnavailable(Exception):
+    """
+    The daemon is not running, or will not serve this caller: send the request directly instead.
+    """
+    pass
+
+
+class DaemonConnection(object):
+    """
+    The front end's side of the socket: forwards requests to the daemon over one connection, opened on
+    first use.
+    """
+    def __init__(self, socket_path, host, username):
+        self._socket_path = socket_path
+        self._host = host
+        self._username = username
+        self._lock = threading.Lock()
+        self._sock = None
+        self._stream = None
+
+    def _connect(self):
+        if self._stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._socket_path)
+            except socket.error as exc:
+                sock.close()
+                raise DaemonUnavailable("No daemon at %s: %s" % (self._socket_path, str(exc)))
+            # the socket is kept (as well as the file object reading and writing it) to set its timeout
+            self._sock = sock
+            self._stream = sock.makefile("rw")
+        return self._stream
+
+    def _disconnect(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._sock.close()
+        self._sock = self._stream = None
+
+    def forward(self, **request):
+        """
+        Send one request (with the keyword arguments of StashRestClient._request) through the daemon, and
+        return a ForwardedResponse.  Raises DaemonUnavailable if the daemon can't or won't handle it,
+        IOError if the daemon tried but got no response from Stash, and DeadlineExceeded if the deadline of
+        the current operation (which the daemon is told, and keeps to as well) passes first.
+        """
+        from .rest import DeadlineExceeded
+        from .scheduler import current_context, current_deadline, remaining_time
+        request.update(host=self._host, username=self._username, priority=current_context()[0],
+                       deadline=current_deadline())
+        with self._lock:
+            stream = self._connect()
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded("Deadline passed waiting to send a request to the daemon")
+            self._sock.settimeout(remaining)
+            try:
+                stream.write(json.dumps(request) + "\n")
+                stream.flush()
+                line = stream.readline()
+            except socket.timeout:
+                # a reply that arrives later must not be taken for the next request's
+                self._disconnect()
+                raise DeadlineExceeded("Deadline passed waiting for the daemon")
+            except socket.error as exc:
+                self._disconnect()
+                raise DaemonUnavailable("Lost connection to daemon: %s" % str(exc))
+            if not line:
+                self._disconnect()
+                raise DaemonUnavailable("Daemon closed the connection")
+        reply = json.loads(line)
+        if "unavailable" in reply:
+            raise DaemonUnavailable(reply["unavailable"])
+        if "timed_out" in reply:
+            raise DeadlineExceeded(reply["timed_out"])
+        if "error" in reply:
+            raise IOError(reply.get("errno") or errno.EIO, "Daemon got no response from %s: %s" % (
+                self._host, reply["error"]))
+        return ForwardedResponse(reply)
+
+
+class StashDaemon(object):
+    """
+    Serve requests for a StashRestClient over a Unix socket, caching GET responses for cache_ttl seconds.
+    The socket is created readable and writable by its owner only, since it hands out the owner's access.
+    """
+    def __init__(self, client, socket_path, cache_ttl=DEFAULT_CACHE_TTL):
+        self._client = client
+        self._socket_path = socket_path
+        self._cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._server = None
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def handle(self, request, caller=None):
+        """
+        Turn one decoded request into a reply dictionary.  The request is scheduled at the priority the
+        front end asked for, as the given caller (one per connection), so that when the client has a
+        concurrency limit, one busy front end cannot starve the others.  The request is abandoned if the
+        front end's deadline passes, as it would have been had the front end sent it itself.
+        """
+        from .rest import ResponseError, DeadlineExceeded
+        from .scheduler import request_context
+        if (request.get("host"), request.get("username")) != (self._client._host, self._client._username):
+            return {"unavailable": "Daemon serves %s@%s" % (self._client._username, self._client._host)}
+        kwargs = dict((field, request.get(field)) for field in _REQUEST_FIELDS)
+        is_get = kwargs["method"].lower() == "get"
+        key = json.dumps(kwargs, sort_keys=True)
+        if is_get:
+            reply = self._cached(key)
+            if reply is not None:
+                return reply
+        else:
+            with self._cache_lock:
+                self._cache.clear()
+        try:
+            with request_context(request.get("priority"), caller, request.get("deadline")):
+                resp = self._client._request(**kwargs)
+        except ResponseError as fail:
+            resp = fail.response
+        except DeadlineExceeded as exc:
+            return {"timed_out": str(exc)}
+        except IOError as exc:
+            return {"error": str(exc), "errno": exc.errno}
+        reply = {"status_code": resp.status_code, "reason": resp.reason, "text": resp.text}
+        if is_get and resp.ok:
+            with self._cache_lock:
+                self._cache[key] = (time.time() + self._cache_ttl, reply)
+        return reply
+
+    def serve_forever(self):
+        import SocketServer
+
+        daemon = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                for line in iter(self.rfile.readline, ''):
+                    try:
+                        reply = daemon.handle(json.loads(line), caller=id(self))
+                    except Exception as exc:  # pylint: disable=W0703
+                        logging.exception("Failed to handle daemon request")
+                        reply = {"unavailable": "Daemon failed: %s" % str(exc)}
+                    try:
+                        self.wfile.write(json.dumps(reply, separators=(',', ':')) + "\n")
+                        self.wfile.flush()
+                    except socket.error as exc:
+                        # e.g. the front end's deadline passed, and it hung up rather than wait
+                        logging.debug("Front end went away: %s", str(exc))
+                        return
+
+            def finish(self):
+                try:
+                    SocketServer.StreamRequestHandler.finish(self)
+                except socket.error:
+                    pass  # the reply the front end went away without reading can't be flushed either
+
+        class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            self._server = Server(self._socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
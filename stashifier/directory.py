@@ -0,0 +1,151 @@
+"""
+A local copy of the Stash user directory, for checking and completing user names (e.g. pull request
+reviewers) without a round trip per name.
+
+The directory is fetched a page at a time from the users resource, and cached (one entry per host) in a
+JSON file; names, email addresses and display names (and each word of them) are indexed by lower-case
+prefix.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import time
+from bisect import bisect_left
+
+from .jsonfile import load_object, save_object
+from .rest import UserError
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+_PAGE_SIZE = 1000
+# how similar a misspelled name must be to a single user name for us to assume that user was meant
+_AUTO_RESOLVE_RATIO = 0.8
+_SUGGEST_RATIO = 0.6
+
+
+def _usable_entry(cached):
+    "Whether a host's cache entry is as refresh() writes it (rather than, say, from an older version)."
+    if not isinstance(cached, dict) or not isinstance(cached.get('fetched'), (int, long, float)):
+        return False
+    users = cached.get('users')
+    return isinstance(users, list) and all(isinstance(user, dict) and user.get('name') for user in users)
+
+
+class UserDirectory(object):
+    """
+    The users of a Stash server, fetched on first need (or when the cached copy is more than max_age
+    seconds old, or lacks a name being resolved) and kept in cache_path between runs.
+    """
+    def __init__(self, client, cache_path=None, max_age=DEFAULT_MAX_AGE):
+        self._client = client
+        self._cache_path = cache_path
+        self._max_age = max_age
+        self._users = None
+        self._fetched = None
+        self._refreshed = False
+        self._keys = []
+        self._by_name = {}
+        cached = load_object(cache_path).get(client._host)
+        if _usable_entry(cached):
+            self._set_users(cached['users'], cached['fetched'])
+        elif cached is not None:
+            logging.debug("Ignoring a malformed cache entry for %s in %s", client._host, cache_path)
+
+    def _set_users(self, users, fetched):
+        self._users = users
+        self._fetched = fetched
+        self._by_name = dict((user['name'], user) for user in users)
+        keys = set()
+        for user in users:
+            for text in (user['name'], user.get('email'), user.get('display_name')):
+                if text:
+                    keys.add((text.lower(), user['name']))
+            for word in (user.get('display_name') or "").lower().split()[1:]:
+                keys.add((word, user['name']))
+        self._keys = sorted(keys)
+
+    def refresh(self):
+        "Fetch the whole directory from the server, and update the cache."
+        users = []
+        for page in self._client.iter_user_pages(limit=_PAGE_SIZE):
+            users.extend({'name': user.name, 'display_name': user.display_name, 'email': user.email}
+                         for user in page.entities)
+        logging.debug("Fetched %d users from %s", len(users), self._client._host)
+        self._set_users(users, time.time())
+        self._refreshed = True
+        if self._cache_path:
+            cache = load_object(self._cache_path)
+            cache[self._client._host] = {'fetched': self._fetched, 'users': users}
+            save_object(self._cache_path, cache)
+
+    def _ensure_loaded(self, fresh=False):
+        if self._users is None or (fresh and not self._refreshed and
+                                   time.time() - self._fetched > self._max_age):
+            self.refresh()
+
+    def _lookup(self, prefix, exact=False):
+        names = set()
+        for key, name in self._keys[bisect_left(self._keys, (prefix,)):]:
+            if not key.startswith(prefix) or (exact and key != prefix):
+                break
+            names.add(name)
+        return sorted(names)
+
+    def complete(self, prefix):
+        """
+        Return the (sorted) names of users whose name, email address, or display name or any word of it,
+        starts with prefix, ignoring case.  Uses the cached directory however old it is, so that it is
+        fast enough for shell completion.
+        """
+        self._ensure_loaded()
+        return self._lookup(prefix.lower())
+
+    def describe(self, name):
+        user = self._by_name.get(name) or {}
+        return user.get('display_name') or name
+
+    def _match(self, name):
+        for candidates in (self._lookup(name.lower(), exact=True), self._lookup(name.lower())):
+            if len(candidates) == 1:
+                return candidates[0]
+        return None
+
+    def resolve(self, name):
+        """
+        Return the user name that name refers to: a user name (in any case), email address or display
+        name, an unambiguous prefix of one, or failing all of those, a close misspelling of exactly one
+        user name.  Raises UserError, with suggestions, if there is no such user or more than one.
+        """
+        from difflib import SequenceMatcher, get_close_matches
+        self._ensure_loaded(fresh=True)
+        if name in self._by_name:
+            return name
+        match = self._match(name)
+        if match is None and not self._refreshed:
+            # perhaps the user is newer than our copy of the directory
+            self.refresh()
+            match = self._match(name)
+        if match is not None:
+            return match
+        ambiguous = self._lookup(name.lower())
+        if ambiguous:
+            raise UserError("'%s' could be any of %s" % (name, ", ".join(ambiguous)))
+        by_lower = dict((known.lower(), known) for known in self._by_name)
+        close = get_close_matches(name.lower(), by_lower.keys(), 5, _SUGGEST_RATIO)
+        confident = [key for key in close
+                     if SequenceMatcher(None, name.lower(), key).ratio() >= _AUTO_RESOLVE_RATIO]
+        if len(confident) == 1:
+            return by_lower[confident[0]]
+        hint = " (did you mean %s?)" % ", ".join(by_lower[key] for key in close) if close else ""
+        raise UserError("No Stash user matches '%s'%s" % (name, hint))
@@ -0,0 +1,54 @@
+"""
+The small JSON files the client keeps between runs (statistics and caches): read leniently, since they can
+always be rebuilt, and written atomically, so that no reader (or later run) ever sees half of one.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import logging
+import os
+
+
+def load_object(path):
+    """
+    The JSON object in the file at path, or an empty dictionary if there is no such file, or it can't be
+    read or doesn't hold a JSON object (which is logged, and otherwise treated like a missing file).
+    """
+    if not (path and os.path.exists(path)):
+        return {}
+    try:
+        with open(path) as handle:
+            data = json.load(handle)
+    except (IOError, ValueError) as exc:
+        logging.warning("Ignoring unreadable %s: %s", path, exc)
+        return {}
+    if not isinstance(data, dict):
+        logging.warning("Ignoring %s, which does not hold a JSON object", path)
+        return {}
+    return data
+
+
+def save_object(path, data):
+    "Write data to path as JSON, through a temporary file in the same directory renamed into place."
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path))
+    try:
+        with os.fdopen(handle, 'w') as out:
+            json.dump(data, out, separators=(',', ':'))
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
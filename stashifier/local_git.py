@@ -16,6 +16,8 @@ Utility functions for directly interacting with local git repositories, as neede
 ## limitations under the License.
 
 from subprocess import Popen, PIPE, STDOUT
+import logging
+import os
 import re
 
 
@@ -26,16 +28,28 @@ _URL_SEARCH_STRING = (
     r'(?:(?:~(?P<user>[^/]+)|(?P<project>[^/]+))/)?'  # stash user (~someone) or project (non-tilde cases)
     r'(?P<repo>[^/]+?)(?:\.git)?$'  # and finally, the repository name, optionally including a trailing ".git"
 )
+_URL_PATTERN = re.compile(_URL_SEARCH_STRING)
+
+_SECTION_PATTERN = re.compile(r'^\[\s*([-.\w]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(.*)$')
+_ESCAPES = {'n': '\n', 't': '\t', 'b': '\b', '"': '"', '\\': '\\'}
+
+
+class GitInspectionError(Exception):
+    """
+    The local repository could not be inspected directly (or not completely), and the caller should
+    fall back on asking git itself.
+    """
+    pass
 
 
 # Shamelessly ripped off from a different project, for general utility purposes
-def _backtick(*args):
+def _backtick(*args, **kwargs):
     """
     Run a command and return its output (STDERR and STDOUT).  Raises an exception if the
-    command does not exit normally.
+    command does not exit normally.  A "cwd" keyword argument sets the working directory.
     """
     cmd = args[0] if isinstance(type(args[0]), list) else args
-    prog = Popen(cmd, stdout=PIPE, stderr=STDOUT)
+    prog = Popen(cmd, stdout=PIPE, stderr=STDOUT, cwd=kwargs.get('cwd'))
     # communicate() reads all output then wait()s for the process to exit -- wait() alone can deadlock
     (outdata, _) = prog.communicate()
     retval = prog.returncode
@@ -46,21 +60,180 @@ def _backtick(*args):
     return outdata
 
 
-def get_remote_url(remote="origin"):
-    "Get the URL for a remote (presumably 'origin') from the local git repository."
-    return _backtick('git', 'config', '--get', "remote.%s.url" % remote).strip()
+def _read_file(path):
+    with open(path) as handle:
+        return handle.read().strip()
 
 
-def get_current_branch():
-    "Read the current branch from the local git repository."
-    return _backtick('git', 'rev-parse', '--abbrev-ref', 'HEAD').strip()
+def find_git_dirs(path=None):
+    """
+    Find the git directories for the working tree containing path (default: the current directory),
+    without running git.  Returns a (git_dir, common_dir) pair: they differ only for a linked worktree,
+    whose HEAD lives in its own git directory but whose config and refs live in the common one.
+    """
+    current = os.path.abspath(path or os.getcwd())
+    while True:
+        dot_git = os.path.join(current, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git, dot_git
+        if os.path.isfile(dot_git):
+            contents = _read_file(dot_git)
+            if not contents.startswith('gitdir:'):
+                raise GitInspectionError("Unrecognized .git file in %s" % current)
+            git_dir = os.path.normpath(os.path.join(current, contents[len('gitdir:'):].strip()))
+            common_dir = git_dir
+            if os.path.isfile(os.path.join(git_dir, 'commondir')):
+                common_dir = os.path.normpath(
+                    os.path.join(git_dir, _read_file(os.path.join(git_dir, 'commondir'))))
+            return git_dir, common_dir
+        parent = os.path.dirname(current)
+        if parent == current:
+            raise GitInspectionError("Not inside a git working tree: %s" % path)
+        current = parent
 
 
-def get_project_repo(remote="origin"):
+def _parse_config_value(raw):
     """
-    Extract information about the project/user and remote repository from the local git config.
+    Strip comments, quotes and escapes from a config value (continuation lines are not supported).  As
+    for git, whitespace around the value is dropped, but not whitespace that is quoted or escaped.
+    """
+    value = []
+    # the length of the value up to its last quoted or escaped character, which must not be stripped
+    kept = 0
+    quoted = False
+    idx = 0
+    while idx < len(raw):
+        char = raw[idx]
+        if char == '\\':
+            idx += 1
+            if idx >= len(raw) or raw[idx] not in _ESCAPES:
+                raise GitInspectionError("Unsupported escape in config value %r" % raw)
+            value.append(_ESCAPES[raw[idx]])
+            kept = len(value)
+        elif char == '"':
+            quoted = not quoted
+        elif char in '#;' and not quoted:
+            break
+        elif quoted:
+            value.append(char)
+            kept = len(value)
+        elif value or not char.isspace():
+            value.append(char)
+        idx += 1
+    value = ''.join(value)
+    return value[:kept] + value[kept:].rstrip()
+
+
+def read_git_config(config_path):
+    """
+    Parse a git config file into a dictionary of "section.subsection.key" (or "section.key") names
+    to values; section and key names are lower-cased, as git does, but subsections are not.  For
+    multi-valued keys, the last value wins (as with "git config --get").
+
+    Raises GitInspectionError for files using includes, which only git itself can resolve properly.
+    """
+    values = {}
+    section = None
+    with open(config_path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line.startswith('['):
+                match = _SECTION_PATTERN.match(line)
+                if not match:
+                    raise GitInspectionError("Unsupported section header %r in %s" % (line, config_path))
+                name, subsection, line = match.groups()
+                name = name.lower()
+                if name in ('include', 'includeif'):
+                    raise GitInspectionError("%s uses config includes" % config_path)
+                section = name if subsection is None else "%s.%s" % (name, subsection.replace('\\', ''))
+                if not line or line[0] in '#;':
+                    continue
+            if section is None:
+                raise GitInspectionError("Config entry outside of any section in %s" % config_path)
+            key, sep, raw = line.partition('=')
+            values["%s.%s" % (section, key.strip().lower())] = _parse_config_value(raw) if sep else 'true'
+    return values
+
+
+def read_refs(common_dir):
+    """
+    Read all refs (loose and packed) from a git directory into a dictionary of ref name to commit id.
+    Loose refs take priority over packed ones, as they do for git.
+    """
+    refs = {}
+    packed_path = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_path):
+        with open(packed_path) as handle:
+            for line in handle:
+                if line.startswith(('#', '^')) or not line.strip():
+                    continue  # header, or the peeled commit of the annotated tag on the previous line
+                commit_id, ref_name = line.split(None, 1)
+                refs[ref_name.strip()] = commit_id
+    refs_dir = os.path.join(common_dir, 'refs')
+    for dirpath, _, filenames in os.walk(refs_dir):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            contents = _read_file(full_path)
+            if not contents.startswith('ref:'):
+                ref_name = os.path.relpath(full_path, common_dir).replace(os.sep, '/')
+                refs[ref_name] = contents
+    return refs
+
+
+def _read_remote_url(remote, path):
+    _, common_dir = find_git_dirs(path)
+    url = read_git_config(os.path.join(common_dir, 'config')).get("remote.%s.url" % remote)
+    if url is None:
+        raise GitInspectionError("No URL configured for remote %s" % remote)
+    return url
+
+
+def _read_current_branch(path):
+    git_dir, _ = find_git_dirs(path)
+    head = _read_file(os.path.join(git_dir, 'HEAD'))
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        return ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+    return 'HEAD'  # detached, just as "git rev-parse --abbrev-ref HEAD" would say
+
+
+def get_remote_url(remote="origin", path=None):
+    """
+    Get the URL for a remote (presumably 'origin') from the local git repository, by reading the git
+    config directly if possible and asking git otherwise.
+    """
+    try:
+        return _read_remote_url(remote, path)
+    except (GitInspectionError, EnvironmentError) as exc:
+        logging.debug("Falling back to git for the %s remote URL: %s", remote, str(exc))
+        return _backtick('git', 'config', '--get', "remote.%s.url" % remote, cwd=path).strip()
+
+
+def get_current_branch(path=None):
+    """
+    Read the current branch from the local git repository, by reading HEAD directly if possible and
+    asking git otherwise.
     """
-    url = get_remote_url(remote)
-    url_pattern = re.compile(_URL_SEARCH_STRING)
-    match = re.match(url_pattern, url)
+    try:
+        return _read_current_branch(path)
+    except (GitInspectionError, EnvironmentError) as exc:
+        logging.debug("Falling back to git for the current branch: %s", str(exc))
+        return _backtick('git', 'rev-parse', '--abbrev-ref', 'HEAD', cwd=path).strip()
+
+
+def parse_remote_url(url):
+    """
+    Extract host, protocol, and project/user and repository information from a git remote URL, or
+    return None if it does not look like a Stash URL.
+    """
+    match = _URL_PATTERN.match(url)
     return match.groupdict() if match else None
+
+
+def get_project_repo(remote="origin", path=None):
+    """
+    Extract information about the project/user and remote repository from the local git config.
+    """
+    return parse_remote_url(get_remote_url(remote, path))
@@ -0,0 +1,78 @@
+"""
+Materialize every repository of a project (or user) locally, as bare mirror clones, and keep them
+up to date.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import os
+
+from .concurrency import bounded_imap, DEFAULT_WORKERS
+from .local_git import _backtick, read_refs
+
+CLONED = "cloned"
+FETCHED = "fetched"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+
+def remote_refs(url):
+    """
+    List the refs of a remote repository (without the symbolic HEAD or peeled tag entries), as a
+    dictionary of ref name to commit id.
+    """
+    refs = {}
+    for line in _backtick('git', 'ls-remote', url).splitlines():
+        commit_id, _, ref_name = line.partition('\t')
+        if ref_name.startswith('refs/') and not ref_name.endswith('^{}'):
+            refs[ref_name] = commit_id
+    return refs
+
+
+def mirror_repository(url, path, skip_unchanged=True):
+    """
+    Create or refresh a bare mirror of the repository at url in path, and return CLONED, FETCHED or
+    UNCHANGED.  When skip_unchanged is set, an existing mirror is only fetched if the remote's refs
+    differ from the local ones, which costs one ls-remote instead of a fetch for quiet repositories.
+    """
+    if not os.path.exists(path):
+        _backtick('git', 'clone', '--quiet', '--mirror', url, path)
+        return CLONED
+    if skip_unchanged and remote_refs(url) == read_refs(path):
+        return UNCHANGED
+    _backtick('git', 'remote', 'update', '--prune', cwd=path)
+    return FETCHED
+
+
+def mirror_project(client, dest_root, user=None, project=None, protocol="ssh", workers=DEFAULT_WORKERS,
+                   skip_unchanged=True):
+    """
+    Mirror every repository of a project or user into dest_root/<repository slug>.git, cloning or
+    fetching concurrently on a bounded pool of worker threads.  Generates (repository, status, error)
+    tuples as each repository finishes; failures are reported with status FAILED and do not stop the rest.
+    """
+    if not os.path.isdir(dest_root):
+        os.makedirs(dest_root)
+    repo_list = client.list_repositories(user=user, project=project)
+
+    def mirror(repo):
+        path = os.path.join(dest_root, "%s.git" % repo.slug)
+        try:
+            return repo, mirror_repository(repo.get_clone_url(protocol), path, skip_unchanged), None
+        except Exception as exc:  # pylint: disable=W0703
+            logging.debug("Mirroring %s failed: %s", repo.slug, str(exc))
+            return repo, FAILED, str(exc)
+
+    return bounded_imap(mirror, repo_list.entities, workers)
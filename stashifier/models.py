@@ -17,6 +17,7 @@ to help us conceal the details of that JSON representation from the rest of the
 ## limitations under the License.
 
 import json
+from collections import namedtuple, OrderedDict
 from datetime import datetime
 
 
@@ -47,10 +48,12 @@ class StashError(StashEntity):
 
 class PagedApiResponse(object):
     """
-    Container for multiple PagedApiPage objects.
+    Container for multiple PagedApiPage objects.  is_complete is False if paging stopped before the
+    last page (because the operation ran out of time).
     """
-    def __init__(self, pages):
+    def __init__(self, pages, is_complete=True):
         self._pages = pages
+        self.is_complete = is_complete
         self.page_count = len(pages)
         self.entities = []
         self.values = []
@@ -78,20 +81,56 @@ class PagedApiPage(StashEntity):
         "filter": null,
         "nextPageStart": 3
     }
+
+    The page's entities are its values as entity_class objects (if there is one), or with a Projection,
+    the projection's records instead, which are then its values too: the raw values are not kept.
     """
 
-    def __init__(self, response_data, entity_class=None):
-        super(PagedApiPage, self).__init__(response_data)
-        self.values = response_data['values']
-        if entity_class:
-            self.entities = [entity_class(el) for el in self.values]
+    def __init__(self, response_data, entity_class=None, projection=None):
+        if projection is not None:
+            # keep only the records, not the raw values they were taken from
+            self.values = self.entities = [projection.extract(el) for el in response_data['values']]
+            response_data = dict((key, value) for key, value in response_data.items() if key != 'values')
         else:
-            self.entities = None
+            self.values = response_data['values']
+            if entity_class:
+                self.entities = [entity_class(el) for el in self.values]
+            else:
+                self.entities = None
+        super(PagedApiPage, self).__init__(response_data)
         self.is_last_page = response_data['isLastPage']
         if not self.is_last_page:
             self.next_page_start = response_data['nextPageStart']
 
 
+class Projection(object):
+    """
+    Just the named fields of entity JSON, as lightweight namedtuple records, for listings that need no
+    more than that (e.g. repository names) and would rather not pay for building whole entities.  A dotted
+    field such as "project.key" reaches into nested objects, and becomes the record attribute project_key;
+    fields that are missing come out as None.  (A field that makes no attribute name, such as "from" or a
+    repeated field, becomes a positional attribute such as _0 instead.)
+    """
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._paths = [field.split(".") for field in self.fields]
+        self.record_class = namedtuple("Record", [field.replace(".", "_") for field in self.fields],
+                                       rename=True)
+
+    def extract(self, data):
+        values = []
+        for path in self._paths:
+            value = data
+            for part in path:
+                value = value.get(part) if isinstance(value, dict) else None
+            values.append(value)
+        return self.record_class._make(values)
+
+    def as_dict(self, record):
+        "A record as an ordered dictionary keyed by the (possibly dotted) field names, in field order."
+        return OrderedDict(zip(self.fields, record))
+
+
 class StashIdentifiedEntity(StashEntity):
     """
     Entity with an "id" attribute.  Yes, it's a superclass for that one attribute. Deal.
@@ -128,11 +167,12 @@ class StashProject(StashNamedEntity):
     """
     A project (which is admittedly a pretty boring object).
 
-    No distinguishing characteristics from a User, other than not being (necessarily) a user.
-    Can actually be a user, under some circumstances...
+    No distinguishing characteristics from a User, other than not being (necessarily) a user, and
+    having a key.  Can actually be a user, under some circumstances...
     """
     def __init__(self, *args, **kwargs):
         super(StashProject, self).__init__(*args, **kwargs)
+        self.key = self._get("key")
 
 
 class StashRepo(StashNamedEntity):
@@ -219,3 +259,92 @@ class StashRef(StashIdentifiedEntity):
         self.display_id = self._get("displayId")
         self.commit_id = self._get("latestChangeSet")
         self.repository = StashRepo(self._get("repository"))
+
+
+class StashCommit(StashIdentifiedEntity):
+    """
+    A commit (a "changeset", in older Stash terms).  The author is a StashUser with little more than a
+    name and email address; authored is when the commit was authored, and parents are the ids of its
+    parent commits.
+    """
+    def __init__(self, response_data):
+        super(StashCommit, self).__init__(response_data)
+        self.display_id = self._get("displayId")
+        self.message = self._get("message") or ""
+        self.author = StashUser(self._get("author") or {})
+        self.authored = datetime.fromtimestamp(self._get("authorTimestamp") / 1000.00)
+        self.parents = [parent.get("id") for parent in self._get("parents") or []]
+
+    @property
+    def summary(self):
+        "The first line of the commit message."
+        return self.message.split("\n", 1)[0]
+
+
+class StashChange(StashEntity):
+    """
+    A file changed by a commit or a pull request.  change_type is ADD, MODIFY, DELETE, MOVE or COPY; path
+    is the file's path, and src_path the path it was moved or copied from (None for other changes).
+    """
+    def __init__(self, response_data):
+        super(StashChange, self).__init__(response_data)
+        self.content_id = self._get("contentId")
+        self.change_type = self._get("type")
+        self.node_type = self._get("nodeType")
+        self.path = (self._get("path") or {}).get("toString")
+        self.src_path = (self._get("srcPath") or {}).get("toString")
+
+
+class StashGroup(StashEntity):
+    """
+    A group of users.  Groups have nothing but a name, as far as the API is concerned.
+    """
+    def __init__(self, response_data):
+        super(StashGroup, self).__init__(response_data)
+        self.name = self._get("name")
+
+
+class StashPermission(StashEntity):
+    """
+    A permission (e.g. PROJECT_READ, REPO_WRITE) granted to a user or a group, as listed by the
+    permissions resources of projects and repositories.
+
+    The grantee is a StashUser or StashGroup, and grantee_type is "user" or "group" accordingly;
+    name is the user's name (login) or the group's name.
+    """
+    def __init__(self, response_data):
+        super(StashPermission, self).__init__(response_data)
+        self.permission = self._get("permission")
+        if self._get("user") is not None:
+            self.grantee_type = "user"
+            self.grantee = StashUser(self._get("user"))
+        else:
+            self.grantee_type = "group"
+            self.grantee = StashGroup(self._get("group"))
+        self.name = self.grantee.name
+
+    @property
+    def display_name(self):
+        return getattr(self.grantee, "display_name", None) or self.name
+
+
+class StashWebhookEvent(StashEntity):
+    """
+    An event pushed by a Stash webhook.  Pull request events ("pr:opened", "pr:merged",
+    "pr:reviewer:approved", ...) carry the pull request as it stands after the event; repository events
+    ("repo:refs_changed", "repo:modified", ...) carry the repository ("new" for a modification).
+    """
+    def __init__(self, response_data):
+        super(StashWebhookEvent, self).__init__(response_data)
+        self.event_key = self._get("eventKey") or ""
+        self.date = self._get("date")
+        pr_data = self._get("pullRequest")
+        self.pull_request = StashPullRequest(pr_data) if pr_data else None
+        repo_data = self._get("repository") or self._get("new")
+        self.repository = StashRepo(repo_data) if repo_data else None
+
+    def is_pull_request_event(self):
+        return self.event_key.startswith("pr:")
+
+    def is_deletion(self):
+        return self.event_key in ("pr:deleted", "repo:deleted")
@@ -0,0 +1,61 @@
+"""
+Machine-readable output for the command-line client: compact JSON records, one per line, optionally
+projected down to a chosen set of fields.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+
+_SEPARATORS = (',', ':')
+
+
+def parse_fields(field_list):
+    "Split a comma-separated list of (possibly dotted) field names, or return None for no projection."
+    if not field_list:
+        return None
+    return [field.strip() for field in field_list.split(",") if field.strip()]
+
+
+class JsonLinesWriter(object):
+    """
+    Write JSON objects as compact JSON lines, one buffered write and flush per batch of records, so that
+    output streams as it is produced.
+
+    If fields are given, each record is reduced to just those fields (see models.Projection): a dotted
+    field name such as "author.user.name" reaches into nested objects, and becomes a key of the output
+    as-is.  Records can be JSON objects, or records already projected to the same fields, such as the
+    values of a listing fetched with fields=writer.fields.
+    """
+    def __init__(self, out, fields=None):
+        from .models import Projection
+        self._out = out
+        self.fields = fields
+        self._projection = Projection(fields) if fields else None
+
+    def _project(self, record):
+        if self._projection is None:
+            return record
+        if isinstance(record, dict):
+            record = self._projection.extract(record)
+        return self._projection.as_dict(record)
+
+    def write(self, records):
+        lines = [json.dumps(self._project(record), separators=_SEPARATORS) for record in records]
+        if lines:
+            self._out.write("\n".join(lines) + "\n")
+            self._out.flush()
+
+    def write_one(self, record):
+        self.write([record])
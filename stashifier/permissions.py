@@ -0,0 +1,157 @@
+"""
+Reconcile Stash permissions with a desired access policy: list what is currently granted on each project
+and repository the policy mentions, work out the grants and revocations needed to get from there to the
+policy, and apply just those, concurrently but at a bounded rate.
+
+A policy is a JSON object keyed by project (or PROJECT/repository), each naming the permission every user
+and/or group should have there:
+
+    {
+        "PRJ": {"groups": {"developers": "PROJECT_WRITE"}, "users": {"someone": "PROJECT_ADMIN"}},
+        "PRJ/thing": {"users": {"contractor": "REPO_READ"}}
+    }
+
+Grantees that already have the right permission cost nothing beyond the listing.  With prune, grantees
+that are not in the policy lose their permissions, but only for the kinds of grantee ("users" or
+"groups") that a target lists, so a target with only "users" leaves its groups alone.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import logging
+from collections import namedtuple
+
+from .concurrency import bounded_imap, RateLimiter, DEFAULT_WORKERS
+from .rest import UserError, ResponseError, DeadlineExceeded, _USER_NAMESPACE, _GROUP_NAMESPACE
+from .scheduler import BACKGROUND
+
+GRANT = "grant"
+REVOKE = "revoke"
+
+DEFAULT_RATE = 10.0
+
+_GRANTEE_TYPES = (_USER_NAMESPACE, _GROUP_NAMESPACE)
+
+
+class PermissionChange(namedtuple("PermissionChange", ["action", "project", "repository", "grantee_type",
+                                                       "name", "permission", "current"])):
+    """
+    One grant or revocation needed to reach the policy.  permission is the one to grant (None for a
+    revocation), and current is the permission the grantee has now (None if they have none).
+    """
+    __slots__ = ()
+
+    @property
+    def target(self):
+        return "/".join(part for part in (self.project, self.repository) if part)
+
+    def apply(self, client):
+        if self.action == GRANT:
+            return client.grant_permission(self.grantee_type, self.name, self.permission,
+                                           project=self.project, repository=self.repository)
+        return client.revoke_permission(self.grantee_type, self.name, project=self.project,
+                                        repository=self.repository)
+
+
+def load_policy(policy_file):
+    """
+    Read a policy (as described above) from a file object, and return it as a dictionary of
+    (project, repository) targets, repository being None for a project's own permissions, to
+    dictionaries of grantee type to {name: permission}.
+    """
+    try:
+        raw_policy = json.load(policy_file)
+    except ValueError as exc:
+        raise UserError("Permission policy is not valid JSON: %s" % str(exc))
+    if not isinstance(raw_policy, dict):
+        raise UserError("Permission policy must be a JSON object keyed by project or PROJECT/repository")
+    policy = {}
+    for target, grants in raw_policy.items():
+        project, _, repository = target.partition("/")
+        if not project or not isinstance(grants, dict):
+            raise UserError("Bad permission policy entry for '%s'" % target)
+        unknown = set(grants) - set(_GRANTEE_TYPES)
+        if unknown:
+            raise UserError("Permission policy for '%s' has unknown keys %s (expected %s)" % (
+                target, ", ".join(sorted(unknown)), " or ".join(_GRANTEE_TYPES)))
+        if not all(isinstance(named, dict) for named in grants.values()):
+            raise UserError("Permission policy for '%s' must map each grantee name to a permission" % target)
+        policy[(project, repository or None)] = grants
+    return policy
+
+
+def diff_permissions(desired, current, prune=False):
+    """
+    Compare desired and current {name: permission} dictionaries, and return the (action, name,
+    permission) changes that turn one into the other, in name order.
+    """
+    changes = []
+    for name in sorted(desired):
+        if current.get(name) != desired[name]:
+            changes.append((GRANT, name, desired[name]))
+    if prune:
+        changes.extend((REVOKE, name, None) for name in sorted(set(current) - set(desired)))
+    return changes
+
+
+def plan_changes(client, policy, prune=False, workers=DEFAULT_WORKERS):
+    """
+    List the current permissions of every target in the policy concurrently, and return the list of
+    PermissionChanges needed to bring them in line with it.
+    """
+    tasks = [(project, repository, grantee_type) for (project, repository), grants in sorted(policy.items())
+             for grantee_type in _GRANTEE_TYPES if grantee_type in grants]
+
+    def fetch(task):
+        project, repository, grantee_type = task
+        permissions = client.list_permissions(grantee_type, project=project, repository=repository)
+        return task, dict((grant.name, grant.permission) for grant in permissions.entities)
+
+    changes = []
+    for (project, repository, grantee_type), current in bounded_imap(fetch, tasks, workers,
+                                                                     priority=BACKGROUND):
+        desired = policy[(project, repository)][grantee_type]
+        for action, name, permission in diff_permissions(desired, current, prune):
+            changes.append(PermissionChange(action, project, repository, grantee_type, name, permission,
+                                            current.get(name)))
+    changes.sort(key=lambda change: (change.project, change.repository or "", change.grantee_type,
+                                     change.name))
+    return changes
+
+
+def apply_changes(client, changes, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    """
+    Apply PermissionChanges concurrently, sending at most `rate` requests per second.  Generates
+    (change, error) pairs as each change completes, error being None on success; a failed change does
+    not stop the rest.
+    """
+    limiter = RateLimiter(rate)
+
+    def apply_change(change):
+        limiter.wait()
+        try:
+            change.apply(client)
+            return change, None
+        except ResponseError as fail:
+            logging.debug("Failed to %s %s on %s: %s", change.action, change.name, change.target, str(fail))
+            messages = [error.message for error in fail.get_response_errors() or []]
+            return change, "; ".join(messages) or str(fail)
+        except (IOError, DeadlineExceeded) as exc:
+            # no response (e.g. a connection error, or a failing server's open circuit): the change may or
+            # may not have been applied, which listing the target again will tell
+            logging.debug("Failed to %s %s on %s: %s", change.action, change.name, change.target, str(exc))
+            return change, str(exc)
+
+    return bounded_imap(apply_change, changes, workers, priority=BACKGROUND)
@@ -0,0 +1,194 @@
+"""
+Dry runs as request plans.  A dry-run client sends nothing; instead it records each request it would have
+sent in a RequestPlan, and answers it with a stand-in response, so that paged listings and the
+operations built on them run through to the end.  The plan then reports how many requests and pages the
+operation would cost against the real server, and how long they would take.
+
+The estimates come from RequestStats: the size of each listing and the time per request, as recorded by
+earlier real (not dry) runs against the same server.  Repository listings also remember the repositories
+themselves, so that a dry run of an operation over every repository of a project plans the requests for
+each of them.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import threading
+from collections import Counter
+
+from .jsonfile import load_object, save_object
+
+# the page size Stash uses when none is asked for
+DEFAULT_PAGE_SIZE = 25
+_PAGING_PARAMS = ('start', 'limit')
+
+
+def resource_key(api_url, query_params=None):
+    """
+    Identify a resource (and listing) by its path below the REST API root and its query parameters,
+    leaving out the paging parameters.
+    """
+    path = api_url.split('/rest/api/', 1)[-1].split('/', 1)[-1]
+    params = sorted((name, value) for name, value in (query_params or {}).items()
+                    if name not in _PAGING_PARAMS and value is not None)
+    return path + ("?" + "&".join("%s=%s" % param for param in params) if params else "")
+
+
+def remembered_repository(repo_data):
+    "The parts of a repository's JSON that a dry run needs to plan requests for the repository."
+    return {'id': repo_data.get('id'), 'slug': repo_data.get('slug'), 'name': repo_data.get('name'),
+            'project': {'key': (repo_data.get('project') or {}).get('key')}}
+
+
+class RequestStats(object):
+    """
+    Listing sizes and request timings for one server, kept in a JSON file (shared with other servers)
+    between runs.  A file that can't be read is treated as empty, and overwritten on save.
+    """
+    def __init__(self, path, host):
+        self._path = path
+        self._host = host
+        self._lock = threading.Lock()
+        self._stats = {'listings': {}, 'requests': 0, 'seconds': 0.0}
+        self._dirty = False
+        stored = load_object(path).get(host)
+        if isinstance(stored, dict):
+            self._stats.update(stored)
+
+    def record_request(self, seconds):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['seconds'] += seconds
+            self._dirty = True
+
+    def record_listing(self, key, count, pages, values=None):
+        """
+        Remember the size of a completed listing, and (optionally) stand-in values for its entities; without
+        values, any remembered before are kept.
+        """
+        entry = {'count': count, 'pages': pages}
+        with self._lock:
+            previous = self._stats['listings'].get(key) or {}
+            if values is None and 'values' in previous:
+                values = previous['values']
+            if values is not None:
+                entry['values'] = values
+            self._stats['listings'][key] = entry
+            self._dirty = True
+
+    def listing(self, key):
+        with self._lock:
+            return self._stats['listings'].get(key)
+
+    @property
+    def seconds_per_request(self):
+        with self._lock:
+            if not self._stats['requests']:
+                return None
+            return self._stats['seconds'] / self._stats['requests']
+
+    def save(self):
+        with self._lock:
+            if not (self._path and self._dirty):
+                return
+            everything = load_object(self._path)
+            everything[self._host] = self._stats
+            save_object(self._path, everything)
+            self._dirty = False
+
+
+class PlannedResponse(object):
+    """
+    Just enough of a requests.Response to stand in for one during a dry run: an empty body, or for a
+    listing, a single last page holding whatever stand-in values are known.
+    """
+    status_code = 200
+    reason = "OK (dry run)"
+    ok = True
+
+    def __init__(self, data=None):
+        self.text = json.dumps(data) if data is not None else ""
+
+    def json(self):
+        return json.loads(self.text) if self.text else {}
+
+
+class PlannedRequest(object):
+    "One request of a plan, with the number of pages it is expected to take, if it is a listing."
+    def __init__(self, method, key, request_body, pages=None):
+        self.method = method
+        self.key = key
+        self.request_body = request_body
+        self.pages = pages
+
+    def describe(self):
+        if self.method.lower() != 'get':
+            return "%s %s%s" % (self.method.upper(), self.key,
+                                " with body %s" % self.request_body if self.request_body else "")
+        size = "unknown size" if self.pages is None else "~%d page%s" % (self.pages, "s" * (self.pages != 1))
+        return "GET %s (%s)" % (self.key, size)
+
+
+class RequestPlan(object):
+    """
+    The requests a dry run would have sent, in the order it would have sent them.
+    """
+    def __init__(self, stats=None):
+        self._stats = stats
+        self._lock = threading.Lock()
+        self.requests = []
+
+    def add(self, method, api_url, query_params=None, request_body=None):
+        "Record a request, and return the PlannedResponse that stands in for the server's answer."
+        key = resource_key(api_url, query_params)
+        listing = self._stats.listing(key) if self._stats else None
+        pages = None
+        data = None
+        if method.lower() == 'get':
+            page_size = int((query_params or {}).get('limit') or DEFAULT_PAGE_SIZE)
+            if listing is not None:
+                pages = max(1, -(-listing['count'] // page_size))
+            data = {'values': listing.get('values', []) if listing else [], 'isLastPage': True,
+                    'start': 0, 'size': 0, 'limit': page_size}
+        with self._lock:
+            self.requests.append(PlannedRequest(method, key, request_body, pages))
+        return PlannedResponse(data)
+
+    def report(self, concurrency=1):
+        "Describe the plan, and what it is expected to cost, in human-readable lines."
+        with self._lock:
+            requests = list(self.requests)
+        if not requests:
+            return []
+        lines = ["Planned: %s" % planned.describe() for planned in requests]
+        methods = Counter(planned.method.upper() for planned in requests)
+        listings = [planned for planned in requests if planned.method.lower() == 'get']
+        unknown = sum(1 for planned in listings if planned.pages is None)
+        pages = sum(planned.pages or 1 for planned in listings)
+        total = len(requests) - len(listings) + pages
+        lines.append("Dry run: %d requests planned (%s), estimated %d HTTP calls in all" % (
+            len(requests), ", ".join("%d %s" % (count, method) for method, count in sorted(methods.items())),
+            total))
+        if unknown:
+            lines.append("    %d of %d listings have never been fetched for real, and are counted as one "
+                         "page each" % (unknown, len(listings)))
+        seconds = self._stats.seconds_per_request if self._stats else None
+        if seconds is None:
+            lines.append("    no timings recorded for this server yet: run a real command to get a time "
+                         "estimate")
+        elif total:
+            parallel = seconds + (total - 1) * seconds / max(1, concurrency)
+            lines.append("    estimated time %.1f s at %.2f s per call, or about %.1f s with %d concurrent "
+                         "requests" % (total * seconds, seconds, parallel, concurrency))
+        return lines
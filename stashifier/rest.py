@@ -15,14 +15,20 @@ REST client for Stash.
 ## See the License for the specific language governing permissions and
 ## limitations under the License.
 
-import requests.api
 import json
 import logging
 import os
+import threading
+import time
 
-from .models import PagedApiPage, PagedApiResponse, StashRepo, StashPullRequest, StashError
+# the models, and the modules behind the client's optional machinery (the daemon, dry-run planning,
+# scheduling, transports and circuit breakers), are imported where they are used, so that importing this
+# module (as every command does, for its exceptions) stays cheap
+from .concurrency import bounded_imap, RateLimiter, DEFAULT_WORKERS
 
 STASH_API_VERSION = '1.0'
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
 
 _PROJECT_NAMESPACE = 'projects'
 _USER_NAMESPACE = 'users'
@@ -30,6 +36,10 @@ _GROUP_NAMESPACE = 'groups'
 _REPOSITORY_NAMESPACE = 'repos'
 _PERMISSIONS = 'permissions'
 _PULL_REQUESTS = 'pull-requests'
+_COMMITS = 'commits'
+_CHANGES = 'changes'
+# the largest page iter_commits asks for, so that stopping after a few commits never fetches many more
+_MAX_COMMIT_PAGE = 100
 
 
 class UserError(Exception):
@@ -53,6 +63,7 @@ class ResponseError(Exception):
             self.response.status_code, self.response.reason)
 
     def get_response_errors(self):
+        from .models import StashError
         try:
             return [StashError(error_json) for error_json in self.response.json()['errors']]
         except Exception as exc:
@@ -61,20 +72,89 @@ class ResponseError(Exception):
             return None
 
 
+class DeadlineExceeded(Exception):
+    """
+    The deadline of the operation a request was part of (see scheduler.request_context) passed before
+    the request could be sent, or while waiting for its response.
+    """
+    pass
+
+
+def collect_pages(pages):
+    """
+    Gather a sequence of pages into a PagedApiResponse.  If the operation's deadline passes before the
+    last page, the pages fetched so far are returned as an incomplete response (is_complete is False).
+    """
+    from .models import PagedApiResponse
+    collected = []
+    try:
+        for page in pages:
+            collected.append(page)
+    except DeadlineExceeded as exc:
+        logging.debug("Returning %d pages of a partial listing: %s", len(collected), str(exc))
+        return PagedApiResponse(collected, is_complete=False)
+    return PagedApiResponse(collected)
+
+
 class StashRestClient(object):
     """
     Encapsulate connection logic and host/user/password information in a nice little object.
     """
-    def __init__(self, host=None, username=None, password=None, api_version=STASH_API_VERSION, dry_run=False):
+    def __init__(self, host=None, username=None, password=None, api_version=STASH_API_VERSION, dry_run=False,
+                 daemon=None, max_connections=None, max_concurrency=None, max_rate=None,
+                 circuit_breaker=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, stats=None, transport=None):
         """
         Set up host/username/password information.  If it is not explicitly passed in, assume fallback to the
         old-style global configuration variables.
+
+        If a daemon connection (see stashifier.daemon) is supplied, requests are forwarded through it for as
+        long as it is available, and sent directly otherwise.
+
+        Requests sent directly can be limited to max_connections pooled connections to the server, at most
+        max_concurrency requests in flight at once, and at most max_rate requests per second, however many
+        threads share the client.  Requests waiting for one of the max_concurrency slots are sent in order
+        of priority, and fairly between callers (see stashifier.scheduler).
+
+        While the server keeps failing, requests fail fast with breaker.CircuitOpenError; the circuit breaker
+        is the one shared by all clients of the host, unless another is given.
+
+        Each request gives up after connect_timeout seconds without a connection, or read_timeout seconds
+        without a response, or sooner if the deadline of the operation it belongs to (see
+        scheduler.request_context) comes first, in which case it raises DeadlineExceeded.
+
+        A dry-run client records the requests it would send in self.plan (see stashifier.planner) instead
+        of sending them.  stats, if given, is a planner.RequestStats that real requests and listings are
+        recorded in, and that dry runs estimate their costs from.
+
+        Requests sent directly go through a transport (see stashifier.transport): either the name of one,
+        or a Transport object, such as a transport.MemoryTransport for tests; by default, a pooling session.
         """
+        from .breaker import breaker_for
+        from .scheduler import RequestScheduler
         self._host = host
         self._username = username
         self._password = password
         self._api_version = api_version
         self._dry_run = dry_run
+        self._daemon = daemon
+        if transport is None or isinstance(transport, basestring):
+            from .transport import create_transport, DEFAULT_TRANSPORT
+            transport = create_transport(transport or DEFAULT_TRANSPORT, max_connections)
+        self._transport = transport
+        self._scheduler = RequestScheduler(max_concurrency)
+        self._rate_limiter = RateLimiter(max_rate)
+        self._breaker = circuit_breaker or breaker_for(host)
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self.stats = stats
+        self.plan = None
+        if dry_run:
+            from .planner import RequestPlan
+            self.plan = RequestPlan(stats)
+        # the number of listings cut short by a deadline (see _collect_pages)
+        self.partial_listings = 0
+        self._partial_lock = threading.Lock()
 
     def _set_creds(self):
         '''
@@ -90,6 +170,27 @@ class StashRestClient(object):
             self._username = os.environ["USER"]
         self._password = getpass("Stash password for %s: " % self._username)
 
+    def _timeout(self):
+        """
+        The (connect, read) timeout for a request sent now, shortened to fit the operation's deadline, and
+        whether the deadline was the shorter.  Raises DeadlineExceeded if the deadline has already passed.
+        """
+        from .scheduler import remaining_time
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Deadline passed %.1f seconds ago" % -remaining)
+        if remaining is None or remaining >= self._read_timeout:
+            return (self._connect_timeout, self._read_timeout), False
+        return (min(self._connect_timeout, remaining), remaining), True
+
+    def _collect_pages(self, pages):
+        "collect_pages, counting the listings it cuts short in self.partial_listings."
+        response = collect_pages(pages)
+        if not response.is_complete:
+            with self._partial_lock:
+                self.partial_listings += 1
+        return response
+
     def _create_url(self, user=None, project=None, repository=None, api_path=None):
         if user is not None and project is not None:
             raise UserError("EITHER user or project may be supplied")
@@ -113,22 +214,71 @@ class StashRestClient(object):
         Send an arbitrary request to the Stash server, with appropriate credentials and headers.
         In case of an error, wrap the response in a ResponseError object and raise it.
 
-        If the client was created as a dry-run client, then simply print the method, URL, query parameters
-        and request body, and return (which may cause problems for the caller).
+        If the client was created as a dry-run client, then add the request to the plan instead, and return
+        a stand-in response: an empty body, or for a GET, a last page of whatever stand-in values the
+        plan's statistics hold (usually none).
         """
-        self._set_creds()
+        self._timeout()
+        if self._daemon is not None and not self._dry_run:
+            from .daemon import DaemonUnavailable
+            try:
+                resp = self._daemon.forward(method=method, user=user, project=project, repository=repository,
+                                            api_path=api_path, request_body=request_body,
+                                            query_params=query_params)
+            except DaemonUnavailable as exc:
+                logging.debug("Sending requests directly: %s", str(exc))
+                self._daemon = None
+            else:
+                if not resp.ok:
+                    logging.debug("%s request for %s failed with response body %s", method, api_path,
+                                  resp.text)
+                    raise ResponseError(resp)
+                return resp
         api_url = self._create_url(user=user, project=project, repository=repository, api_path=api_path)
         if self._dry_run:
-            print "%s %s with query %s and body %s" % (method, api_url, query_params, request_body)
-            return None
-        resp = requests.api.request(method,
-                                    api_url,
-                                    auth=(self._username, self._password),
-                                    data=request_body,
-                                    params=query_params,
-                                    # not actually needed for GET/DELETE?
-                                    headers={'Content-type': 'application/json'}
-                                    )
+            logging.debug("Planning %s %s with query %s and body %s", method, api_url, query_params,
+                          request_body)
+            return self.plan.add(method, api_url, query_params, request_body)
+        # only now, since planning a request sends nothing, so needs no password
+        self._set_creds()
+        # fail fast before queueing for a slot, so that callers give up without waiting their turn
+        probe = self._breaker.before_request()
+        cut_short = False
+        try:
+            # the breaker hears how the request ended however it ends, even if it never gets a slot (e.g.
+            # because the deadline passes first), so that a probe is never left outstanding
+            self._scheduler.acquire()
+            try:
+                self._rate_limiter.wait()
+                timeout, cut_short = self._timeout()
+                started = time.time()
+                resp = self._transport.send(method,
+                                            api_url,
+                                            auth=(self._username, self._password),
+                                            data=request_body,
+                                            params=query_params,
+                                            timeout=timeout)
+            finally:
+                self._scheduler.release()
+        except IOError as exc:
+            from .scheduler import remaining_time
+            from .transport import TransportTimeout
+            if cut_short and isinstance(exc, TransportTimeout) and remaining_time() <= 0:
+                # our own deadline, not (necessarily) a sign that the server is in trouble; a connect
+                # timeout that ran out before the deadline did is the server's failure like any other
+                self._breaker.cancel(probe)
+                raise DeadlineExceeded("Deadline passed waiting for %s %s" % (method.upper(), api_url))
+            self._breaker.record_failure()
+            raise
+        except BaseException:
+            self._breaker.cancel(probe)
+            raise
+        if resp.status_code >= 500:
+            self._breaker.record_failure()
+        else:
+            self._breaker.record_success()
+        if self.stats is not None:
+            self.stats.record_request(time.time() - started)
         if not resp.ok:
             logging.debug("%s request for %s failed with response body %s", method, api_url, resp.text)
             raise ResponseError(resp)
@@ -158,13 +308,26 @@ class StashRestClient(object):
         logging.debug("Sending GET query params %s to %s", query_params, api_path)
         return self._request('get', user, project, repository, api_path, query_params=query_params)
 
+    def put(self, user=None, project=None, repository=None, api_path=None, query_params=None):
+        logging.debug("Sending PUT query params %s to %s", query_params, api_path)
+        return self._request('put', user, project, repository, api_path, query_params=query_params)
+
     def delete(self, user=None, project=None, repository=None, api_path=None, query_params=None):
         logging.debug("Sending DELETE query params %s to %s", query_params, api_path)
         return self._request('delete', user, project, repository, api_path, query_params=query_params)
 
-    def get_paged(self, user=None, project=None, repository=None, api_path=None, query_params=None,
-                  entity_class=None, limit=None, start=None):
-        response_pages = []
+    def iter_paged(self, user=None, project=None, repository=None, api_path=None, query_params=None,
+                   entity_class=None, limit=None, start=None, fields=None):
+        """
+        Generate the pages of a paged response one PagedApiPage at a time.  Each page is only requested
+        once the previous one has been consumed, so a caller that stops iterating early (or closes the
+        generator) never pays for the remaining pages.
+
+        If fields are given, the pages hold records of just those fields (see models.Projection) instead
+        of entity_class entities.
+        """
+        from .models import PagedApiPage, Projection
+        projection = Projection(fields) if fields else None
         request_params = {}
         if query_params:
             request_params.update(query_params)
@@ -180,16 +343,33 @@ class StashRestClient(object):
         elif 'limit' in request_params:
             del request_params['limit']
 
+        # remember how big complete listings are, so that dry runs can estimate their cost
+        record = self.stats is not None and not self._dry_run and not start
+        count = pages = 0
+        remembered = [] if record and projection is None and api_path == [_REPOSITORY_NAMESPACE] else None
         while True:
             resp = self.get(user=user, project=project, repository=repository,
                             query_params=request_params, api_path=api_path)
-            new_page = PagedApiPage(resp.json(), entity_class)
-            response_pages.append(new_page)
+            new_page = PagedApiPage(resp.json(), entity_class, projection)
+            count += len(new_page.values)
+            pages += 1
+            if remembered is not None:
+                from .planner import remembered_repository
+                remembered.extend(remembered_repository(value) for value in new_page.values)
+            yield new_page
             if new_page.is_last_page:
                 break
             else:
                 request_params['start'] = new_page.next_page_start
-        return PagedApiResponse(response_pages)
+        if record:
+            from .planner import resource_key
+            self.stats.record_listing(resource_key(self._create_url(user, project, repository, api_path),
+                                                   query_params), count, pages, remembered)
+
+    def get_paged(self, user=None, project=None, repository=None, api_path=None, query_params=None,
+                  entity_class=None, limit=None, start=None, fields=None):
+        return self._collect_pages(self.iter_paged(user, project, repository, api_path, query_params,
+                                                   entity_class, limit, start, fields))
 
     ################
     # FUNCTIONAL API
@@ -215,13 +395,28 @@ class StashRestClient(object):
         return self.post_json(post_data=post_data, user=user, project=project,
                               api_path=[_REPOSITORY_NAMESPACE])
 
-    def list_repositories(self, user=None, project=None, limit=None):
+    def iter_repository_pages(self, user=None, project=None, limit=None, fields=None):
+        """
+        Generate the pages of a repository listing (of StashRepo entities, or records of just the given
+        fields) as they are fetched.
+        """
+        from .models import StashRepo
         if user is None and project is None:
             raise UserError("Repository list needs a project or a user")
-        return self.get_paged(user, project,
-                              api_path=[_REPOSITORY_NAMESPACE], entity_class=StashRepo, limit=limit)
+        return self.iter_paged(user, project, api_path=[_REPOSITORY_NAMESPACE], entity_class=StashRepo,
+                               limit=limit, fields=fields)
+
+    def list_repositories(self, user=None, project=None, limit=None, fields=None):
+        return self._collect_pages(self.iter_repository_pages(user=user, project=project, limit=limit,
+                                                              fields=fields))
 
-    def list_pull_requests(self, user=None, project=None, repository=None, state=None):
+    def iter_pull_request_pages(self, user=None, project=None, repository=None, state=None, limit=None,
+                                fields=None):
+        """
+        Generate the pages of a pull request listing (of StashPullRequest entities, or records of just the
+        given fields) as they are fetched.
+        """
+        from .models import StashPullRequest
         if user is None and project is None:
             raise UserError("Pull request list needs a project or a user")
         if repository is None:
@@ -231,8 +426,127 @@ class StashRestClient(object):
         # "withAttributes" (basically count open tasks), "withProperties" (not clear this does anything...)
         if state is not None:
             query_params['state'] = state
-        return self.get_paged(user, project, repository, api_path=[_PULL_REQUESTS], query_params=query_params,
-                              entity_class=StashPullRequest)
+        return self.iter_paged(user, project, repository, api_path=[_PULL_REQUESTS],
+                               query_params=query_params, entity_class=StashPullRequest, limit=limit,
+                               fields=fields)
+
+    def list_pull_requests(self, user=None, project=None, repository=None, state=None, limit=None,
+                           fields=None):
+        return self._collect_pages(self.iter_pull_request_pages(user=user, project=project,
+                                                                repository=repository, state=state,
+                                                                limit=limit, fields=fields))
+
+    def list_all_pull_requests(self, user=None, project=None, state=None, workers=DEFAULT_WORKERS,
+                               skipped=None):
+        """
+        Generate (repository, pull request) pairs for every repository belonging to a project or user.
+        Each repository's pull requests are fetched on a bounded pool of worker threads, and are yielded
+        as soon as that repository is done, so output can start long before the slowest repository.
+
+        Repositories whose pull requests cannot be listed (e.g. for lack of permission) are logged and
+        skipped, and appended to the skipped list, if one is given.  So are repositories whose listing
+        the deadline cut short, though the pull requests fetched by then are still generated.
+        """
+        from .scheduler import BACKGROUND
+        repo_list = self.list_repositories(user=user, project=project)
+
+        def fetch(repo):
+            try:
+                return repo, self.list_pull_requests(user=user, project=project, repository=repo.slug,
+                                                     state=state)
+            except ResponseError as fail:
+                logging.warning("Skipping pull requests for %s: %s", repo.slug, str(fail))
+                return repo, None
+
+        for repo, pr_list in bounded_imap(fetch, repo_list.entities, workers, priority=BACKGROUND):
+            if pr_list is None or not pr_list.is_complete:
+                if skipped is not None:
+                    skipped.append(repo)
+                if pr_list is None:
+                    continue
+                logging.warning("Pull requests for %s are incomplete: the deadline passed", repo.slug)
+            for pull_req in pr_list.entities:
+                yield repo, pull_req
+
+    def iter_commit_pages(self, user=None, project=None, repository=None, pull_request=None, since=None,
+                          until=None, path=None, limit=None, fields=None):
+        """
+        Generate the pages of a repository's commits, newest first (as StashCommit entities, or records of
+        just the given fields), as they are fetched; or of the commits of the pull request with the given
+        id.  As in Stash, the commits listed are those reachable from until (a commit id or ref; by default,
+        the head of the default branch) but not from since, and only those that touched path, if given.
+        """
+        from .models import StashCommit
+        if user is None and project is None:
+            raise UserError("Commit list needs a project or a user")
+        if repository is None:
+            raise UserError("Commit list needs a repository name")
+        if pull_request is not None:
+            if since or until or path:
+                raise UserError("A pull request's commits cannot be limited by since, until or path")
+            return self.iter_paged(user, project, repository, api_path=[_PULL_REQUESTS, str(pull_request),
+                                                                        _COMMITS],
+                                   entity_class=StashCommit, limit=limit, fields=fields)
+        bounds = (('since', since), ('until', until), ('path', path))
+        query_params = dict((name, value) for name, value in bounds if value)
+        return self.iter_paged(user, project, repository, api_path=[_COMMITS], query_params=query_params,
+                               entity_class=StashCommit, limit=limit, fields=fields)
+
+    def list_commits(self, user=None, project=None, repository=None, pull_request=None, since=None,
+                     until=None, path=None, limit=None, fields=None):
+        return self._collect_pages(self.iter_commit_pages(user=user, project=project, repository=repository,
+                                                          pull_request=pull_request, since=since,
+                                                          until=until, path=path, limit=limit, fields=fields))
+
+    def iter_commits(self, user=None, project=None, repository=None, pull_request=None, since=None,
+                     until=None, path=None, max_count=None, fields=None):
+        """
+        Generate commits (as iter_commit_pages lists them) one at a time, fetching each page only once the
+        previous one is used up, and stopping after max_count commits if it is given: a caller can walk
+        back through a long history, and stop wherever it likes, holding only one page at a time.
+        """
+        limit = min(max_count, _MAX_COMMIT_PAGE) if max_count else None
+        pages = self.iter_commit_pages(user=user, project=project, repository=repository,
+                                       pull_request=pull_request, since=since, until=until, path=path,
+                                       limit=limit, fields=fields)
+        count = 0
+        try:
+            for page in pages:
+                for commit in page.entities:
+                    yield commit
+                    count += 1
+                    if count == max_count:
+                        return
+        finally:
+            pages.close()
+
+    def iter_change_pages(self, user=None, project=None, repository=None, commit=None, pull_request=None,
+                          since=None, limit=None, fields=None):
+        """
+        Generate the pages of the files changed (as StashChange entities, or records of just the given
+        fields) by a commit, compared with since (a commit id or ref; by default the commit's first parent),
+        or by the pull request with the given id.
+        """
+        from .models import StashChange
+        if user is None and project is None:
+            raise UserError("Change list needs a project or a user")
+        if repository is None:
+            raise UserError("Change list needs a repository name")
+        if (commit is None) == (pull_request is None):
+            raise UserError("Change list needs EITHER a commit or a pull request")
+        if pull_request is not None:
+            api_path = [_PULL_REQUESTS, str(pull_request), _CHANGES]
+        else:
+            api_path = [_COMMITS, commit, _CHANGES]
+        return self.iter_paged(user, project, repository, api_path=api_path,
+                               query_params={'since': since} if since else None, entity_class=StashChange,
+                               limit=limit, fields=fields)
+
+    def list_changes(self, user=None, project=None, repository=None, commit=None, pull_request=None,
+                     since=None, limit=None, fields=None):
+        return self._collect_pages(self.iter_change_pages(user=user, project=project, repository=repository,
+                                                          commit=commit, pull_request=pull_request,
+                                                          since=since, limit=limit, fields=fields))
 
     def create_pull_request(self, pr_data, user=None, project=None, repository=None):
         """The hackiest hack that ever hacked"""
@@ -248,29 +562,110 @@ class StashRestClient(object):
         # "existingPullRequest": {pr_object}
         return self.post_json(user, project, repository, api_path=[_PULL_REQUESTS], post_data=pr_data)
 
-    def list_user_permissions(self, user=None, project=None, filter_on=None):
-        return self.list_permissions(_USER_NAMESPACE, user=user, project=project, filter_on=filter_on)
+    def iter_user_pages(self, filter_on=None, limit=None, fields=None):
+        """
+        Generate the pages (of StashUser entities, or records of just the given fields) of the server's
+        user directory, optionally only users whose name, display name or email address contains filter_on.
+        """
+        from .models import StashUser
+        query_params = {'filter': filter_on} if filter_on else None
+        return self.iter_paged(api_path=[_USER_NAMESPACE], query_params=query_params, entity_class=StashUser,
+                               limit=limit, fields=fields)
+
+    def list_users(self, filter_on=None, limit=None, fields=None):
+        return self._collect_pages(self.iter_user_pages(filter_on=filter_on, limit=limit, fields=fields))
+
+    def list_user_permissions(self, user=None, project=None, filter_on=None, repository=None):
+        return self.list_permissions(_USER_NAMESPACE, user=user, project=project, repository=repository,
+                                     filter_on=filter_on)
 
-    def list_group_permissions(self, user=None, project=None, filter_on=None):
-        return self.list_permissions(_GROUP_NAMESPACE, user=user, project=project, filter_on=filter_on)
+    def list_group_permissions(self, user=None, project=None, filter_on=None, repository=None):
+        return self.list_permissions(_GROUP_NAMESPACE, user=user, project=project, repository=repository,
+                                     filter_on=filter_on)
 
-    def list_permissions(self, grantee_type, user=None, project=None, filter_on=None):
-        if project is None:
+    def iter_permission_pages(self, grantee_type, user=None, project=None, filter_on=None, limit=None,
+                              repository=None, fields=None):
+        """
+        Generate the pages (of StashPermission entities, or records of just the given fields) of the
+        permissions granted to users or groups (grantee_type) on a project, or on a repository if one is
+        given.
+        """
+        from .models import StashPermission
+        if repository is None and project is None:
             raise UserError("Listing project permissions needs a project")
-        post_data = {'filter': filter_on} if filter_on else None
-        resp = self.get(query_params=post_data, user=user, project=project,
-                        api_path=[_PERMISSIONS, grantee_type])
-        if resp.text:
-            values = resp.json()["values"]
-            for value in values:
-                # not hackish at all....
-                if "user" in value:
-                    display_name = value["user"]["displayName"]
-                else:
-                    display_name = value["group"]["name"]
-                print "%s : %s" % (display_name, value["permission"])
-        else:
-            print "List users attempt failed with status %d: %s" % (resp.status_code, resp.reason)
+        if repository is not None and user is None and project is None:
+            raise UserError("Listing repository permissions needs a project or a user")
+        query_params = {'filter': filter_on} if filter_on else None
+        return self.iter_paged(user, project, repository, api_path=[_PERMISSIONS, grantee_type],
+                               query_params=query_params, entity_class=StashPermission, limit=limit,
+                               fields=fields)
+
+    def list_permissions(self, grantee_type, user=None, project=None, filter_on=None, limit=None,
+                         repository=None):
+        return self._collect_pages(self.iter_permission_pages(grantee_type, user=user, project=project,
+                                                              repository=repository, filter_on=filter_on,
+                                                              limit=limit))
+
+    def grant_permission(self, grantee_type, name, permission, user=None, project=None, repository=None):
+        """
+        Grant a permission (e.g. PROJECT_WRITE, REPO_ADMIN) on a project, or on a repository if one is
+        given, to the user or group (grantee_type) with the given name, replacing any permission they had.
+        """
+        if repository is None and project is None:
+            raise UserError("Granting project permissions needs a project")
+        if not name or not permission:
+            raise UserError("Granting a permission needs a grantee name and a permission")
+        return self.put(user, project, repository, api_path=[_PERMISSIONS, grantee_type],
+                        query_params={'name': name, 'permission': permission})
+
+    def revoke_permission(self, grantee_type, name, user=None, project=None, repository=None):
+        "Revoke every permission the user or group (grantee_type) has on a project or repository."
+        if repository is None and project is None:
+            raise UserError("Revoking project permissions needs a project")
+        if not name:
+            raise UserError("Revoking a permission needs a grantee name")
+        return self.delete(user, project, repository, api_path=[_PERMISSIONS, grantee_type],
+                           query_params={'name': name})
+
+    def audit_permissions(self, targets, include_repositories=False, workers=DEFAULT_WORKERS):
+        """
+        Fetch both user and group permissions for many projects and repositories concurrently.  targets
+        is a sequence of (project, repository) pairs, where the repository is None for the project's own
+        permissions; with include_repositories, every repository of each such project is audited too.
+        Generates (project, repository, StashPermission) tuples as each listing completes; targets that
+        cannot be read are logged and skipped.
+        """
+        from .scheduler import BACKGROUND
+        targets = list(targets)
+        if include_repositories:
+            projects = sorted(set(project for project, repository in targets if repository is None))
+
+            def list_repositories(project):
+                try:
+                    return project, self.list_repositories(project=project).entities
+                except ResponseError as fail:
+                    logging.warning("Skipping the repositories of %s: %s", project, str(fail))
+                    return project, []
+
+            for project, repos in bounded_imap(list_repositories, projects, workers, priority=BACKGROUND):
+                targets.extend((project, repo.slug) for repo in repos)
+        tasks = [(project, repository, grantee_type) for project, repository in targets
+                 for grantee_type in (_USER_NAMESPACE, _GROUP_NAMESPACE)]
+
+        def fetch(task):
+            project, repository, grantee_type = task
+            try:
+                permissions = self.list_permissions(grantee_type, project=project, repository=repository)
+                return task, permissions.entities
+            except ResponseError as fail:
+                logging.warning("Skipping %s permissions for %s: %s", grantee_type[:-1],
+                                "/".join(part for part in (project, repository) if part), str(fail))
+                return task, []
+
+        results = bounded_imap(fetch, tasks, workers, priority=BACKGROUND)
+        for (project, repository, _), permissions in results:
+            for permission in permissions:
+                yield project, repository, permission
 
     def delete_repository(self, repository_name, user=None, project=None):
         if(repository_name is None):
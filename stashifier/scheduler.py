@@ -0,0 +1,190 @@
+"""
+Scheduling of requests from a shared client: when more requests are waiting than the client's concurrency
+limit allows in flight, the next one to go is taken from the most urgent priority class that has any, and
+within a class, from each waiting caller in turn, so that one caller's thousand queued listings cannot
+starve another caller's single request.
+
+The priority and caller of a request come from the thread that sends it (see request_context), as does
+its deadline, if any: the time by which the whole operation it is part of should be done.  Worker pools
+started with concurrency.bounded_imap carry all three over from the thread that started them.  A thread
+that sets nothing sends NORMAL requests as a caller of its own, with no deadline.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+PRIORITIES = {"interactive": INTERACTIVE, "normal": NORMAL, "background": BACKGROUND}
+
+# how long a waiting thread sleeps between checks, so that it can still be interrupted (python 2 does not
+# deliver KeyboardInterrupt to a thread blocked in an untimed wait)
+_WAIT_INTERVAL = 1.0
+
+_context = threading.local()
+
+
+def explicit_priority():
+    "The priority set for this thread with set_request_context or request_context, or None."
+    return getattr(_context, 'priority', None)
+
+
+def current_context():
+    "The (priority, caller) that requests sent by this thread are scheduled with."
+    priority = explicit_priority()
+    caller = getattr(_context, 'caller', None)
+    return (NORMAL if priority is None else priority,
+            threading.current_thread().ident if caller is None else caller)
+
+
+def current_deadline():
+    "The time (as from time.time) by which requests sent by this thread must be done, or None."
+    return getattr(_context, 'deadline', None)
+
+
+def remaining_time():
+    "Seconds left until this thread's deadline (possibly negative), or None if it has none."
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.time()
+
+
+def set_request_context(priority=None, caller=None, deadline=None):
+    """
+    Set the priority, caller and/or deadline of the requests this thread sends from now on.  A deadline
+    can only be brought forward, never put back.
+    """
+    if priority is not None:
+        _context.priority = priority
+    if caller is not None:
+        _context.caller = caller
+    if deadline is not None and (current_deadline() is None or deadline < current_deadline()):
+        _context.deadline = deadline
+
+
+@contextmanager
+def request_context(priority=None, caller=None, deadline=None):
+    "Set the priority, caller and/or deadline of this thread's requests for the duration of a with block."
+    saved = (getattr(_context, 'priority', None), getattr(_context, 'caller', None), current_deadline())
+    set_request_context(priority, caller, deadline)
+    try:
+        yield
+    finally:
+        _context.priority, _context.caller, _context.deadline = saved
+
+
+class _Ticket(object):
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class RequestScheduler(object):
+    """
+    Admit at most max_concurrency requests at a time (any number, if it is None), in priority order and
+    round-robin across the callers within a priority class.
+    """
+    def __init__(self, max_concurrency=None):
+        self._max_concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._active = 0
+        # priority -> caller -> waiting tickets, callers in the order they will next be served
+        self._waiting = {}
+
+    @property
+    def waiting(self):
+        with self._cond:
+            return sum(len(tickets) for callers in self._waiting.values() for tickets in callers.values())
+
+    def _next_ticket(self):
+        if not self._waiting:
+            return None
+        priority = min(self._waiting)
+        callers = self._waiting[priority]
+        caller, tickets = next(callers.iteritems())
+        ticket = tickets.popleft()
+        # the caller goes to the back of the line for its next request
+        del callers[caller]
+        if tickets:
+            callers[caller] = tickets
+        if not callers:
+            del self._waiting[priority]
+        return ticket
+
+    def _dispatch(self):
+        granted = False
+        while self._max_concurrency is None or self._active < self._max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._active += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, ticket, priority, caller):
+        tickets = self._waiting[priority][caller]
+        tickets.remove(ticket)
+        if not tickets:
+            del self._waiting[priority][caller]
+            if not self._waiting[priority]:
+                del self._waiting[priority]
+
+    def acquire(self, priority=None, caller=None):
+        """
+        Wait for a turn to send a request, at the priority and as the caller given (by default, those of
+        the current thread's context).  Every acquire must be followed by a release, unless it raises
+        rest.DeadlineExceeded, as it does if the thread's deadline passes before its turn comes.
+        """
+        if self._max_concurrency is None:
+            return
+        context_priority, context_caller = current_context()
+        priority = context_priority if priority is None else priority
+        caller = context_caller if caller is None else caller
+        ticket = _Ticket()
+        with self._cond:
+            self._waiting.setdefault(priority, OrderedDict()).setdefault(caller, deque()).append(ticket)
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= 0:
+                        self._withdraw(ticket, priority, caller)
+                        break
+                    self._cond.wait(_WAIT_INTERVAL if remaining is None else min(_WAIT_INTERVAL, remaining))
+            except BaseException:
+                if ticket.granted:
+                    self._active -= 1
+                    self._dispatch()
+                else:
+                    self._withdraw(ticket, priority, caller)
+                raise
+        if not ticket.granted:
+            # imported here (and outside the lock), since the REST client imports this module
+            from .rest import DeadlineExceeded
+            raise DeadlineExceeded("Deadline passed waiting for a turn to send a request")
+
+    def release(self):
+        if self._max_concurrency is None:
+            return
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
@@ -0,0 +1,179 @@
+"""
+Several Stash servers at once: a pool of clients, one per configured server, each with its own
+credentials and connection, concurrency and rate limits, and a fan-out that runs the same call against
+every server in parallel and tags each result with the server it came from.
+
+Servers are configured in ~/.stashclientcfg.  The [server] section is the default server, named by its
+hostname; any number of others can be added in sections named [server:<name>]:
+
+    [server]
+    hostname=stash.example.com
+
+    [server:acquisitions]
+    hostname=stash.acquired.example.com
+    user=someone
+    max_connections=4
+    max_concurrency=4
+    max_rate=5
+    connect_timeout=5
+    read_timeout=30
+    transport=http2
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import os
+from collections import namedtuple
+
+from .concurrency import bounded_imap
+from .rest import StashRestClient, UserError, ResponseError
+
+_SERVER_SECTION = 'server'
+_SERVER_SECTION_PREFIX = 'server:'
+# per-server options that become StashRestClient keyword arguments, and how to read them
+_LIMIT_OPTIONS = (('max_connections', int), ('max_concurrency', int), ('max_rate', float),
+                  ('connect_timeout', float), ('read_timeout', float), ('transport', str))
+
+
+class HostResult(namedtuple("HostResult", ["host", "items", "error"])):
+    """
+    The outcome of a fanned-out call on one server: the items it produced (entities, for paged
+    listings), or None and the error that stopped it.
+    """
+    __slots__ = ()
+
+
+def client_limits(config, section):
+    """
+    Read the connection, concurrency, rate and timeout limits, and the transport, set (if any) in a config
+    server section.
+    """
+    limits = {}
+    for option, convert in _LIMIT_OPTIONS:
+        if config.has_option(section, option):
+            try:
+                limits[option] = convert(config.get(section, option))
+            except ValueError:
+                raise UserError("Bad %s for [%s] in configuration: %s" % (option, section,
+                                                                          config.get(section, option)))
+    return limits
+
+
+def server_settings(config, name=None, hostname=None, username=None):
+    """
+    The hostname, user name and client limits (see client_limits) of the server configured in the
+    [server:<name>] section, or in the [server] section if no name is given.  hostname and username, if
+    given, override the configured ones; the user name falls back on $USER.
+    """
+    section = _SERVER_SECTION
+    if name:
+        section = _SERVER_SECTION_PREFIX + name
+        if not config.has_section(section):
+            raise UserError("No [%s] section in configuration file" % section)
+    # All this elaborate if-else is because config.get() doesn't take a "default" argument
+    if hostname is None:
+        if not config.has_option(section, 'hostname'):
+            raise UserError("Server must be set, either via configuration file or command-line option.")
+        hostname = config.get(section, 'hostname')
+    if username is None:
+        username = config.get(section, 'user') if config.has_option(section, 'user') else os.environ["USER"]
+    return hostname, username, client_limits(config, section) if config.has_section(section) else {}
+
+
+def _result_items(result):
+    from .models import PagedApiResponse
+    if isinstance(result, PagedApiResponse):
+        return result.entities if result.entities else result.values
+    if result is None or isinstance(result, (dict, basestring)) or not hasattr(result, '__iter__'):
+        return [result]
+    return list(result)
+
+
+class ClientPool(object):
+    """
+    A StashRestClient per server name.  Each client keeps its own limits, so that a slow or small server
+    is not overwhelmed by a fan-out that a large one takes in its stride.
+    """
+    def __init__(self, clients):
+        if not clients:
+            raise UserError("No Stash servers configured")
+        self._clients = clients
+
+    @classmethod
+    def from_config(cls, config, username=None, dry_run=False):
+        """
+        Create a client for the [server] section (if it names a hostname) and every [server:<name>] section
+        of a configuration; username, if given, overrides the configured users.
+        """
+        clients = {}
+        for section in config.sections():
+            if section == _SERVER_SECTION:
+                if not config.has_option(section, 'hostname'):
+                    continue
+                name = config.get(section, 'hostname')
+            elif section.startswith(_SERVER_SECTION_PREFIX):
+                name = section[len(_SERVER_SECTION_PREFIX):]
+                if not config.has_option(section, 'hostname'):
+                    raise UserError("No hostname for [%s] in configuration" % section)
+            else:
+                continue
+            user = username
+            if user is None and config.has_option(section, 'user'):
+                user = config.get(section, 'user')
+            clients[name] = StashRestClient(config.get(section, 'hostname'), user or os.environ["USER"],
+                                            dry_run=dry_run, **client_limits(config, section))
+        return cls(clients)
+
+    @property
+    def names(self):
+        return sorted(self._clients)
+
+    def client(self, name):
+        try:
+            return self._clients[name]
+        except KeyError:
+            raise UserError("Unknown Stash server '%s'; configured servers are %s" % (
+                name, ", ".join(self.names)))
+
+    def fan_out(self, method_name, *args, **kwargs):
+        """
+        Call the named StashRestClient method with the same arguments on every server concurrently, and
+        generate a HostResult for each server as soon as it completes.  Paged listings produce their
+        entities, and generators (e.g. list_all_pull_requests) everything they generate.  A server that
+        fails (with a ResponseError, or without responding at all) produces its error instead, and does not
+        stop the others.
+        """
+        # passwords are prompted for one server at a time, before any of the threads start (and not at
+        # all for a dry run, which sends nothing)
+        for name in self.names:
+            if not self._clients[name]._dry_run:
+                self._clients[name]._set_creds()
+
+        def call(name):
+            method = getattr(self._clients[name], method_name)
+            try:
+                items = _result_items(method(*args, **kwargs))
+            except (ResponseError, IOError) as exc:
+                logging.warning("%s failed on %s: %s", method_name, name, str(exc))
+                return HostResult(name, None, exc)
+            return HostResult(name, items, None)
+
+        return bounded_imap(call, self.names, len(self._clients))
+
+    def merged(self, method_name, *args, **kwargs):
+        "Generate (server name, item) pairs for everything a fan_out of the call produces."
+        for result in self.fan_out(method_name, *args, **kwargs):
+            for item in result.items or []:
+                yield result.host, item
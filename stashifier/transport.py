@@ -0,0 +1,213 @@
+"""
+Transports: the interchangeable layer under StashRestClient that actually sends requests and returns
+responses.
+
+    requests   a fresh connection per request (plain requests.request)
+    session    a requests session, pooling and reusing connections (the default)
+    http2      HTTP/2, with every concurrent request multiplexed over a single connection per server; needs
+               the optional hyper package, and does not support timeouts (see Http2Transport)
+    memory     no network at all: responses come from routes registered in the transport (for tests)
+
+A transport's send returns a response with status_code, reason, ok, text and json(), and raises an
+IOError if no response was received at all (TransportTimeout if that was because of a timeout).
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import json
+import re
+import socket
+import threading
+
+DEFAULT_TRANSPORT = "session"
+_HEADERS = {'Content-type': 'application/json'}
+
+
+class TransportTimeout(IOError):
+    "No response arrived within the request's timeout."
+    pass
+
+
+class Transport(object):
+    """
+    Base class for transports.  Subclasses implement send, and must be safe to call from many threads.
+    """
+    def send(self, method, url, auth=None, data=None, params=None, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    Send each request with requests.request, on a connection of its own.
+    """
+    def _send(self, method, url, **kwargs):
+        # requests takes longer to import than everything else the CLI loads put together, so only pay for
+        # it when a request is actually sent
+        import requests
+        return requests.request(method, url, **kwargs)
+
+    def send(self, method, url, auth=None, data=None, params=None, timeout=None):
+        from requests.exceptions import Timeout
+        try:
+            return self._send(method, url, auth=auth, data=data, params=params, timeout=timeout,
+                              headers=_HEADERS)
+        except (Timeout, socket.timeout) as exc:
+            raise TransportTimeout(str(exc))
+
+
+class SessionTransport(RequestsTransport):
+    """
+    Send requests through one requests session, shared by every thread, so that connections to the server
+    are pooled and reused rather than re-established per request.  With max_connections, the pool holds
+    at most that many connections, and requests beyond that wait for one to be free.
+    """
+    def __init__(self, max_connections=None):
+        self._max_connections = max_connections
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _mount_adapters(self, session):
+        import requests
+        if self._max_connections:
+            # block for a free connection rather than opening (and discarding) extra ones
+            session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=self._max_connections,
+                                                                    pool_block=True))
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self._mount_adapters(self._session)
+            return self._session
+
+    def _send(self, method, url, **kwargs):
+        return self._get_session().request(method, url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class Http2Transport(SessionTransport):
+    """
+    A requests session that speaks HTTP/2 to https servers (through hyper's adapter), so that concurrent
+    requests share one connection per server as multiplexed streams, however many of them are in flight.
+
+    hyper's adapter ignores the timeout, so a request over HTTP/2 waits for its response for as long as it
+    takes: the client's read timeout and operation deadlines are only checked before each request is sent.
+    """
+    def __init__(self, max_connections=None):
+        super(Http2Transport, self).__init__(max_connections)
+        try:
+            import hyper.contrib
+        except ImportError:
+            from .rest import UserError
+            raise UserError("The http2 transport needs the hyper package (pip install hyper)")
+        self._adapter_class = hyper.contrib.HTTP20Adapter
+
+    def _mount_adapters(self, session):
+        session.mount('https://', self._adapter_class())
+
+
+class MemoryResponse(object):
+    """
+    A response made up in memory, with the parts of a requests.Response that the client uses.  The body is
+    data as JSON, or the text given as is.
+    """
+    def __init__(self, status_code=200, data=None, reason=None, text=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = reason or ("OK" if self.ok else "Error")
+        if text is None:
+            text = json.dumps(data) if data is not None else ""
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def paged_data(values, params=None, page_size=25):
+    "One page of values, as Stash would page them for the given query parameters."
+    params = params or {}
+    start = int(params.get('start') or 0)
+    limit = int(params.get('limit') or page_size)
+    page = values[start:start + limit]
+    data = {'values': page, 'size': len(page), 'limit': limit, 'start': start,
+            'isLastPage': start + limit >= len(values)}
+    if not data['isLastPage']:
+        data['nextPageStart'] = start + limit
+    return data
+
+
+class MemoryTransport(Transport):
+    """
+    Answer requests from routes registered with route(), without any network: for tests and benchmarks.
+    Every request is recorded in self.requests as a (method, path, params, data) tuple, path being the
+    part of the URL below the REST API root (e.g. "projects/PRJ/repos").  Requests that match no route
+    get a 404.
+    """
+    def __init__(self):
+        self._routes = []
+        self._lock = threading.Lock()
+        self.requests = []
+
+    def route(self, method, path_pattern, response):
+        """
+        Answer requests with this method (or any method, if it is None), whose paths match the regular
+        expression path_pattern in full.  response is either a MemoryResponse, or a function called with
+        the regular expression match, the query parameters and the request body, which returns one.
+        """
+        self._routes.append((method and method.lower(), re.compile(path_pattern + "$"), response))
+
+    def route_listing(self, path_pattern, values, page_size=25):
+        "Answer GETs of a path with the given values, paged like Stash pages them."
+        self.route('get', path_pattern,
+                   lambda match, params, data: MemoryResponse(200, paged_data(values, params, page_size)))
+
+    def send(self, method, url, auth=None, data=None, params=None, timeout=None):
+        path = url.split('/rest/api/', 1)[-1].split('/', 1)[-1]
+        with self._lock:
+            # a copy, since callers may reuse the dict (iter_paged does, for the next page)
+            self.requests.append((method.lower(), path, None if params is None else dict(params), data))
+        for route_method, pattern, response in self._routes:
+            match = pattern.match(path)
+            if match and route_method in (None, method.lower()):
+                return response(match, params, data) if callable(response) else response
+        return MemoryResponse(404, {'errors': [{'message': "No route for %s %s" % (method.upper(), path)}]},
+                              reason="Not Found")
+
+
+_TRANSPORTS = {
+    "requests": RequestsTransport,
+    "session": SessionTransport,
+    "http2": Http2Transport,
+}
+
+
+def create_transport(name=DEFAULT_TRANSPORT, max_connections=None):
+    "Create a network transport by name (see above; memory transports are made directly, for tests)."
+    try:
+        transport_class = _TRANSPORTS[name]
+    except KeyError:
+        from .rest import UserError
+        raise UserError("Unknown transport '%s'; expected one of %s" % (name, ", ".join(sorted(_TRANSPORTS))))
+    if transport_class is RequestsTransport:
+        return transport_class()
+    return transport_class(max_connections)
@@ -0,0 +1,147 @@
+"""
+Long-running watch over pull requests: poll with a single client, report only what changed between
+polls, and adapt the polling interval to how busy the watched repositories are.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import time
+
+from .rest import ResponseError, DeadlineExceeded
+
+NEW = "NEW"
+UPDATED = "UPDATED"
+CLOSED = "CLOSED"
+
+
+class AdaptiveInterval(object):
+    """
+    A polling interval that backs off geometrically (up to a maximum) while nothing changes, and
+    snaps back to the minimum as soon as there is activity.
+    """
+    def __init__(self, minimum=15.0, maximum=300.0, backoff=1.5):
+        if minimum <= 0 or maximum < minimum or backoff < 1:
+            raise ValueError("Interval needs 0 < minimum <= maximum and backoff >= 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.current = minimum
+
+    def quiet(self):
+        self.current = min(self.maximum, self.current * self.backoff)
+        return self.current
+
+    def active(self):
+        self.current = self.minimum
+        return self.current
+
+
+class PullRequestWatcher(object):
+    """
+    Track the pull requests of one repository, or of every repository in a project or user namespace,
+    and compute the differences between successive polls.
+
+    Pull requests are identified by (repository slug, id), and considered updated when their version
+    or update date changes; one that disappears from the listing (e.g. it was merged or declined while
+    watching OPEN pull requests) is reported as closed.  A repository whose pull requests can't be listed
+    in a poll keeps its pull requests as they were, until a later poll can list them.  A poll in which any
+    listing is cut short by the deadline (see scheduler.request_context) fails, changing nothing, since
+    pull requests missing from a partial listing may well still be open.
+    """
+    def __init__(self, client, user=None, project=None, repository=None, state=None, workers=None):
+        self._client = client
+        self._user = user
+        self._project = project
+        self._repository = repository
+        self._state = state
+        self._workers = workers
+        self._known = None
+        # slugs of repositories that no poll has listed yet, and so have no known pull requests to compare to
+        self._unlisted = set()
+
+    def _fetch(self):
+        """
+        The current (repository slug, pull request) pairs, and the set of slugs of the repositories whose
+        pull requests couldn't be listed.
+        """
+        if self._repository is not None:
+            pr_list = self._client.list_pull_requests(user=self._user, project=self._project,
+                                                      repository=self._repository, state=self._state)
+            return [(self._repository, pull_req) for pull_req in pr_list.entities], set()
+        kwargs = {'workers': self._workers} if self._workers else {}
+        skipped = []
+        pairs = [(repo.slug, pull_req) for repo, pull_req in self._client.list_all_pull_requests(
+            user=self._user, project=self._project, state=self._state, skipped=skipped, **kwargs)]
+        return pairs, set(repo.slug for repo in skipped)
+
+    def poll(self):
+        """
+        Fetch the current pull requests, and return a list of (change, repository slug, pull request)
+        tuples describing what changed since the last poll.  The first poll only records a baseline,
+        and returns an empty list.  Raises DeadlineExceeded if the deadline cut a listing short.
+        """
+        partial_listings = self._client.partial_listings
+        pairs, failed = self._fetch()
+        if self._client.partial_listings != partial_listings:
+            raise DeadlineExceeded("Pull request listings were cut short by the deadline")
+        current = dict(((repo_slug, pull_req.id), pull_req) for repo_slug, pull_req in pairs)
+        previous, self._known = self._known, current
+        if previous is None:
+            self._unlisted = failed
+            return []
+        # a repository that couldn't be listed is no evidence that its pull requests closed: carry them over
+        for key, pull_req in previous.iteritems():
+            if key[0] in failed:
+                current[key] = pull_req
+        # and one listed for the first time is only a baseline, like the first poll
+        baselined, self._unlisted = self._unlisted - failed, self._unlisted & failed
+        changes = []
+        for key, pull_req in current.iteritems():
+            old = previous.get(key)
+            if old is None:
+                if key[0] not in baselined:
+                    changes.append((NEW, key[0], pull_req))
+            elif (old._get("version"), old.updated) != (pull_req._get("version"), pull_req.updated):
+                changes.append((UPDATED, key[0], pull_req))
+        for key, pull_req in previous.iteritems():
+            if key not in current:
+                changes.append((CLOSED, key[0], pull_req))
+        return changes
+
+    @property
+    def known_count(self):
+        return len(self._known or {})
+
+    def watch(self, interval, report, max_polls=None, sleep=time.sleep):
+        """
+        Wait for the current interval and poll, until interrupted (or for max_polls polls), passing each
+        non-empty list of changes to the report callable.  Failed polls are logged and treated as quiet,
+        so the interval also backs off while the server is unhappy.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            logging.debug("Next poll in %.1f seconds", interval.current)
+            sleep(interval.current)
+            polls += 1
+            try:
+                changes = self.poll()
+            except (ResponseError, IOError, DeadlineExceeded) as fail:
+                logging.warning("Poll failed, will retry: %s", str(fail))
+                changes = None
+            if changes:
+                report(changes)
+                interval.active()
+            else:
+                interval.quiet()
@@ -0,0 +1,243 @@
+"""
+An embedded HTTP receiver for Stash webhook events, which keeps a local store of pull requests and
+repositories up to date so that readers can consult the store instead of polling the REST API.
+
+Incoming events are parsed, queued on a bounded queue (bursts beyond its capacity are refused with a
+503, which Stash will report as a failed delivery), and applied to the store by a single writer thread
+in batches, so that a burst of events costs one store write rather than one per event.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import urllib2
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Queue import Queue, Empty, Full
+from SocketServer import ThreadingMixIn
+
+from .jsonfile import load_object, save_object
+from .models import StashWebhookEvent, StashPullRequest, StashRepo
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+_SIGNATURE_HEADER = "X-Hub-Signature"
+
+
+def _repo_key(repo):
+    return (repo.project.key, repo.slug)
+
+
+class PullRequestStore(object):
+    """
+    Pull requests and repositories as last reported by webhook events, optionally persisted to a JSON
+    file.  Writes are applied in batches; each batch is persisted (if there is a file) with one atomic
+    rename, so readers of the file never see a partial write.
+    """
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._pull_requests = {}
+        self._repositories = {}
+        self.batches_written = 0
+        stored = load_object(path)
+        for pr_data in stored.get("pull_requests", []):
+            pull_req = StashPullRequest(pr_data)
+            self._pull_requests[self._pull_request_key(pull_req)] = pr_data
+        for repo_data in stored.get("repositories", []):
+            self._repositories[_repo_key(StashRepo(repo_data))] = repo_data
+
+    @staticmethod
+    def _pull_request_key(pull_req):
+        return _repo_key(pull_req.destination.repository) + (pull_req.id,)
+
+    def apply(self, events):
+        """
+        Apply a batch of StashWebhookEvent objects, in order, and persist the result once.
+        """
+        with self._lock:
+            for event in events:
+                if event.pull_request is not None:
+                    key = self._pull_request_key(event.pull_request)
+                    if event.is_deletion():
+                        self._pull_requests.pop(key, None)
+                    else:
+                        self._pull_requests[key] = event.pull_request._response_data
+                elif event.repository is not None:
+                    key = _repo_key(event.repository)
+                    if event.is_deletion():
+                        self._repositories.pop(key, None)
+                    else:
+                        self._repositories[key] = event.repository._response_data
+            if self._path:
+                self._save()
+            self.batches_written += 1
+
+    def _save(self):
+        save_object(self._path, {"pull_requests": self._pull_requests.values(),
+                                 "repositories": self._repositories.values()})
+
+    def pull_requests(self, project=None, repository=None, state=None):
+        """
+        StashPullRequest objects from the store, filtered by project key, repository slug and/or state.
+        """
+        with self._lock:
+            items = self._pull_requests.items()
+        return [StashPullRequest(pr_data) for (pr_project, pr_repo, _), pr_data in sorted(items)
+                if (project is None or pr_project == project) and
+                (repository is None or pr_repo == repository) and
+                (state is None or pr_data.get("state") == state)]
+
+    def repositories(self, project=None):
+        with self._lock:
+            items = self._repositories.items()
+        return [StashRepo(repo_data) for (repo_project, _), repo_data in sorted(items)
+                if project is None or repo_project == project]
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=C0103
+        body = self.rfile.read(int(self.headers.getheader("Content-Length") or 0))
+        if not self.server.receiver.signature_ok(body, self.headers.getheader(_SIGNATURE_HEADER)):
+            self.send_response(401)
+        else:
+            try:
+                event = StashWebhookEvent(json.loads(body))
+            except (ValueError, TypeError, AttributeError, KeyError) as exc:
+                logging.warning("Rejecting unparseable webhook payload: %s", str(exc))
+                self.send_response(400)
+            else:
+                self.send_response(202 if self.server.receiver.offer(event) else 503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        logging.debug("webhook %s: " + format, self.client_address[0], *args)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class WebhookReceiver(object):
+    """
+    HTTP server accepting Stash webhook POSTs on any path, and a writer thread applying them to a
+    PullRequestStore.  If a secret is configured, payloads must carry a matching HMAC-SHA256 signature.
+    """
+    def __init__(self, store, host="", port=0, secret=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.store = store
+        self._secret = secret
+        self._queue = Queue(queue_size)
+        self._batch_size = batch_size
+        self._server = _ThreadingHTTPServer((host, port), _WebhookHandler)
+        self._server.receiver = self
+        self._writer = threading.Thread(target=self._write_batches, name="webhook-writer")
+        self._writer.daemon = True
+        self._server_thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d/" % (host or "localhost", port)
+
+    def signature_ok(self, body, signature):
+        if not self._secret:
+            return True
+        expected = "sha256=" + hmac.new(self._secret, body, hashlib.sha256).hexdigest()
+        return signature is not None and hmac.compare_digest(expected, signature)
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except Full:
+            logging.warning("Webhook queue full, refusing %s event", event.event_key)
+            return False
+
+    def _write_batches(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except Empty:
+                continue
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                self.store.apply(batch)
+            except Exception:  # pylint: disable=W0703
+                logging.exception("Failed to apply a batch of %d webhook events", len(batch))
+            for _ in batch:
+                self._queue.task_done()
+
+    def start(self):
+        "Start serving in background threads."
+        self._writer.start()
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="webhook-server")
+        self._server_thread.daemon = True
+        self._server_thread.start()
+
+    def serve_forever(self):
+        "Serve in the current thread until interrupted."
+        self._writer.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stop()
+
+    def drain(self):
+        "Block until every accepted event has been applied to the store."
+        self._queue.join()
+
+    def stop(self):
+        "Stop serving (if started), then apply whatever is still queued before returning."
+        # shutdown() waits for a serve_forever loop to finish, so would never return if none was started
+        if self._server_thread is not None:
+            self._server.shutdown()
+            self._server_thread = None
+        self._server.server_close()
+        self._stopping.set()
+        if self._writer.is_alive():
+            self._writer.join()
+
+
+def load_recorded_payloads(path):
+    "Read recorded webhook payloads from a file with one JSON payload per line."
+    with open(path) as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def replay_payloads(url, payloads, secret=None):
+    """
+    POST recorded payloads to a webhook receiver, as Stash would, returning the response status codes.
+    """
+    statuses = []
+    for payload in payloads:
+        body = json.dumps(payload)
+        request = urllib2.Request(url, body, {"Content-Type": "application/json"})
+        if secret:
+            request.add_header(_SIGNATURE_HEADER,
+                               "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest())
+        try:
+            statuses.append(urllib2.urlopen(request).getcode())
+        except urllib2.HTTPError as fail:
+            statuses.append(fail.code)
+    return statuses
@@ -0,0 +1,124 @@
+"""
+Map a directory tree full of local clones to the Stash projects/users and repositories their remotes
+point at.
+"""
+## Copyright 2015 Amplify Education, Inc.
+
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+
+##     http://www.apache.org/licenses/LICENSE-2.0
+
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+import logging
+import os
+import threading
+
+from .concurrency import bounded_imap, DEFAULT_WORKERS
+from .jsonfile import load_object, save_object
+from .local_git import (find_git_dirs, read_git_config, parse_remote_url, _backtick,
+                        GitInspectionError)
+
+
+def find_clones(root):
+    """
+    Generate the paths of all git working trees under root (including root itself).  Clones are not
+    searched for further clones, so submodules and vendored repositories are not reported separately;
+    hidden directories are skipped.
+    """
+    for dirpath, dirnames, _ in os.walk(root):
+        if os.path.exists(os.path.join(dirpath, '.git')):
+            dirnames[:] = []
+            yield dirpath
+        else:
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+
+
+def _config_path(clone_path):
+    _, common_dir = find_git_dirs(clone_path)
+    return os.path.join(common_dir, 'config')
+
+
+def read_remotes(clone_path):
+    """
+    Return a dictionary of remote name to parsed remote URL (see local_git.parse_remote_url) for every
+    remote of a clone; remotes whose URLs do not look like Stash URLs map to None.
+    """
+    try:
+        urls = dict((name[len('remote.'):-len('.url')], url)
+                    for name, url in read_git_config(_config_path(clone_path)).iteritems()
+                    if name.startswith('remote.') and name.endswith('.url'))
+    except (GitInspectionError, EnvironmentError) as exc:
+        logging.debug("Falling back to git for remotes of %s: %s", clone_path, str(exc))
+        output = _backtick('git', 'config', '--get-regexp', r'^remote\..*\.url$', cwd=clone_path)
+        urls = {}
+        for line in output.splitlines():
+            name, _, url = line.partition(' ')
+            urls[name[len('remote.'):-len('.url')]] = url.strip()
+    return dict((remote, parse_remote_url(url)) for remote, url in urls.iteritems())
+
+
+class WorkspaceScanner(object):
+    """
+    Scan directory trees for clones and their remotes, remembering the result for each clone along
+    with the modification time of its git config, so that rescanning only re-reads the configs that
+    have changed.  If a cache path is given, the remembered results persist between runs.
+    """
+    def __init__(self, cache_path=None, workers=DEFAULT_WORKERS):
+        self._cache_path = cache_path
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._cache = load_object(cache_path)
+
+    def _scan_clone(self, clone_path):
+        try:
+            mtime = os.stat(_config_path(clone_path)).st_mtime
+        except (GitInspectionError, EnvironmentError):
+            mtime = None
+        with self._lock:
+            cached = self._cache.get(clone_path)
+        if cached is not None and mtime is not None and cached['mtime'] == mtime:
+            return clone_path, cached['remotes']
+        try:
+            remotes = read_remotes(clone_path)
+        except Exception as exc:  # pylint: disable=W0703
+            logging.warning("Could not read remotes of %s: %s", clone_path, str(exc))
+            remotes = {}
+        with self._lock:
+            self._cache[clone_path] = {'mtime': mtime, 'remotes': remotes}
+        return clone_path, remotes
+
+    def scan(self, root):
+        """
+        Return a dictionary of clone path to {remote name: parsed remote URL} for every clone under root,
+        reading the clones' configs concurrently.
+        """
+        root = os.path.abspath(os.path.expanduser(root))
+        mapping = dict(bounded_imap(self._scan_clone, find_clones(root), self._workers))
+        with self._lock:
+            # forget clones that have disappeared from under this root
+            for clone_path in self._cache.keys():
+                if clone_path not in mapping and clone_path.startswith(os.path.join(root, '')):
+                    del self._cache[clone_path]
+            if self._cache_path:
+                save_object(self._cache_path, self._cache)
+        return mapping
+
+
+def repositories_by_clone(mapping, remote=None):
+    """
+    Flatten a scan result into (clone path, remote name, project or "~user", repository) tuples,
+    optionally for a single remote name, skipping remotes that are not Stash URLs.
+    """
+    for clone_path in sorted(mapping):
+        for remote_name, info in sorted(mapping[clone_path].iteritems()):
+            if info is None or (remote is not None and remote_name != remote):
+                continue
+            owner = info['project'] or ("~%s" % info['user'] if info['user'] else "")
+            yield clone_path, remote_name, owner, info['repo']
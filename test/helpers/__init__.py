@@ -1,3 +1,63 @@
 """
 Helper functions for tests
 """
+from stashifier.breaker import CircuitBreaker
+from stashifier.rest import StashRestClient
+
+HOST = "stash.example.com"
+_EPOCH_MS = 1420070400000
+
+
+def user_data(name):
+    "A user, as Stash lists one."
+    return {'name': name, 'slug': name, 'id': abs(hash(name)) % 10000, 'displayName': name.capitalize(),
+            'emailAddress': "%s@example.com" % name, 'active': True, 'type': "NORMAL"}
+
+
+def repository_data(project, slug):
+    "A repository of a project, as Stash lists one."
+    return {'slug': slug, 'name': slug, 'id': abs(hash((project, slug))) % 10000, 'scmId': "git",
+            'project': {'key': project, 'name': project, 'id': abs(hash(project)) % 10000},
+            'links': {'clone': [{'name': "ssh",
+                                 'href': "ssh://git@%s:7999/%s/%s.git" % (HOST, project.lower(), slug)},
+                                {'name': "http",
+                                 'href': "https://%s/scm/%s/%s.git" % (HOST, project.lower(), slug)}]}}
+
+
+def pull_request_data(project, slug, pr_id, state="OPEN", version=0):
+    "A pull request between two branches of a repository, as Stash lists one."
+    repository = repository_data(project, slug)
+    return {'id': pr_id, 'version': version, 'title': "Change %d" % pr_id, 'state': state,
+            'createdDate': _EPOCH_MS, 'updatedDate': _EPOCH_MS + version * 1000,
+            'author': {'user': user_data("author"), 'approved': False},
+            'fromRef': {'id': "refs/heads/change-%d" % pr_id, 'displayId': "change-%d" % pr_id,
+                        'latestChangeSet': "%040x" % pr_id, 'repository': repository},
+            'toRef': {'id': "refs/heads/master", 'displayId': "master", 'latestChangeSet': "%040x" % 0,
+                      'repository': repository},
+            'reviewers': [{'user': user_data("reviewer"), 'approved': True}]}
+
+
+def commit_data(number):
+    "The numbered commit of a linear history (the first has none), as Stash lists one."
+    parents = [{'id': "%040x" % (number - 1), 'displayId': "%011x" % (number - 1)}] if number > 1 else []
+    return {'id': "%040x" % number, 'displayId': "%011x" % number, 'message': "Change %d\n\nDetails" % number,
+            'author': {'name': "author", 'emailAddress': "author@example.com"},
+            'authorTimestamp': _EPOCH_MS + number * 1000, 'parents': parents}
+
+
+def change_data(path, change_type="MODIFY", src_path=None):
+    "A file changed by a commit or pull request, as Stash lists one."
+    data = {'contentId': "%040x" % abs(hash(path)), 'type': change_type, 'nodeType': "FILE",
+            'path': {'toString': path, 'name': path.rsplit("/", 1)[-1]}}
+    if src_path:
+        data['srcPath'] = {'toString': src_path, 'name': src_path.rsplit("/", 1)[-1]}
+    return data
+
+
+def client_for(transport, **kwargs):
+    """
+    A client of HOST sending its requests through transport, with a circuit breaker of its own (rather
+    than the one shared by every client of HOST in the process).
+    """
+    return StashRestClient(HOST, "tester", "secret", transport=transport,
+                           circuit_breaker=CircuitBreaker(HOST), **kwargs)
@@ -0,0 +1,76 @@
+''' Tests of executing batch operations and reporting their results'''
+import json
+from StringIO import StringIO
+
+from stashifier.batch import execute_operation, run_batch
+from stashifier.transport import MemoryTransport, MemoryResponse
+
+from test.helpers import client_for, repository_data
+
+
+def _project_transport():
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", "thing")])
+    transport.route('post', r"projects/PRJ/repos",
+                    MemoryResponse(409, {'errors': [{'message': "Repository thing already exists"}]}))
+    return transport
+
+
+def _unreachable(match, params, data):
+    raise IOError("Connection refused")
+
+
+def test_successful_operation_echoes_its_id():
+    '''A successful operation's result has its op, id and the client's result'''
+    result = execute_operation(client_for(_project_transport()),
+                               {"op": "list_repositories", "project": "PRJ", "id": 7})
+    assert result == {"op": "list_repositories", "id": 7, "ok": True,
+                      "result": [repository_data("PRJ", "thing")]}
+
+
+def test_bad_operations_are_reported_not_raised():
+    '''Operations that aren't objects, have no known op, or have mistyped arguments fail without a request'''
+    transport = _project_transport()
+    client = client_for(transport)
+    for operation, error in [
+            ("not json", "An operation must be a JSON object"),
+            ({"op": "drop_tables"}, "Unknown operation 'drop_tables'"),
+            ({"op": "list_repositories", "project": "PRJ", "limit": "10"},
+             "'limit' must be an integer, not \"10\""),
+            ({"op": "list_commits", "project": "PRJ", "repository": "thing", "max_count": True},
+             "'max_count' must be an integer, not true"),
+            ({"op": "create_pull_request", "project": "PRJ", "repository": "thing", "source_branch": 5},
+             "'source_branch' must be a string, not 5"),
+            ({"op": "create_pull_request", "project": "PRJ", "repository": "thing", "source_branch": "x",
+              "reviewers": "someone"}, "'reviewers' must be a list of strings, not \"someone\""),
+            ({"op": "create_pull_request", "project": "PRJ", "repository": "thing", "pr_data": []},
+             "'pr_data' must be an object, not []")]:
+        result = execute_operation(client, operation)
+        assert result["ok"] is False
+        assert result["error"].startswith(error), result["error"]
+    assert transport.requests == []
+
+
+def test_failed_requests_are_reported_with_their_status():
+    '''An error response's status and messages are in the result, and no response at all is reported too'''
+    result = execute_operation(client_for(_project_transport()),
+                               {"op": "create_repository", "project": "PRJ", "repository": "thing"})
+    assert (result["ok"], result["status"], result["messages"]) == (
+        False, 409, ["Repository thing already exists"])
+
+    transport = MemoryTransport()
+    transport.route(None, r".*", _unreachable)
+    result = execute_operation(client_for(transport), {"op": "list_repositories", "project": "PRJ"})
+    assert result["ok"] is False
+    assert "Connection refused" in result["error"]
+
+
+def test_run_batch_counts_failures():
+    '''A batch writes a JSON result line per operation, skipping blanks and comments, and counts failures'''
+    lines = ['# set up', '{"op": "list_repositories", "project": "PRJ"}', '', '{"op": "list_repositories"',
+             '{"op": "create_repository", "project": "PRJ", "repository": "thing", "id": "again"}']
+    out = StringIO()
+    assert run_batch(client_for(_project_transport()), lines, out) == 2
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(result["ok"], result.get("id")) for result in results] == [(True, None), (False, None),
+                                                                        (False, "again")]
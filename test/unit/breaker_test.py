@@ -0,0 +1,101 @@
+''' Tests of the circuit breaker's states, on a clock of the tests' own'''
+from stashifier.breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _open_breaker(clock):
+    breaker = CircuitBreaker("stash.example.com", failure_threshold=3, failure_window=10,
+                             reset_timeout=30, clock=clock)
+    for _ in range(3):
+        assert breaker.before_request() is False
+        breaker.record_failure()
+    return breaker
+
+
+def _fails_fast(breaker):
+    try:
+        breaker.before_request()
+    except CircuitOpenError:
+        return True
+    return False
+
+
+def test_opens_after_threshold_failures_in_window():
+    '''Failures open the circuit only once there are failure_threshold of them within the window'''
+    clock = _Clock()
+    breaker = CircuitBreaker("stash.example.com", failure_threshold=3, failure_window=10, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now += 11
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast_until_reset_timeout():
+    '''An open circuit refuses requests, saying how long until it will let a probe through'''
+    clock = _Clock()
+    breaker = _open_breaker(clock)
+    clock.now += 20
+    try:
+        breaker.before_request()
+    except CircuitOpenError as exc:
+        assert exc.retry_after == 10
+    else:
+        assert False, "an open circuit should fail fast"
+
+
+def test_only_one_probe_at_a_time():
+    '''Once reset_timeout has passed, one request probes the server, and the rest still fail fast'''
+    clock = _Clock()
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    assert breaker.before_request() is True
+    assert breaker.state == HALF_OPEN
+    assert _fails_fast(breaker)
+
+
+def test_probe_success_closes():
+    '''A successful probe closes the circuit'''
+    clock = _Clock()
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.before_request() is False
+
+
+def test_probe_failure_reopens():
+    '''A failed probe opens the circuit for another reset_timeout'''
+    clock = _Clock()
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 29
+    assert _fails_fast(breaker)
+    clock.now += 1
+    assert breaker.before_request() is True
+
+
+def test_only_cancelling_the_probe_releases_it():
+    '''Cancelling another request leaves the probe outstanding; only cancelling the probe releases it'''
+    clock = _Clock()
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    probe = breaker.before_request()
+    breaker.cancel(False)
+    assert _fails_fast(breaker)
+    breaker.cancel(probe)
+    assert breaker.before_request() is True
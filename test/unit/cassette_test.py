@@ -0,0 +1,92 @@
+''' Tests of recording Stash traffic to a cassette, and replaying it'''
+import json
+import os
+import shutil
+import tempfile
+
+from stashifier.cassette import RecordingTransport, ReplayTransport
+from stashifier.rest import ResponseError
+from stashifier.transport import MemoryTransport, MemoryResponse
+
+from test.helpers import client_for, repository_data, pull_request_data
+
+
+def _record(path):
+    "Record a repository listing, a pull request listing and a failed request to a cassette at path."
+    memory = MemoryTransport()
+    memory.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", "repo-%d" % index)
+                                                 for index in range(30)], page_size=25)
+    memory.route_listing(r"projects/PRJ/repos/repo-0/pull-requests",
+                         [pull_request_data("PRJ", "repo-0", pr_id) for pr_id in (1, 2)])
+    memory.route('delete', r"projects/PRJ/repos/gone",
+                 MemoryResponse(404, {'errors': [{'message': "No such repository"}]}))
+    recorder = RecordingTransport(memory, path)
+    client = client_for(recorder)
+    repos = client.list_repositories(project="PRJ")
+    pull_requests = client.list_pull_requests(project="PRJ", repository="repo-0")
+    try:
+        client.delete_repository("gone", project="PRJ")
+    except ResponseError:
+        pass
+    recorder.close()
+    return repos, pull_requests
+
+
+def test_replay_gives_back_what_was_recorded():
+    '''Replaying a cassette yields the same listings and errors as the recorded run'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "listing.cassette")
+        repos, pull_requests = _record(path)
+        client = client_for(ReplayTransport(path))
+        replayed_repos = client.list_repositories(project="PRJ")
+        assert [repo.slug for repo in replayed_repos.entities] == [repo.slug for repo in repos.entities]
+        assert replayed_repos.page_count == 2
+        replayed_prs = client.list_pull_requests(project="PRJ", repository="repo-0")
+        assert [pull_req.id for pull_req in replayed_prs.entities] == [1, 2]
+        assert len(pull_requests.entities) == 2
+        try:
+            client.delete_repository("gone", project="PRJ")
+        except ResponseError as fail:
+            assert fail.response.status_code == 404
+            assert [error.message for error in fail.get_response_errors()] == ["No such repository"]
+        else:
+            assert False, "the recorded failure should have been replayed"
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_cassette_leaves_out_credentials_and_request_host():
+    '''Neither the password nor the server's hostname is written with the requests in the cassette'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "listing.cassette")
+        _record(path)
+        with open(path) as cassette:
+            text = cassette.read()
+        assert "secret" not in text
+        exchanges = [json.loads(line) for line in text.splitlines()]
+        assert len(exchanges) == 4
+        assert exchanges[0]['path'] == "/rest/api/1.0/projects/PRJ/repos"
+        for exchange in exchanges:
+            # the response texts are as the server sent them, with its links (e.g. clone URLs)
+            request = dict((key, exchange[key]) for key in ('method', 'path', 'params', 'body'))
+            assert "stash.example.com" not in json.dumps(request)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_unrecorded_requests_get_404():
+    '''A request that is not in the cassette is answered with a 404'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "listing.cassette")
+        _record(path)
+        try:
+            client_for(ReplayTransport(path)).list_repositories(project="OTHER")
+        except ResponseError as fail:
+            assert fail.response.status_code == 404
+        else:
+            assert False, "an unrecorded listing should have failed"
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,86 @@
+''' Tests of resolving and completing user names from the cached user directory'''
+import json
+import os
+import shutil
+import tempfile
+
+from stashifier.directory import UserDirectory
+from stashifier.rest import UserError
+from stashifier.transport import MemoryTransport
+
+from test.helpers import HOST, client_for, user_data
+
+_NAMES = ["alice", "alicia", "bob", "robert"]
+
+
+def _users_transport(names=_NAMES):
+    transport = MemoryTransport()
+    transport.route_listing(r"users", [user_data(name) for name in names])
+    return transport
+
+
+def _user_fetches(transport):
+    return len([path for _, path, _, _ in transport.requests if path == "users"])
+
+
+def _resolve_error(directory, name):
+    try:
+        directory.resolve(name)
+    except UserError as oops:
+        return str(oops)
+    assert False, "'%s' should not have resolved" % name
+
+
+def test_resolve():
+    '''Names resolve exactly, by email or display name, by unambiguous prefix, or by close misspelling'''
+    directory = UserDirectory(client_for(_users_transport()))
+    assert directory.resolve("bob") == "bob"
+    assert directory.resolve("Robert") == "robert"
+    assert directory.resolve("bob@example.com") == "bob"
+    assert directory.resolve("rob") == "robert"
+    assert directory.resolve("alicee") == "alice"
+    assert "could be any of alice, alicia" in _resolve_error(directory, "ali")
+    assert "No Stash user matches 'zed'" in _resolve_error(directory, "zed")
+
+
+def test_complete():
+    '''Completion matches prefixes of names, email addresses and display names, ignoring case'''
+    directory = UserDirectory(client_for(_users_transport()))
+    assert directory.complete("AL") == ["alice", "alicia"]
+    assert directory.complete("rob") == ["robert"]
+    assert directory.complete("x") == []
+
+
+def test_cache_is_used_until_a_name_is_missing():
+    '''A fresh cache answers without a fetch, but a name it lacks makes the directory fetch again'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "users.json")
+        first = _users_transport(["alice"])
+        assert UserDirectory(client_for(first), path).resolve("alice") == "alice"
+        assert _user_fetches(first) == 1
+
+        cached = _users_transport(["alice", "bob"])
+        directory = UserDirectory(client_for(cached), path)
+        assert directory.complete("a") == ["alice"]
+        assert directory.resolve("alice") == "alice"
+        assert _user_fetches(cached) == 0
+        assert directory.resolve("bob") == "bob"
+        assert _user_fetches(cached) == 1
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_malformed_cache_entry_is_a_miss():
+    '''A cache entry that isn't as the directory writes it is ignored, and the directory fetched afresh'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "users.json")
+        for entry in ({'users': [{'name': "alice"}]}, {'fetched': 0, 'users': ["alice"]}, ["alice"]):
+            with open(path, 'w') as handle:
+                json.dump({HOST: entry}, handle)
+            transport = _users_transport()
+            assert UserDirectory(client_for(transport), path).complete("bo") == ["bob"]
+            assert _user_fetches(transport) == 1
+    finally:
+        shutil.rmtree(workdir)
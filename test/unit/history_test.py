@@ -0,0 +1,84 @@
+''' Tests of listing the commits and changed files of repositories and pull requests'''
+from stashifier.rest import UserError
+from stashifier.transport import MemoryTransport
+
+from test.helpers import client_for, commit_data, change_data
+
+_HISTORY = [commit_data(number) for number in range(250, 0, -1)]
+
+
+def _history_transport():
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos/thing/commits", _HISTORY)
+    transport.route_listing(r"projects/PRJ/repos/thing/pull-requests/7/commits", _HISTORY[:3])
+    transport.route_listing(r"projects/PRJ/repos/thing/commits/(\w+)/changes",
+                            [change_data("src/main.py"), change_data("docs/new.md", "ADD"),
+                             change_data("src/util.py", "MOVE", src_path="src/helpers.py")], page_size=2)
+    transport.route_listing(r"projects/PRJ/repos/thing/pull-requests/7/changes", [change_data("README")])
+    return transport
+
+
+def _fetched(transport, path):
+    return [params for _, fetched, params, _ in transport.requests if fetched == path]
+
+
+def test_iter_commits_fetches_only_the_pages_it_needs():
+    '''Commits come newest first, in pages no bigger than max_count, and stop at max_count'''
+    transport = _history_transport()
+    client = client_for(transport)
+    commits = list(client.iter_commits(project="PRJ", repository="thing", max_count=5))
+    assert [commit.id for commit in commits] == [data['id'] for data in _HISTORY[:5]]
+    assert commits[0].summary == "Change 250"
+    assert commits[0].parents == ["%040x" % 249]
+    assert [params.get('limit') for params in _fetched(transport, "projects/PRJ/repos/thing/commits")] == [5]
+
+    transport = _history_transport()
+    commits = client_for(transport).iter_commits(project="PRJ", repository="thing", max_count=150,
+                                                 since="abc", path="src")
+    assert len(list(commits)) == 150
+    fetched = _fetched(transport, "projects/PRJ/repos/thing/commits")
+    assert [(params['limit'], params.get('start')) for params in fetched] == [(100, None), (100, 100)]
+    assert all((params['since'], params['path']) == ("abc", "src") for params in fetched)
+
+
+def test_iter_commits_stopped_early():
+    '''A caller that stops partway fetches no more pages'''
+    transport = _history_transport()
+    for number, commit in enumerate(client_for(transport).iter_commits(project="PRJ", repository="thing")):
+        if number == 30:
+            break
+    assert len(_fetched(transport, "projects/PRJ/repos/thing/commits")) == 2
+    assert commit.id == _HISTORY[30]['id']
+
+
+def test_commits_of_a_pull_request():
+    '''A pull request's commits are listed from it, and can't be bounded like a branch's'''
+    client = client_for(_history_transport())
+    commits = client.list_commits(project="PRJ", repository="thing", pull_request=7)
+    assert [commit.id for commit in commits.entities] == [data['id'] for data in _HISTORY[:3]]
+    try:
+        client.list_commits(project="PRJ", repository="thing", pull_request=7, since="abc")
+    except UserError:
+        pass
+    else:
+        assert False, "a pull request's commits should not be bounded by since"
+
+
+def test_changes_of_a_commit_or_pull_request():
+    '''The files changed by a commit are listed across pages, with moves' source paths'''
+    client = client_for(_history_transport())
+    pages = list(client.iter_change_pages(project="PRJ", repository="thing", commit=_HISTORY[0]['id']))
+    assert len(pages) == 2
+    changes = [change for page in pages for change in page.entities]
+    assert [(change.change_type, change.path, change.src_path) for change in changes] == [
+        ("MODIFY", "src/main.py", None), ("ADD", "docs/new.md", None),
+        ("MOVE", "src/util.py", "src/helpers.py")]
+    changes = client.list_changes(project="PRJ", repository="thing", pull_request=7, fields=["path.toString"])
+    assert changes.values == [("README",)]
+    for kwargs in ({}, {'commit': "abc", 'pull_request': 7}):
+        try:
+            client.list_changes(project="PRJ", repository="thing", **kwargs)
+        except UserError:
+            pass
+        else:
+            assert False, "a change list needs either a commit or a pull request"
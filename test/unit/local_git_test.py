@@ -0,0 +1,106 @@
+''' Tests of reading local git repositories without running git'''
+import os
+import shutil
+import subprocess
+import tempfile
+
+from stashifier.local_git import (find_git_dirs, read_git_config, get_current_branch, get_remote_url,
+                                  GitInspectionError)
+
+_CONFIG = r'''
+# a comment
+[core]
+    bare = false
+    ; another comment
+[remote "origin"]
+    url = ssh://git@stash.example.com:7999/prj/thing.git
+    fetch = +refs/heads/*:refs/remotes/origin/*
+[Branch "Feature/Mixed"]
+    Remote = origin
+[user]
+    name = "  Some One  " # quoted whitespace stays, the comment goes
+    email = "some ; one"@example.com ; a quoted comment character is kept
+    motto = tab\there \"quoted\" back\\slash
+    unquoted =   padded value
+[weird "sub\"section"] flag
+'''
+
+
+def _git(*args, **kwargs):
+    return subprocess.check_output(('git', '-c', 'user.name=Tester', '-c', 'user.email=tester@example.com') +
+                                   args, cwd=kwargs.get('cwd'), stderr=subprocess.STDOUT).rstrip('\n')
+
+
+def _write(path, text):
+    with open(path, 'w') as handle:
+        handle.write(text)
+
+
+def test_read_git_config():
+    '''Sections and keys are lower-cased but subsections not; values lose comments, quotes and escapes'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "config")
+        _write(path, _CONFIG)
+        values = read_git_config(path)
+        assert values["core.bare"] == "false"
+        assert values["remote.origin.url"] == "ssh://git@stash.example.com:7999/prj/thing.git"
+        assert values["branch.Feature/Mixed.remote"] == "origin"
+        assert values["user.name"] == "  Some One  "
+        assert values["user.email"] == "some ; one@example.com"
+        assert values["user.motto"] == 'tab\there "quoted" back\\slash'
+        assert values["user.unquoted"] == "padded value"
+        # a key with no value, even on the section header's line, is true
+        assert values['weird.sub"section.flag'] == "true"
+        # and git agrees, though it prints nothing for an implicit true
+        for name, value in values.items():
+            assert _git('config', '--file', path, '--get', name) == ("" if value == "true" else value)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_read_git_config_refuses_includes():
+    '''Config files with includes are left to git'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "config")
+        _write(path, '[include]\n    path = other\n')
+        try:
+            read_git_config(path)
+        except GitInspectionError:
+            pass
+        else:
+            assert False, "an include should not have been read"
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_find_git_dirs_of_clone_and_worktree():
+    '''A clone's git directory is its .git; a linked worktree has its own, but shares the common one'''
+    workdir = tempfile.mkdtemp()
+    try:
+        clone = os.path.realpath(os.path.join(workdir, "clone"))
+        _git('init', '--quiet', clone)
+        _git('remote', 'add', 'origin', "ssh://git@stash.example.com:7999/prj/thing.git", cwd=clone)
+        _git('commit', '--quiet', '--allow-empty', '-m', "First", cwd=clone)
+        nested = os.path.join(clone, "some", "dir")
+        os.makedirs(nested)
+        assert find_git_dirs(nested) == (os.path.join(clone, ".git"), os.path.join(clone, ".git"))
+
+        worktree = os.path.realpath(os.path.join(workdir, "worktree"))
+        _git('worktree', 'add', '--quiet', '-b', "side", worktree, cwd=clone)
+        git_dir, common_dir = find_git_dirs(worktree)
+        assert common_dir == os.path.join(clone, ".git")
+        assert git_dir == os.path.realpath(_git('rev-parse', '--git-dir', cwd=worktree))
+        assert get_current_branch(worktree) == "side"
+        assert get_current_branch(clone) == _git('rev-parse', '--abbrev-ref', 'HEAD', cwd=clone)
+        assert get_remote_url(path=worktree) == "ssh://git@stash.example.com:7999/prj/thing.git"
+
+        try:
+            find_git_dirs(workdir)
+        except GitInspectionError:
+            pass
+        else:
+            assert False, "a directory outside any clone has no git directory"
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,42 @@
+''' Tests of mirroring a repository, against local bare repositories'''
+import os
+import shutil
+import subprocess
+import tempfile
+
+from stashifier.mirror import mirror_repository, remote_refs, CLONED, FETCHED, UNCHANGED
+
+
+def _git(*args, **kwargs):
+    subprocess.check_output(('git', '-c', 'user.name=Tester', '-c', 'user.email=tester@example.com') + args,
+                            cwd=kwargs.get('cwd'), stderr=subprocess.STDOUT)
+
+
+def _commit(work_path, name):
+    with open(os.path.join(work_path, name), 'w') as handle:
+        handle.write(name)
+    _git('add', name, cwd=work_path)
+    _git('commit', '--quiet', '-m', "Add %s" % name, cwd=work_path)
+    _git('push', '--quiet', 'origin', 'HEAD:refs/heads/master', cwd=work_path)
+
+
+def test_mirror_clones_then_fetches_only_changes():
+    '''A new mirror is cloned, and afterwards only fetched when the remote's refs have moved'''
+    workdir = tempfile.mkdtemp()
+    try:
+        origin_path = os.path.join(workdir, "origin.git")
+        work_path = os.path.join(workdir, "work")
+        mirror_path = os.path.join(workdir, "mirror.git")
+        url = "file://" + origin_path
+        _git('init', '--quiet', '--bare', origin_path)
+        _git('clone', '--quiet', url, work_path)
+        _commit(work_path, "first")
+
+        assert mirror_repository(url, mirror_path) == CLONED
+        assert mirror_repository(url, mirror_path) == UNCHANGED
+        _commit(work_path, "second")
+        assert mirror_repository(url, mirror_path) == FETCHED
+        assert mirror_repository(url, mirror_path) == UNCHANGED
+        assert remote_refs(url) == remote_refs("file://" + mirror_path)
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,34 @@
+''' Tests of projecting entity JSON onto records of just the fields wanted'''
+from stashifier.models import Projection
+from stashifier.transport import MemoryTransport
+
+from test.helpers import client_for, pull_request_data, repository_data
+
+
+def test_dotted_and_missing_fields():
+    '''Dotted fields reach into nested objects, and fields missing at any depth come out as None'''
+    projection = Projection(["id", "fromRef.displayId", "fromRef.repository.project.key", "closedDate",
+                             "title.length"])
+    record = projection.extract(pull_request_data("PRJ", "thing", 7))
+    assert record == (7, "change-7", "PRJ", None, None)
+    assert record.fromRef_displayId == "change-7"
+    assert record.fromRef_repository_project_key == "PRJ"
+    assert record.closedDate is None
+
+
+def test_fields_that_make_no_attribute_name():
+    '''Fields that can't be attribute names are renamed positionally, but keep their names in as_dict'''
+    projection = Projection(["from", "slug", "slug"])
+    record = projection.extract({'from': "here", 'slug': "thing"})
+    assert (record._0, record.slug, record._2) == ("here", "thing", "thing")
+    assert projection.as_dict(record).items() == [("from", "here"), ("slug", "thing")]
+
+
+def test_listing_with_fields():
+    '''A listing with fields holds just those fields' records, in the order listed, across pages'''
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", slug) for slug in ("a", "b", "c")],
+                            page_size=2)
+    listing = client_for(transport).list_repositories(project="PRJ", fields=["slug", "project.key"])
+    assert [tuple(record) for record in listing.values] == [("a", "PRJ"), ("b", "PRJ"), ("c", "PRJ")]
+    assert [record.slug for record in listing.entities] == ["a", "b", "c"]
@@ -0,0 +1,65 @@
+''' Tests of listing, auditing and reconciling permissions'''
+from stashifier.permissions import (diff_permissions, plan_changes, apply_changes, PermissionChange,
+                                    GRANT, REVOKE)
+from stashifier.transport import MemoryTransport, MemoryResponse, paged_data
+
+from test.helpers import client_for, repository_data, user_data
+
+
+def _grants(permissions):
+    '''A route answering with a listing of (user name, permission) grants'''
+    return lambda match, params, data: MemoryResponse(200, paged_data(
+        [{'user': user_data(name), 'permission': permission} for name, permission in permissions], params))
+
+
+def test_audit_skips_projects_whose_repositories_cannot_be_listed():
+    '''A project whose repositories can't be listed is audited without them, and the others in full'''
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", "thing")])
+    transport.route('get', r"projects/(PRJ|GONE)(/repos/\w+)?/permissions/users",
+                    _grants([("someone", "PROJECT_READ")]))
+    transport.route('get', r"projects/(PRJ|GONE)(/repos/\w+)?/permissions/groups", _grants([]))
+    audit = client_for(transport).audit_permissions([("PRJ", None), ("GONE", None)],
+                                                    include_repositories=True)
+    assert sorted((project, repository, grant.name) for project, repository, grant in audit) == [
+        ("GONE", None, "someone"), ("PRJ", None, "someone"), ("PRJ", "thing", "someone")]
+
+
+def test_diff_permissions():
+    '''Grantees lacking their desired permission get it; only with prune do the others lose theirs'''
+    desired = {"alice": "PROJECT_WRITE", "bob": "PROJECT_READ", "carol": "PROJECT_ADMIN"}
+    current = {"alice": "PROJECT_WRITE", "bob": "PROJECT_ADMIN", "dave": "PROJECT_READ"}
+    changes = [(GRANT, "bob", "PROJECT_READ"), (GRANT, "carol", "PROJECT_ADMIN")]
+    assert diff_permissions(desired, current) == changes
+    assert diff_permissions(desired, current, prune=True) == changes + [(REVOKE, "dave", None)]
+    assert diff_permissions(desired, desired, prune=True) == []
+
+
+def test_plan_changes_lists_only_the_grantee_types_in_the_policy():
+    '''Planning lists each target's users and/or groups as the policy has them, and prunes only those'''
+    transport = MemoryTransport()
+    transport.route('get', r"projects/PRJ/permissions/users",
+                    _grants([("someone", "PROJECT_READ"), ("extra", "PROJECT_ADMIN")]))
+    transport.route('get', r"projects/PRJ/repos/thing/permissions/users",
+                    _grants([("contractor", "REPO_READ")]))
+    policy = {("PRJ", None): {"users": {"someone": "PROJECT_WRITE"}},
+              ("PRJ", "thing"): {"users": {"contractor": "REPO_READ"}}}
+    assert plan_changes(client_for(transport), policy, prune=True) == [
+        PermissionChange(REVOKE, "PRJ", None, "users", "extra", None, "PROJECT_ADMIN"),
+        PermissionChange(GRANT, "PRJ", None, "users", "someone", "PROJECT_WRITE", "PROJECT_READ")]
+    assert sorted(path for _, path, _, _ in transport.requests) == [
+        "projects/PRJ/permissions/users", "projects/PRJ/repos/thing/permissions/users"]
+
+
+def test_apply_changes_reports_each_failure_and_carries_on():
+    '''A change the server refuses is reported with the server's messages, and the others still made'''
+    transport = MemoryTransport()
+    transport.route('put', r"projects/PRJ/permissions/users", MemoryResponse(204))
+    transport.route('delete', r"projects/PRJ/permissions/users",
+                    MemoryResponse(409, {'errors': [{'message': "Can't revoke your own permission"}]}))
+    changes = [PermissionChange(REVOKE, "PRJ", None, "users", "tester", None, "PROJECT_ADMIN"),
+               PermissionChange(GRANT, "PRJ", None, "users", "someone", "PROJECT_WRITE", None)]
+    results = dict(apply_changes(client_for(transport), changes, rate=1000))
+    assert results == {changes[0]: "Can't revoke your own permission", changes[1]: None}
+    grant = {'name': "someone", 'permission': "PROJECT_WRITE"}
+    assert ("put", "projects/PRJ/permissions/users", grant, None) in transport.requests
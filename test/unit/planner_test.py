@@ -0,0 +1,65 @@
+''' Tests of dry-run request plans and the statistics they are estimated from'''
+import os
+import shutil
+import tempfile
+
+from stashifier.planner import RequestPlan, RequestStats, resource_key
+from stashifier.transport import MemoryTransport
+
+from test.helpers import HOST, client_for, repository_data
+
+_API = "https://%s/rest/api/1.0/" % HOST
+
+
+def test_resource_key_leaves_out_paging():
+    '''Listings are known by path and query, whatever page of them is asked for'''
+    assert resource_key(_API + "projects/PRJ/repos", {'start': 25, 'limit': 25}) == "projects/PRJ/repos"
+    key = resource_key(_API + "projects/PRJ/repos/thing/pull-requests",
+                       {'state': "OPEN", 'start': 0, 'at': None})
+    assert key == "projects/PRJ/repos/thing/pull-requests?state=OPEN"
+
+
+def test_report_estimates_calls_and_time():
+    '''A plan's report counts each listing's expected pages, and times them from the recorded requests'''
+    stats = RequestStats(None, HOST)
+    stats.record_request(0.25)
+    stats.record_request(0.75)
+    stats.record_listing("projects/PRJ/repos", 60, 3)
+    plan = RequestPlan(stats)
+    assert plan.report() == []
+    assert plan.add('get', _API + "projects/PRJ/repos", {'limit': 25}).json()['isLastPage'] is True
+    assert plan.add('post', _API + "projects/PRJ/repos", request_body='{"name": "thing"}').text == ""
+    plan.add('get', _API + "projects/PRJ/repos/thing/pull-requests")
+    assert plan.report(concurrency=2) == [
+        "Planned: GET projects/PRJ/repos (~3 pages)",
+        'Planned: POST projects/PRJ/repos with body {"name": "thing"}',
+        "Planned: GET projects/PRJ/repos/thing/pull-requests (unknown size)",
+        "Dry run: 3 requests planned (2 GET, 1 POST), estimated 5 HTTP calls in all",
+        "    1 of 2 listings have never been fetched for real, and are counted as one page each",
+        "    estimated time 2.5 s at 0.50 s per call, or about 1.5 s with 2 concurrent requests"]
+
+
+def test_dry_run_plans_from_an_earlier_real_run():
+    '''A real run records the repositories it lists, so a dry run later plans requests for each of them'''
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "stats.json")
+        transport = MemoryTransport()
+        slugs = ("a", "b", "c")
+        transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", slug) for slug in slugs],
+                                page_size=2)
+        stats = RequestStats(path, HOST)
+        assert client_for(transport, stats=stats).list_repositories(project="PRJ").values == [
+            repository_data("PRJ", slug) for slug in slugs]
+        stats.save()
+
+        dry_client = client_for(transport, dry_run=True, stats=RequestStats(path, HOST))
+        assert list(dry_client.list_all_pull_requests(project="PRJ")) == []
+        assert len(transport.requests) == 2
+        report = dry_client.plan.report()
+        assert report[0] == "Planned: GET projects/PRJ/repos (~1 page)"
+        assert sorted(report[1:4]) == [
+            "Planned: GET projects/PRJ/repos/%s/pull-requests (unknown size)" % slug for slug in slugs]
+        assert report[4] == "Dry run: 4 requests planned (4 GET), estimated 4 HTTP calls in all"
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,79 @@
+''' Tests of the order in which the request scheduler admits waiting requests'''
+import threading
+import time
+
+from stashifier.rest import DeadlineExceeded
+from stashifier.scheduler import (RequestScheduler, request_context, current_context,
+                                  INTERACTIVE, NORMAL, BACKGROUND)
+
+
+def _wait_for(condition):
+    limit = time.time() + 5
+    while not condition():
+        assert time.time() < limit, "the scheduler's waiting requests never reached the count expected"
+        time.sleep(0.001)
+
+
+def _admission_order(requests):
+    '''
+    The order in which a scheduler admitting one request at a time lets through (label, priority, caller)
+    requests, queued in the order given while another request holds the only slot
+    '''
+    scheduler = RequestScheduler(1)
+    scheduler.acquire()
+    admitted = []
+
+    def send(label, priority, caller):
+        scheduler.acquire(priority, caller)
+        admitted.append(label)
+        scheduler.release()
+
+    threads = []
+    for label, priority, caller in requests:
+        thread = threading.Thread(target=send, args=(label, priority, caller))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: scheduler.waiting == len(threads))
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    return admitted
+
+
+def test_more_urgent_priorities_go_first():
+    '''Interactive requests overtake normal ones, which overtake background ones, whenever they were queued'''
+    assert _admission_order([("sweep", BACKGROUND, "a"), ("list", NORMAL, "b"), ("ask", INTERACTIVE, "c"),
+                             ("sweep again", BACKGROUND, "a")]) == ["ask", "list", "sweep", "sweep again"]
+
+
+def test_callers_take_turns_within_a_priority():
+    '''A caller's queue of requests does not hold up another caller's request queued after them'''
+    bulk = [("bulk %d" % number, NORMAL, "bulk") for number in (1, 2, 3)]
+    assert _admission_order(bulk + [("single", NORMAL, "single")]) == ["bulk 1", "single", "bulk 2", "bulk 3"]
+
+
+def test_waiting_past_the_deadline():
+    '''A request still waiting for its turn at its deadline gives up, and leaves the queue'''
+    scheduler = RequestScheduler(1)
+    scheduler.acquire()
+    with request_context(deadline=time.time() + 0.05):
+        try:
+            scheduler.acquire()
+        except DeadlineExceeded:
+            pass
+        else:
+            assert False, "the request should have given up at its deadline"
+    assert scheduler.waiting == 0
+    scheduler.release()
+    scheduler.acquire()
+    scheduler.release()
+
+
+def test_request_context_is_restored():
+    '''A with block's priority and caller apply only within it, and nested blocks restore the outer ones'''
+    default = current_context()
+    with request_context(priority=BACKGROUND, caller="outer"):
+        with request_context(priority=INTERACTIVE):
+            assert current_context() == (INTERACTIVE, "outer")
+        assert current_context() == (BACKGROUND, "outer")
+    assert current_context() == default == (NORMAL, threading.current_thread().ident)
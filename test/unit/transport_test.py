@@ -0,0 +1,106 @@
+''' Tests of the in-memory transport, and of the client paging through it'''
+import time
+
+from stashifier.rest import DeadlineExceeded, ResponseError
+from stashifier.scheduler import request_context
+from stashifier.transport import MemoryTransport, MemoryResponse, TransportTimeout, paged_data
+
+from test.helpers import client_for, repository_data
+
+
+def _listed_transport(count, page_size):
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", "repo-%d" % index)
+                                                    for index in range(count)], page_size)
+    return transport
+
+
+def test_paged_data():
+    '''A page holds the values from start, and says where the next page starts'''
+    page = paged_data(range(60), {'start': 25, 'limit': 25})
+    assert page['values'] == range(25, 50)
+    assert not page['isLastPage']
+    assert page['nextPageStart'] == 50
+    last = paged_data(range(60), {'start': 50})
+    assert last['values'] == range(50, 60)
+    assert last['isLastPage']
+    assert 'nextPageStart' not in last
+
+
+def test_list_pages_through_every_page():
+    '''A listing fetches every page, each from where the previous one ended'''
+    transport = _listed_transport(60, 25)
+    listing = client_for(transport).list_repositories(project="PRJ")
+    assert [repo.slug for repo in listing.entities] == ["repo-%d" % index for index in range(60)]
+    assert listing.page_count == 3
+    starts = [(method, path, (params or {}).get('start')) for method, path, params, _ in transport.requests]
+    assert starts == [('get', "projects/PRJ/repos", None), ('get', "projects/PRJ/repos", 25),
+                      ('get', "projects/PRJ/repos", 50)]
+
+
+def test_page_size_limit_is_sent():
+    '''A limit is sent as the page size, and determines the number of pages'''
+    transport = _listed_transport(10, 25)
+    listing = client_for(transport).list_repositories(project="PRJ", limit=4)
+    assert listing.entity_count == 10
+    assert listing.page_count == 3
+    assert set(params['limit'] for _, _, params, _ in transport.requests) == set([4])
+
+
+def test_stopping_early_fetches_no_more_pages():
+    '''A caller that stops iterating never pays for the remaining pages'''
+    transport = _listed_transport(60, 25)
+    pages = client_for(transport).iter_repository_pages(project="PRJ")
+    next(pages)
+    pages.close()
+    assert len(transport.requests) == 1
+
+
+def test_routes_match_methods_and_whole_paths():
+    '''Routes answer only their method and full path; anything else gets a 404'''
+    transport = MemoryTransport()
+    transport.route('delete', r"projects/PRJ/repos/(\w+)",
+                    lambda match, params, data: MemoryResponse(204, reason=match.group(1)))
+    client = client_for(transport)
+    assert client.delete_repository("thing", project="PRJ").reason == "thing"
+    try:
+        client.get(project="PRJ", repository="thing")
+    except ResponseError as fail:
+        assert fail.response.status_code == 404
+    else:
+        assert False, "an unrouted GET should have failed"
+
+
+def _timing_out_transport(delay=0):
+    def time_out(match, params, data):
+        time.sleep(delay)
+        raise TransportTimeout("timed out")
+    transport = MemoryTransport()
+    transport.route('get', r"projects/PRJ", time_out)
+    return transport
+
+
+def test_timeout_before_the_deadline_is_a_server_failure():
+    '''A request timing out before its deadline fails as itself, and counts against the server'''
+    client = client_for(_timing_out_transport())
+    with request_context(deadline=time.time() + 30):
+        try:
+            client.get(project="PRJ")
+        except TransportTimeout:
+            pass
+        else:
+            assert False, "the timeout should have been raised"
+    assert len(client._breaker._failures) == 1
+
+
+def test_timeout_at_the_deadline_is_the_deadline():
+    '''A request cut short by its deadline raises DeadlineExceeded, and doesn't count against the server'''
+    client = client_for(_timing_out_transport(delay=0.1))
+    with request_context(deadline=time.time() + 0.05):
+        try:
+            client.get(project="PRJ")
+        except DeadlineExceeded:
+            pass
+        else:
+            assert False, "the deadline should have been exceeded"
+    assert len(client._breaker._failures) == 0
@@ -0,0 +1,97 @@
+''' Tests of the pull request watcher's polls'''
+import time
+
+from stashifier.rest import DeadlineExceeded
+from stashifier.scheduler import request_context
+from stashifier.transport import MemoryTransport, MemoryResponse, paged_data
+from stashifier.watch import PullRequestWatcher, AdaptiveInterval, NEW, UPDATED, CLOSED
+
+from test.helpers import client_for, pull_request_data, repository_data
+
+
+def _watched_project(pull_requests):
+    '''
+    A transport listing repositories "thing" and "other" of PRJ, and the pull requests in the dict given
+    (as it is when they are listed), refusing to list those of a repository whose entry is None
+    '''
+    def list_pull_requests(match, params, data):
+        listed = pull_requests.get(match.group(1), [])
+        if listed is None:
+            return MemoryResponse(403, {'errors': [{'message': "Permission denied"}]})
+        return MemoryResponse(200, paged_data(listed, params))
+
+    transport = MemoryTransport()
+    transport.route_listing(r"projects/PRJ/repos", [repository_data("PRJ", "thing"),
+                                                    repository_data("PRJ", "other")])
+    transport.route('get', r"projects/PRJ/repos/(\w+)/pull-requests", list_pull_requests)
+    return transport
+
+
+def _changes(watcher):
+    return sorted((change, repo_slug, pull_req.id) for change, repo_slug, pull_req in watcher.poll())
+
+
+def test_poll_reports_new_updated_and_closed_pull_requests():
+    '''After a baseline poll, polls report pull requests that appeared, changed version, or disappeared'''
+    pull_requests = {"thing": [pull_request_data("PRJ", "thing", pr_id) for pr_id in (1, 2, 3)]}
+    watcher = PullRequestWatcher(client_for(_watched_project(pull_requests)), project="PRJ")
+    assert watcher.poll() == []
+    assert watcher.poll() == []
+    pull_requests["thing"] = [pull_request_data("PRJ", "thing", 1, version=1),
+                              pull_request_data("PRJ", "thing", 3)]
+    pull_requests["other"] = [pull_request_data("PRJ", "other", 1)]
+    assert _changes(watcher) == [(CLOSED, "thing", 2), (NEW, "other", 1), (UPDATED, "thing", 1)]
+    assert watcher.known_count == 3
+
+
+def test_repositories_that_cannot_be_listed_change_nothing():
+    '''
+    An unlistable repository's pull requests are carried over rather than closed, and one first listed
+    after the baseline poll is a baseline of its own, rather than all new
+    '''
+    pull_requests = {"thing": [pull_request_data("PRJ", "thing", 1)], "other": None}
+    watcher = PullRequestWatcher(client_for(_watched_project(pull_requests)), project="PRJ")
+    assert watcher.poll() == []
+    pull_requests["thing"], pull_requests["other"] = None, [pull_request_data("PRJ", "other", 1)]
+    assert watcher.poll() == []
+    assert watcher.known_count == 2
+    pull_requests["thing"], pull_requests["other"] = [], [pull_request_data("PRJ", "other", pr_id)
+                                                          for pr_id in (1, 2)]
+    assert _changes(watcher) == [(CLOSED, "thing", 1), (NEW, "other", 2)]
+
+
+def test_watch_backs_off_while_quiet():
+    '''The watch reports each poll's changes, and its interval grows while polls are quiet or failing'''
+    pull_requests = {"thing": [pull_request_data("PRJ", "thing", 1)]}
+    watcher = PullRequestWatcher(client_for(_watched_project(pull_requests)), repository="thing",
+                                 project="PRJ")
+    interval = AdaptiveInterval(minimum=10, maximum=30, backoff=2)
+    sleeps, reports = [], []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            pull_requests["thing"] = None
+        elif len(sleeps) == 4:
+            pull_requests["thing"] = [pull_request_data("PRJ", "thing", 1, version=1)]
+
+    watcher.watch(interval, reports.append, max_polls=5, sleep=sleep)
+    assert sleeps == [10, 20, 30, 30, 10]
+    assert [[(change, pull_req.id) for change, _, pull_req in changes] for changes in reports] == [
+        [(UPDATED, 1)]]
+
+
+def test_poll_cut_short_by_the_deadline_changes_nothing():
+    '''A poll whose listings the deadline cut short fails, rather than reporting every pull request closed'''
+    pull_requests = {"thing": [pull_request_data("PRJ", "thing", pr_id) for pr_id in (1, 2)]}
+    watcher = PullRequestWatcher(client_for(_watched_project(pull_requests)), project="PRJ")
+    assert watcher.poll() == []
+    with request_context(deadline=time.time() - 1):
+        try:
+            watcher.poll()
+        except DeadlineExceeded:
+            pass
+        else:
+            assert False, "a poll past the deadline should fail"
+    assert watcher.known_count == 2
+    assert watcher.poll() == []
@@ -0,0 +1,66 @@
+''' Tests of the webhook receiver and the pull request store it keeps'''
+import os
+import shutil
+import tempfile
+
+from stashifier.webhook import PullRequestStore, WebhookReceiver, replay_payloads
+
+from test.helpers import pull_request_data, repository_data
+
+
+def test_signature_check():
+    '''With a secret, only payloads signed with it are accepted; without one, any payload is'''
+    receiver = WebhookReceiver(PullRequestStore(), host="127.0.0.1", secret="s3cret")
+    unsigned = WebhookReceiver(PullRequestStore(), host="127.0.0.1")
+    try:
+        body = '{"eventKey": "pr:opened"}'
+        signature = "sha256=ff6aa6ee8c7ee7a7ec0e31e7d1e3ad1e41a8c5a0b4c1fd0bb0c0b0e8da5f7f4a"
+        assert not receiver.signature_ok(body, signature)
+        assert not receiver.signature_ok(body, None)
+        assert unsigned.signature_ok(body, None)
+    finally:
+        receiver.stop()
+        unsigned.stop()
+
+
+def test_replayed_payloads_update_the_store():
+    '''Signed events replayed to the receiver are applied to the store, and persisted; others are refused'''
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "store.json")
+    receiver = WebhookReceiver(PullRequestStore(path), host="127.0.0.1", secret="s3cret")
+    receiver.start()
+    try:
+        events = [{"eventKey": "pr:opened", "pullRequest": pull_request_data("PRJ", "thing", pr_id)}
+                  for pr_id in (1, 2, 3)]
+        events += [{"eventKey": "pr:merged", "pullRequest": pull_request_data("PRJ", "thing", 2, "MERGED")},
+                   {"eventKey": "pr:deleted", "pullRequest": pull_request_data("PRJ", "thing", 3)},
+                   {"eventKey": "repo:refs_changed", "repository": repository_data("PRJ", "thing")}]
+        assert replay_payloads(receiver.url, events, secret="s3cret") == [202] * len(events)
+        opened_elsewhere = {"eventKey": "pr:opened", "pullRequest": pull_request_data("PRJ", "thing", 4)}
+        assert replay_payloads(receiver.url, [opened_elsewhere], secret="wrong") == [401]
+        assert replay_payloads(receiver.url, [opened_elsewhere]) == [401]
+        assert replay_payloads(receiver.url, ["not an event"], secret="s3cret") == [400]
+        receiver.drain()
+
+        for store in (receiver.store, PullRequestStore(path)):
+            assert [(pull_req.id, pull_req.state) for pull_req in store.pull_requests()] == [
+                (1, "OPEN"), (2, "MERGED")]
+            assert [pull_req.id for pull_req in store.pull_requests(state="OPEN")] == [1]
+            assert [repo.slug for repo in store.repositories(project="PRJ")] == ["thing"]
+    finally:
+        receiver.stop()
+        shutil.rmtree(workdir)
+
+
+def test_corrupt_store_file_starts_empty():
+    '''A store file that isn't JSON is ignored (it is rebuilt from later events) rather than fatal'''
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "store.json")
+    try:
+        with open(path, "w") as handle:
+            handle.write('{"pull_requests": [')
+        store = PullRequestStore(path)
+        assert store.pull_requests() == []
+        assert store.repositories() == []
+    finally:
+        shutil.rmtree(workdir)